@@ -0,0 +1,87 @@
+"""单条更新的解析开销：逐处重复解析（旧流程） vs 一次解析的信封
+
+用法：python benchmarks/bench_envelope.py [流式编辑次数]
+
+旧流程按改动前的调用次数重现：handle_message 与日志各序列化一次 update，
+每次发送/编辑消息在元数据和日志中再各序列化一次；has_media 调用三次，
+@机器人与回复判断各扫描两次，get_message_text 处理一次实体。
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+for key in ('TELEGRAM_BOT_TOKEN', 'GOOGLE_API_KEY', 'SILICONFLOW_API_KEY', 'ZHIPU_API_KEY', 'OPENAI_API_KEY'):
+    os.environ.setdefault(key, 'benchmark')
+os.environ.setdefault('TELEGRAM_USER_ID', '1')
+
+from telegram import Bot, Update  # noqa: E402
+from utils import envelope as envelope_module  # noqa: E402
+from utils.envelope import BOT_USERNAME, media_kind, process_text_with_entities  # noqa: E402
+
+TEXT = f"@{BOT_USERNAME} 帮我看看这个链接 https://example.com/article 里 **重点** 是什么？" * 3
+UPDATE = {
+    'update_id': 1,
+    'message': {
+        'message_id': 20,
+        'date': 1700000000,
+        'chat': {'id': -1001, 'type': 'supergroup', 'title': 'group'},
+        'from': {'id': 42, 'is_bot': False, 'first_name': 'user', 'username': 'user'},
+        'text': TEXT,
+        'entities': [
+            {'type': 'mention', 'offset': 0, 'length': len(BOT_USERNAME) + 1},
+            {'type': 'url', 'offset': TEXT.index('https'), 'length': len('https://example.com/article')},
+            {'type': 'bold', 'offset': TEXT.index('**'), 'length': 6},
+        ],
+        'reply_to_message': {
+            'message_id': 19,
+            'date': 1699999990,
+            'chat': {'id': -1001, 'type': 'supergroup', 'title': 'group'},
+            'from': {'id': 7, 'is_bot': False, 'first_name': 'other'},
+            'caption': "图片说明" * 20,
+            'photo': [
+                {'file_id': f'p{size}', 'file_unique_id': f'u{size}', 'width': size, 'height': size}
+                for size in (90, 320, 800, 1280)
+            ],
+        },
+    },
+}
+
+
+def legacy(update: Update, edits: int) -> None:
+    message = update.effective_message
+    for _ in range(2 + 2 * edits):
+        update.to_dict()
+    for _ in range(2):
+        any(
+            entity.type == 'mention' and message.text[entity.offset:entity.offset + entity.length] == f'@{BOT_USERNAME}'
+            for entity in message.entities
+        )
+        reply = message.reply_to_message
+        bool(reply and reply.from_user and reply.from_user.username == BOT_USERNAME)
+    for _ in range(3):
+        media_kind(message)
+    process_text_with_entities(message.text, message.entities)
+
+
+def enveloped(update: Update, edits: int) -> None:
+    envelope_module._envelopes.clear()
+    env = envelope_module.envelope(update)
+    for _ in range(2 + 2 * edits):
+        env.serialized()
+
+
+def main() -> None:
+    edits = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    bot = Bot('123:benchmark')
+    runs = 2000
+    for name, func in (('legacy', legacy), ('envelope', enveloped)):
+        # 每轮使用新的 Update，避免对象内部缓存影响结果
+        updates = [Update.de_json(UPDATE, bot) for _ in range(runs)]
+        it = iter(updates)
+        seconds = timeit.timeit(lambda: func(next(it), edits), number=runs)
+        print(f"{name:<9} {seconds / runs * 1e6:8.1f} us/update ({edits} streamed edits)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""私聊多轮记忆的上下文组装耗时与内存占用
+
+用法：python benchmarks/bench_memory.py
+
+缓冲区已满（MEMORY_MAX_TURNS 轮）时测量 build_context 的单次耗时，
+并用 tracemalloc 估算 MEMORY_MAX_CHATS 个会话全部驻留时的内存。
+"""
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+for key in ('TELEGRAM_BOT_TOKEN', 'GOOGLE_API_KEY', 'SILICONFLOW_API_KEY', 'ZHIPU_API_KEY', 'OPENAI_API_KEY'):
+    os.environ.setdefault(key, 'benchmark')
+os.environ.setdefault('TELEGRAM_USER_ID', '1')
+
+from config.settings import MEMORY_MAX_CHATS, MEMORY_MAX_TURNS  # noqa: E402
+from utils.conversation_memory import ConversationMemory  # noqa: E402
+
+# 每轮文字各不相同，使内存统计包含文字本身
+TURN_TEXT = "这是一轮普通长度的对话内容，用于估算上下文组装的开销。" * 4
+
+
+class FakeDB:
+    async def get_recent_turns(self, chat_id, limit):
+        return [
+            {'message_id': index, 'text': f"{TURN_TEXT}{chat_id}-{index}", 'type': 'user_message' if index % 2 else 'bot_message'}
+            for index in range(limit)
+        ]
+
+
+async def main() -> None:
+    db = FakeDB()
+    memory = ConversationMemory()
+    memory.token_budget = lambda model=None: 10 ** 6  # 不触发后台压缩，只测组装
+
+    await memory.build_context(db, 1, "预热")
+    runs = 2000
+    start = time.perf_counter()
+    for _ in range(runs):
+        await memory.build_context(db, 1, "当前消息")
+    per_call = (time.perf_counter() - start) / runs * 1000
+    print(f"build_context: {per_call:.3f} ms/request with {MEMORY_MAX_TURNS} buffered turns")
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for chat_id in range(MEMORY_MAX_CHATS):
+        await memory.build_context(db, chat_id + 2, "当前消息")
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{MEMORY_MAX_CHATS} chats resident: {used / 1024 / 1024:.1f} MiB ({used / MEMORY_MAX_CHATS / 1024:.1f} KiB/chat)")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+"""流式输出渲染开销：每次更新全文转义（旧流程） vs 增量渲染
+
+用法：python benchmarks/bench_render.py
+
+每次追加 20 个字符，统计生成到 5k/10k/20k 字符的累计耗时。旧流程每次更新
+对累计全文执行 18 次 str.replace 并重新拼接 f-string，总成本随长度平方增长；
+增量渲染只转义新追加的部分。
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils.html_renderer import StreamingHTMLRenderer  # noqa: E402
+
+STEP = 20
+SAMPLE = "模型输出的 **重点** 内容，包含 `code` 和 <tag> & 符号。\n"
+_SPECIAL_CHARS = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
+
+
+def legacy_escape(text: str) -> str:
+    for char in _SPECIAL_CHARS:
+        text = text.replace(char, f'\\{char}')
+    return text
+
+
+def legacy(text: str) -> None:
+    for end in range(STEP, len(text) + STEP, STEP):
+        f"正在生成中：\n<blockquote expandable>\n{legacy_escape(text[:end])}\n</blockquote>"
+
+
+def incremental(text: str) -> None:
+    renderer = StreamingHTMLRenderer()
+    for end in range(STEP, len(text) + STEP, STEP):
+        renderer.feed(text[:end])
+        f"正在生成中：\n<blockquote expandable>\n{renderer.html()}\n</blockquote>"
+    renderer.html(final=True)
+
+
+def main() -> None:
+    for length in (5000, 10000, 20000):
+        text = (SAMPLE * (length // len(SAMPLE) + 1))[:length]
+        results = []
+        for func in (legacy, incremental):
+            start = time.perf_counter()
+            func(text)
+            results.append((time.perf_counter() - start) * 1000)
+        print(f"{length:>6} chars  legacy {results[0]:7.1f} ms  incremental {results[1]:6.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,14 +3,32 @@ from telegram import Update, BotCommand, BotCommandScope, BotCommandScopeAllPriv
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes, JobQueue, PollHandler
 from telegram.error import NetworkError, TimedOut
 import asyncio
-from config.settings import TELEGRAM_BOT_TOKEN, HTTP_PROXY, TELEGRAM_USER_ID
+import signal
+from config.settings import TELEGRAM_BOT_TOKEN, HTTP_PROXY, TELEGRAM_USER_ID, TELEGRAM_POOL_SIZE, UPDATE_CONCURRENCY, SHUTDOWN_DRAIN_TIMEOUT
+from config.settings import RESTART_MAX_ATTEMPTS, RESTART_DELAY, RESTART_RESET_AFTER
 from handlers.command import start_command, get_id_command, analyze_command, summarize_command, submit_command, help_command
 from handlers.conversation import handle_message
 from handlers.callback import handle_callback
-from config.settings import AI_PROVIDER, OPENAI_MODEL, GOOGLE_MODEL, CHANNEL_ID, GROUP_ID
+from handlers.job_handler import rolling_summary_job, vote_tally_job, publish_queue_job, quota_flush_job
+from handlers.vote_handler import VoteHandler, handle_poll
+from config.settings import AI_PROVIDER, OPENAI_MODEL, GOOGLE_MODEL, CHANNEL_ID, GROUP_ID, SUMMARY_JOB_INTERVAL, VOTE_FLUSH_INTERVAL, PUBLISH_INTERVAL, QUOTA_FLUSH_INTERVAL
 from database.db_controller import DBController
+from utils.similarity_index import SimilarityIndex
+from utils.conversation_memory import ConversationMemory
+from utils.vote_tally import VoteTally
+from utils.publish_queue import PublishQueue
+from utils.quota import QuotaManager
+from utils.admission import AdmissionController
+from utils.telegram_client import build_request
+from utils.lifecycle import StreamRegistry, CancellationRegistry, resume_streams
+from utils.media_group import MediaGroupCollector
+from utils.edit_tracker import EditTracker
+from services.video_service import VideoFrameExtractor
+from services.document_service import DocumentReader
+from services.link_service import LinkFetcher
+from services.transcribe_service import AudioTranscriber
 from datetime import datetime
-import time  # 添加这个导入
+import time
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", 
@@ -18,6 +36,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+PROCESS_STARTED = time.monotonic()
+
 async def register_commands(app: Application) -> None:
     # 清除所有作用域的命令
     for scope in [
@@ -44,7 +64,7 @@ async def register_commands(app: Application) -> None:
 
     public_commands = [
         BotCommand("analyze", "分析引用的消息"),
-        BotCommand("summarize", "总结引用的消息"),
+        BotCommand("summarize", "总结引用的消息或聊天记录"),
     ]
     
     admin_commands = base_commands + private_commands + public_commands + [
@@ -86,15 +106,60 @@ async def post_init(app: Application) -> None:
     db_controller = DBController("data/app.db")
     await db_controller.init()
     app.bot_data['db'] = db_controller
-    
+
+    # 加载投稿相似度索引
+    similarity_index = SimilarityIndex()
+    similarity_index.load(await db_controller.get_vote_fingerprints() or [])
+    app.bot_data['similarity_index'] = similarity_index
+    app.bot_data['conversation_memory'] = ConversationMemory()
+    app.bot_data['quota'] = QuotaManager()
+    admission = AdmissionController()
+    admission.start()
+    app.bot_data['admission'] = admission
+    app.bot_data['streams'] = StreamRegistry()
+    app.bot_data['cancellations'] = CancellationRegistry()
+    app.bot_data['media_groups'] = MediaGroupCollector()
+    app.bot_data['edits'] = EditTracker()
+    app.bot_data['video_frames'] = VideoFrameExtractor()
+    app.bot_data['documents'] = DocumentReader()
+    app.bot_data['links'] = LinkFetcher(db_controller)
+    app.bot_data['transcriber'] = AudioTranscriber()
+
+    # 恢复投票中的计票
+    vote_tally = VoteTally()
+    vote_tally.load(await db_controller.get_open_vote_tallies() or [])
+    app.bot_data['vote_tally'] = vote_tally
+
+    # 频道发布队列
+    publish_queue = PublishQueue(db_controller)
+    await publish_queue.recover()
+    app.bot_data['publish_queue'] = publish_queue
+
+    # 恢复重启前已通过但尚未发布的投稿
+    resumed = await VoteHandler(None).resume_pending(app)
+    if resumed:
+        logger.info(f"Resumed {resumed} approved votes")
+
+    # 后台维护聊天总结检查点
+    app.job_queue.run_repeating(rolling_summary_job, interval=SUMMARY_JOB_INTERVAL, first=60, name='rolling_summary')
+    app.job_queue.run_repeating(vote_tally_job, interval=VOTE_FLUSH_INTERVAL, first=VOTE_FLUSH_INTERVAL, name='vote_tally')
+    app.job_queue.run_repeating(publish_queue_job, interval=PUBLISH_INTERVAL, first=10, name='publish_queue')
+    app.job_queue.run_repeating(quota_flush_job, interval=QUOTA_FLUSH_INTERVAL, first=QUOTA_FLUSH_INTERVAL, name='quota_flush')
 
     # 注册命令
     await register_commands(app)
     
+    # 统计重启耗时：上次关闭到本次启动完成
+    now = time.time()
+    last_stop = await db_controller.get_last_lifecycle_event('stop')
+    downtime = f"，距上次关闭 {now - last_stop['at']:.1f}s" if last_stop else ""
+    await db_controller.record_lifecycle_event('start', now)
+    logger.info(f"Startup initialization took {time.monotonic() - PROCESS_STARTED:.1f}s{downtime}")
+
     # 发送启动通知
     await app.bot.send_message(
         chat_id=TELEGRAM_USER_ID,
-        text="🤖 PickPin 已启动，现在时间：" + datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        text="🤖 PickPin 已启动，现在时间：" + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + downtime
     )
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -128,6 +193,9 @@ def setup_handlers(app: Application) -> None:
     
     # 回调处理器
     app.add_handler(CallbackQueryHandler(handle_callback))
+
+    # 投票计票处理器
+    app.add_handler(PollHandler(handle_poll))
     
     # 消息处理器 (放最后)
     app.add_handler(MessageHandler(
@@ -138,38 +206,130 @@ def setup_handlers(app: Application) -> None:
     app.add_error_handler(error_handler)
 
 
-def main() -> None:  # 改回同步函数
-    # 创建 JobQueue 实例
-    job_queue = JobQueue()
-    
+# 各类处理器可能接收的更新类型，用于只订阅实际会处理的更新
+_HANDLER_UPDATE_TYPES = {
+    CommandHandler: [Update.MESSAGE, Update.EDITED_MESSAGE],
+    MessageHandler: [Update.MESSAGE, Update.EDITED_MESSAGE, Update.CHANNEL_POST, Update.EDITED_CHANNEL_POST],
+    CallbackQueryHandler: [Update.CALLBACK_QUERY],
+    PollHandler: [Update.POLL],
+}
+
+
+def derive_allowed_updates(app: Application) -> list:
+    """根据已注册的处理器推导 allowed_updates，存在未知处理器时订阅全部类型"""
+    allowed = []
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            types = _HANDLER_UPDATE_TYPES.get(type(handler))
+            if types is None:
+                logger.warning(f"Unknown handler {type(handler).__name__}, subscribing to all update types")
+                return Update.ALL_TYPES
+            allowed.extend(update_type for update_type in types if update_type not in allowed)
+    return allowed
+
+
+async def shutdown_gracefully(app: Application) -> None:
+    """停止接收后等待进行中的回复，落盘缓冲数据并记录未完成的回复"""
+    started = time.monotonic()
+    db = app.bot_data['db']
+    streams: StreamRegistry = app.bot_data['streams']
+
+    unfinished = await streams.drain(SHUTDOWN_DRAIN_TIMEOUT)
+    if unfinished:
+        logger.warning(f"{len(unfinished)} streams unfinished after {SHUTDOWN_DRAIN_TIMEOUT}s, saving for resume")
+        await db.save_pending_streams([stream.to_record() for stream in unfinished])
+        streams.cancel(unfinished)
+
+    results = await asyncio.gather(
+        app.bot_data['vote_tally'].flush(db),
+        app.bot_data['quota'].flush(db),
+        app.bot_data['admission'].stop(),
+        app.bot_data['links'].close(),
+        app.bot_data['transcriber'].close(),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Failed to flush on shutdown: {result}")
+    app.bot_data['video_frames'].shutdown()
+    app.bot_data['documents'].shutdown()
+
+    elapsed = time.monotonic() - started
+    await db.record_lifecycle_event('stop', time.time(), f"drain={elapsed:.1f}s unfinished={len(unfinished)}")
+    logger.info(f"Graceful shutdown finished in {elapsed:.1f}s")
+
+
+def build_application() -> Application:
+    application = Application.builder()\
+        .token(TELEGRAM_BOT_TOKEN)\
+        .request(build_request(TELEGRAM_POOL_SIZE, proxy=HTTP_PROXY))\
+        .get_updates_request(build_request(1, proxy=HTTP_PROXY, timeout=40.0, http_version="1.1"))\
+        .job_queue(JobQueue())\
+        .concurrent_updates(UPDATE_CONCURRENCY)\
+        .build()
+    setup_handlers(application)
+    return application
+
+
+async def run() -> None:
+    """手动管理生命周期：SIGTERM/SIGINT 时先停止拉取更新，再排空进行中的回复后退出
+
+    不再丢弃积压的更新，重启期间收到的消息会在下次启动后处理；
+    轮询期间的网络错误由 Updater 自行重试，启动失败或崩溃由 main 有限次重启。
+    """
+    application = build_application()
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows 的事件循环不支持 add_signal_handler
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop_event.set))
+
+    async with application:
+        await post_init(application)
+        await application.start()
+        allowed_updates = derive_allowed_updates(application)
+        logger.info(f"Subscribing to updates: {', '.join(allowed_updates)}")
+        await application.updater.start_polling(
+            allowed_updates=allowed_updates,
+            poll_interval=1.0,
+            timeout=30,
+            bootstrap_retries=-1
+        )
+        application.create_task(resume_streams(application.bot, application.bot_data['db']))
+        logger.info(f"Bot ready in {time.monotonic() - PROCESS_STARTED:.1f}s")
+
+        await stop_event.wait()
+        logger.info("Shutdown requested, stopping intake")
+        await application.updater.stop()
+        await shutdown_gracefully(application)
+        await application.stop()
+
+
+def main() -> None:
+    """运行机器人，启动失败或运行中崩溃时等待后重启，连续失败超过上限时退出"""
+    failures = 0
     while True:
+        started = time.monotonic()
         try:
-            application = Application.builder()\
-                .token(TELEGRAM_BOT_TOKEN)\
-                .proxy(HTTP_PROXY)\
-                .get_updates_proxy(HTTP_PROXY)\
-                .connect_timeout(30.0)\
-                .read_timeout(30.0)\
-                .write_timeout(30.0)\
-                .pool_timeout(30.0)\
-                .job_queue(job_queue)\
-                .build()
-
-            setup_handlers(application)
-            application.post_init = post_init
-            
-            application.run_polling(  # 移除 await
-                allowed_updates=Update.ALL_TYPES,
-                drop_pending_updates=True,
-                poll_interval=1.0,
-                timeout=30
-            )
+            asyncio.run(run())
+            return
+        except KeyboardInterrupt:
+            return
         except Exception as e:
-            logger.error(f"Polling error: {e}")
-            logger.info("Waiting 10 seconds before retry...")
-            time.sleep(10)
-            continue
+            logger.exception(f"Bot crashed: {e}")
+        if time.monotonic() - started > RESTART_RESET_AFTER:
+            failures = 0
+        failures += 1
+        if failures > RESTART_MAX_ATTEMPTS:
+            logger.error(f"Giving up after {RESTART_MAX_ATTEMPTS} consecutive restarts")
+            raise SystemExit(1)
+        delay = min(RESTART_DELAY * 2 ** (failures - 1), 300)
+        logger.info(f"Restarting in {delay:.0f}s (attempt {failures}/{RESTART_MAX_ATTEMPTS})")
+        time.sleep(delay)
+
 
 if __name__ == "__main__":
-    asyncio.run(main())  # 这行保持不变
-  
\ No newline at end of file
+    main()
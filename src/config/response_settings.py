@@ -11,6 +11,14 @@ USER_LISTS = {
     'allowed_commands': [admin_id]
 }
 
+# 使用配额：daily 为每日上限，burst 为突发上限（令牌桶容量，burst_window 秒内匀速恢复），None 表示不限
+QUOTA_LIMITS = {
+    'admin': {'daily': None, 'burst': None},
+    'whitelist': {'daily': 200, 'burst': 10, 'burst_window': 60},
+    'default': {'daily': 50, 'burst': 5, 'burst_window': 60},
+}
+CHAT_QUOTA = {'burst': 30, 'burst_window': 60}  # 单个群组内所有非管理员用户共享的突发上限
+
 # 响应控制配置
 RESPONSE_SETTINGS = {
     'private_chat': {
@@ -30,6 +38,16 @@ RESPONSE_SETTINGS = {
     }
 }
 
+# 用户消息存储策略：full 保存完整 update，compact 只保存文本和发送者（足够用于聊天总结），none 不保存
+# 按聊天类型设置，chats 中按聊天ID单独覆盖
+MESSAGE_PERSISTENCE = {
+    'private': 'full',
+    'group': 'compact',
+    'supergroup': 'compact',
+    'channel': 'compact',
+    'chats': {},
+}
+
 # 响应优先级
 RESPONSE_PRIORITY = {
     'commands': 1,  # 命令优先级最高
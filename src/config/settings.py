@@ -8,6 +8,7 @@ load_dotenv('.env')
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_USER_ID = int(os.getenv("TELEGRAM_USER_ID", "0"))
 HTTP_PROXY = os.getenv("HTTP_PROXY")
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "32"))  # Bot API 连接池大小，按并发请求数设置
 
 # 验证必需的配置
 if not all([TELEGRAM_BOT_TOKEN, TELEGRAM_USER_ID]):
@@ -37,5 +38,106 @@ ZHIPU_API_KEY = os.getenv("ZHIPU_API_KEY")
 ZHIPU_MODEL = os.getenv("ZHIPU_MODEL", "glm-4-flash")
 ZHIPU_VISION_MODEL = os.getenv("ZHIPU_VISION_MODEL", "glm-4v-flash")
 
+# 相册（media group）聚合配置
+MEDIA_GROUP_WINDOW = float(os.getenv("MEDIA_GROUP_WINDOW", "1.5"))  # 最后一张到达后再等待的时间（秒）
+MEDIA_GROUP_MAX_WAIT = float(os.getenv("MEDIA_GROUP_MAX_WAIT", "5"))  # 从第一张到达起的最长等待时间（秒）
+VISION_MAX_IMAGES = {  # 各 provider 单次视觉请求的图片上限，超出时分批
+    "google": 16,
+    "zhipu": 1,
+}
+
+# 编辑消息重新处理配置
+EDIT_DEBOUNCE_WINDOW = float(os.getenv("EDIT_DEBOUNCE_WINDOW", "2"))  # 最后一次编辑后等待的时间（秒），期间的连续编辑只处理最后一次
+EDIT_TRIVIAL_RATIO = float(os.getenv("EDIT_TRIVIAL_RATIO", "0.97"))  # 规范化后相似度不低于该值的编辑不重新生成
+EDIT_TRACK_SIZE = int(os.getenv("EDIT_TRACK_SIZE", "512"))  # 记录回复状态消息的原消息数量上限
+
+# 视频抽帧配置（需要 ffmpeg）
+VIDEO_MAX_BYTES = int(os.getenv("VIDEO_MAX_BYTES", str(20 * 1024 * 1024)))  # 可处理的视频大小上限，Bot API 下载上限为 20MB
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "6"))  # 每个视频最多抽取的关键帧数
+VIDEO_FRAME_WIDTH = int(os.getenv("VIDEO_FRAME_WIDTH", "768"))  # 关键帧缩放宽度
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", "2"))  # 解码进程数
+VIDEO_DECODE_TIMEOUT = float(os.getenv("VIDEO_DECODE_TIMEOUT", "60"))  # 单个视频解码超时（秒）
+VIDEO_FRAME_CACHE_SIZE = int(os.getenv("VIDEO_FRAME_CACHE_SIZE", "32"))  # 按 file_unique_id 缓存的视频数
+
+# 文档（PDF/TXT/DOCX）解析配置，PDF 需要安装 pypdf
+DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(20 * 1024 * 1024)))  # 可处理的文档大小上限
+DOCUMENT_WORKERS = int(os.getenv("DOCUMENT_WORKERS", "2"))  # 文字提取进程数
+DOCUMENT_CHUNK_TOKENS = int(os.getenv("DOCUMENT_CHUNK_TOKENS", "6000"))  # 文档分段总结的 token 上限，不超过该值的文档直接使用原文
+DOCUMENT_CACHE_DIR = os.getenv("DOCUMENT_CACHE_DIR", "data/documents")  # 提取出的文字暂存目录，整篇处理完后删除
+
+# 链接内容抓取配置
+LINK_FETCH_TIMEOUT = float(os.getenv("LINK_FETCH_TIMEOUT", "10"))  # 单个链接的抓取超时（秒）
+LINK_MAX_BYTES = int(os.getenv("LINK_MAX_BYTES", str(2 * 1024 * 1024)))  # 单个页面最多读取的字节数
+LINK_POOL_SIZE = int(os.getenv("LINK_POOL_SIZE", "20"))  # 抓取连接池大小
+LINK_PER_HOST = int(os.getenv("LINK_PER_HOST", "2"))  # 同一站点同时抓取的请求数
+LINK_CACHE_TTL = int(os.getenv("LINK_CACHE_TTL", str(6 * 60 * 60)))  # 缓存有效期（秒），过期后用 ETag/Last-Modified 重新验证
+LINK_MAX_PER_MESSAGE = int(os.getenv("LINK_MAX_PER_MESSAGE", "3"))  # 每条消息最多抓取的链接数
+LINK_MAX_CHARS = int(os.getenv("LINK_MAX_CHARS", "6000"))  # 每个链接保留的正文字数
+
+# 语音转写配置（OpenAI 兼容的 /audio/transcriptions 接口，长音频切分需要 ffmpeg）
+TRANSCRIBE_API_KEY = os.getenv("TRANSCRIBE_API_KEY", OPENAI_API_KEY or "")
+TRANSCRIBE_BASE_URL = os.getenv("TRANSCRIBE_BASE_URL", OPENAI_BASE_URL)
+TRANSCRIBE_MODEL = os.getenv("TRANSCRIBE_MODEL", "whisper-1")
+AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", str(20 * 1024 * 1024)))  # 可处理的音频大小上限
+TRANSCRIBE_CHUNK_SECONDS = int(os.getenv("TRANSCRIBE_CHUNK_SECONDS", "120"))  # 超过该时长的音频切分后并发转写
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "4"))  # 单个音频同时转写的分段数
+TRANSCRIBE_TIMEOUT = float(os.getenv("TRANSCRIBE_TIMEOUT", "120"))  # 单次转写请求超时（秒）
+
 CHANNEL_ID = int(os.getenv("CHANNEL_ID", "-1002262761719")) # RKPin 频道
-GROUP_ID = int(os.getenv("GROUP_ID", "-1001969921477")) # RKPin 群组
\ No newline at end of file
+GROUP_ID = int(os.getenv("GROUP_ID", "-1001969921477")) # RKPin 群组
+
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20"))  # 关闭时等待进行中回复完成的最长时间（秒）
+RESTART_MAX_ATTEMPTS = int(os.getenv("RESTART_MAX_ATTEMPTS", "5"))  # 启动或运行中崩溃后连续重启的次数上限
+RESTART_DELAY = float(os.getenv("RESTART_DELAY", "10"))  # 重启前的等待时间（秒），连续失败时翻倍，最长 5 分钟
+RESTART_RESET_AFTER = float(os.getenv("RESTART_RESET_AFTER", "600"))  # 运行超过该时间（秒）后崩溃不计入连续失败
+
+# 过载保护配置
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))  # 同时处理的更新数
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "8"))  # 同时进行的 AI 请求上限，低优先级最多占一半
+ADMISSION_MAX_WAITING = int(os.getenv("ADMISSION_MAX_WAITING", "16"))  # 排队等待的请求上限，超出直接回复繁忙
+ADMISSION_MAX_LAG = float(os.getenv("ADMISSION_MAX_LAG", "0.5"))  # 事件循环延迟超过该值（秒）视为过载
+ADMISSION_DEFER_PRIORITY = int(os.getenv("ADMISSION_DEFER_PRIORITY", "3"))  # RESPONSE_PRIORITY 数值不小于该值的请求在负载较高时延后
+ADMISSION_WAIT_TIMEOUT = float(os.getenv("ADMISSION_WAIT_TIMEOUT", "30"))  # 排队等待的最长时间（秒）
+
+# 聊天记录总结配置
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))  # 每个分块的 token 上限
+SUMMARY_BLOCK_SIZE = int(os.getenv("SUMMARY_BLOCK_SIZE", "100"))  # 按消息ID对齐的分块粒度，便于增量复用
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "3"))  # 并发总结的分块数
+SUMMARY_CHECKPOINT_MESSAGES = int(os.getenv("SUMMARY_CHECKPOINT_MESSAGES", "200"))  # 累计多少条新消息生成检查点
+SUMMARY_JOB_INTERVAL = int(os.getenv("SUMMARY_JOB_INTERVAL", "600"))  # 后台检查点任务间隔（秒）
+
+# 私聊多轮对话记忆配置
+MEMORY_MAX_CHATS = int(os.getenv("MEMORY_MAX_CHATS", "500"))  # 内存中最多保留的会话数（LRU 淘汰）
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "20"))  # 每个会话保留的最近轮数
+MEMORY_REPLY_CHAIN = int(os.getenv("MEMORY_REPLY_CHAIN", "10"))  # 回复较早的消息时，沿回复链最多补充的消息数
+MEMORY_TOKEN_BUDGETS = {  # 各模型用于历史上下文的 token 预算
+    "default": 4000,
+    GOOGLE_MODEL: 8000,
+    SILICONFLOW_MODEL: 3000,
+    ZHIPU_MODEL: 3000,
+}
+
+# 各模型输入 token 上限（超出时截断或分块 map-reduce）
+MAX_INPUT_TOKENS = {
+    "default": 30000,
+    GOOGLE_MODEL: 200000,
+    SILICONFLOW_MODEL: 28000,
+    ZHIPU_MODEL: 100000,
+}
+INPUT_MAP_REDUCE_RATIO = float(os.getenv("INPUT_MAP_REDUCE_RATIO", "1.5"))  # 超过上限多少倍时改用分块 map-reduce
+
+# 使用配额写回 users 表的间隔（秒），额度见 response_settings.QUOTA_LIMITS
+QUOTA_FLUSH_INTERVAL = int(os.getenv("QUOTA_FLUSH_INTERVAL", "120"))
+QUOTA_ROLE_TTL = int(os.getenv("QUOTA_ROLE_TTL", "600"))  # 内存中用户角色的有效期（秒），过期后重新读取管理员状态
+
+# 投稿投票自动决策配置
+VOTE_DURATION = int(os.getenv("VOTE_DURATION", str(24 * 60 * 60)))  # 投票时长（秒），到期自动结算
+VOTE_QUORUM = int(os.getenv("VOTE_QUORUM", "5"))  # 自动决策所需的最少投票人数，不足时视为未通过
+VOTE_APPROVE_RATIO = float(os.getenv("VOTE_APPROVE_RATIO", "0.6"))  # 同意票占比达到该值即通过
+VOTE_FLUSH_INTERVAL = int(os.getenv("VOTE_FLUSH_INTERVAL", "60"))  # 计票落库与到期检查的间隔（秒）
+
+# 频道发布队列配置
+PUBLISH_INTERVAL = int(os.getenv("PUBLISH_INTERVAL", "60"))  # 两次频道发布的最小间隔（秒）
+PUBLISH_WINDOWS = os.getenv("PUBLISH_WINDOWS", "")  # 允许发布的本地时段，如 "08:00-12:00,18:00-23:30"，留空不限制
+PUBLISH_DIGEST_SIZE = int(os.getenv("PUBLISH_DIGEST_SIZE", "3"))  # 积压时合并为一条合集的最大投稿数，1 为不合并
+PUBLISH_MAX_ATTEMPTS = int(os.getenv("PUBLISH_MAX_ATTEMPTS", "5"))  # 单条发布的最大尝试次数
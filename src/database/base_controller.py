@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import AsyncGenerator
 import aiosqlite
 import logging
 
@@ -20,6 +21,28 @@ class BaseController:
             logger.error(f"Database error: {e}")
             return False
             
+    async def execute_many(self, query: str, params_seq: list) -> bool:
+        """在同一事务中批量执行SQL语句"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.executemany(query, params_seq)
+                await db.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Database error: {e}")
+            return False
+
+    async def execute_rowcount(self, query: str, params: tuple = None) -> int:
+        """执行SQL语句并返回影响行数，出错时返回 -1"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                cursor = await db.execute(query, params or ())
+                await db.commit()
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Database error: {e}")
+            return -1
+
     async def fetch_one(self, query: str, params: tuple = None) -> dict:
         """获取单条记录"""
         try:
@@ -42,4 +65,19 @@ class BaseController:
                     return [dict(row) for row in rows]
         except Exception as e:
             logger.error(f"Database error: {e}")
-            return [] 
\ No newline at end of file
+            return []
+
+    async def iter_rows(self, query: str, params: tuple = None, batch_size: int = 200) -> AsyncGenerator[dict, None]:
+        """按批游标读取记录，避免一次性载入内存"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                db.row_factory = aiosqlite.Row
+                async with db.execute(query, params or ()) as cursor:
+                    while True:
+                        rows = await cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        for row in rows:
+                            yield dict(row)
+        except Exception as e:
+            logger.error(f"Database error: {e}")
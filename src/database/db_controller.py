@@ -1,12 +1,16 @@
-from typing import Optional, List, TypeVar, Type, Callable, Any, Dict
+from typing import Optional, List, TypeVar, Type, Callable, Any, Dict, AsyncGenerator, Tuple, Union
 from functools import wraps
 import logging
 from datetime import date
-from .models import Message, User, Vote
+from .models import Message, User, Vote, VOTE_TRANSITIONS, VOTE_PENDING, VOTE_POLLING
 from .base_controller import BaseController
 from .message_controller import MessageController
 from .user_controller import UserController
 from .vote_controller import VoteController
+from .summary_controller import SummaryController
+from .lifecycle_controller import LifecycleController
+from .media_controller import MediaController
+from .link_controller import LinkController
 import json
 
 logger = logging.getLogger(__name__)
@@ -30,12 +34,20 @@ class DBController:
         self.message_controller = MessageController(db_path)
         self.user_controller = UserController(db_path)
         self.vote_controller = VoteController(db_path)
+        self.summary_controller = SummaryController(db_path)
+        self.lifecycle_controller = LifecycleController(db_path)
+        self.media_controller = MediaController(db_path)
+        self.link_controller = LinkController(db_path)
 
     async def init(self):
         """初始化数据库"""
         await self.message_controller.init()
         await self.user_controller.init()
         await self.vote_controller.init()
+        await self.summary_controller.init()
+        await self.lifecycle_controller.init()
+        await self.media_controller.init()
+        await self.link_controller.init()
 
     # Message operations
     @db_operation
@@ -56,6 +68,28 @@ class DBController:
     async def update_message(self, message: Message) -> bool:
         return await self.message_controller.update_message(message.to_dict())
 
+    def iter_chat_history(
+        self,
+        chat_id: int,
+        since: Union[str, Tuple[str, ...], None] = None,
+        last_n: Optional[int] = None,
+        after_message_id: Optional[int] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """游标遍历聊天记录（异步生成器，不经过 db_operation）"""
+        return self.message_controller.iter_chat_history(chat_id, since, last_n, after_message_id)
+
+    @db_operation
+    async def get_recent_turns(self, chat_id: int, limit: int = 20) -> List[Dict[str, Any]]:
+        return await self.message_controller.get_recent_turns(chat_id, limit)
+
+    @db_operation
+    async def get_reply_chain(self, chat_id: int, message_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        return await self.message_controller.get_reply_chain(chat_id, message_id, limit)
+
+    @db_operation
+    async def count_messages_after(self, chat_id: int, after_message_id: int) -> Optional[Dict[str, Any]]:
+        return await self.message_controller.count_messages_after(chat_id, after_message_id)
+
     # User operations
     @db_operation
     async def save_user(self, user: User) -> bool:
@@ -85,6 +119,11 @@ class DBController:
             return await self.get_user(user_id)
         return None
 
+    @db_operation
+    async def add_user_usage(self, usages: List[Tuple[int, int]]) -> bool:
+        """批量写回内存中累计的使用次数，元素为 (user_id, 次数)"""
+        return await self.user_controller.add_usage(usages)
+
     # Vote operations
     @db_operation
     async def save_vote(self, vote: Vote) -> bool:
@@ -116,6 +155,21 @@ class DBController:
     async def update_vote_status(self, vote_id: int, status: str) -> bool:
         return await self.vote_controller.update_vote_status(vote_id, status)
 
+    @db_operation
+    async def transition_vote(self, vote_id: int, status: str) -> bool:
+        """按状态机变更投票状态，重复或越级的变更返回 False"""
+        return await self.vote_controller.transition_status(vote_id, VOTE_TRANSITIONS[status], status)
+
+    @db_operation
+    async def revert_vote_polling(self, vote_id: int) -> bool:
+        """发起投票失败时退回 pending，允许重新发起"""
+        return await self.vote_controller.transition_status(vote_id, (VOTE_POLLING,), VOTE_PENDING)
+
+    @db_operation
+    async def get_votes_by_status(self, *statuses: str) -> List[Vote]:
+        votes = await self.vote_controller.get_votes_by_status(statuses)
+        return [Vote(**vote) for vote in votes]
+
     @db_operation
     async def update_vote_content(self, vote_id: int, analyse: str, introduction: str) -> bool:
         """更新投票内容"""
@@ -124,4 +178,135 @@ class DBController:
     @db_operation
     async def update_vote_message(self, vote_id: int, message_id: int, chat_id: int) -> bool:
         """更新投票消息ID和群组ID"""
-        return await self.vote_controller.update_vote_message(vote_id, message_id, chat_id)
\ No newline at end of file
+        return await self.vote_controller.update_vote_message(vote_id, message_id, chat_id)
+
+    @db_operation
+    async def save_vote_fingerprint(self, vote_id: int, simhash: int) -> bool:
+        """保存投稿指纹（有符号64位）"""
+        return await self.vote_controller.save_fingerprint(vote_id, simhash)
+
+    @db_operation
+    async def get_vote_fingerprints(self) -> List[Dict[str, Any]]:
+        """获取全部投稿指纹"""
+        return await self.vote_controller.get_fingerprints()
+
+    @db_operation
+    async def save_vote_tally(self, vote_id: int, poll_id: str, message_id: int, chat_id: int, opened_at: int) -> bool:
+        return await self.vote_controller.save_tally(vote_id, poll_id, message_id, chat_id, opened_at)
+
+    @db_operation
+    async def update_vote_tallies(self, tallies: List[Tuple[int, int, int]]) -> bool:
+        """批量写入计票结果，元素为 (yes_count, no_count, vote_id)"""
+        return await self.vote_controller.update_tallies(tallies)
+
+    @db_operation
+    async def get_open_vote_tallies(self) -> List[Dict[str, Any]]:
+        return await self.vote_controller.get_open_tallies()
+
+    @db_operation
+    async def enqueue_publish(self, vote_id: int, content: str, enqueued_at: int) -> bool:
+        """加入频道发布队列，重复入队返回 False"""
+        return await self.vote_controller.enqueue_publish(vote_id, content, enqueued_at)
+
+    @db_operation
+    async def get_due_publish(self, now: int, limit: int) -> List[Dict[str, Any]]:
+        return await self.vote_controller.get_due_publish(now, limit)
+
+    @db_operation
+    async def get_publish_ids(self, status: str) -> List[int]:
+        return await self.vote_controller.get_publish_ids(status)
+
+    @db_operation
+    async def set_publish_status(self, vote_ids: List[int], from_status: str, to_status: str, **fields: Any) -> int:
+        return await self.vote_controller.set_publish_status(vote_ids, from_status, to_status, **fields)
+
+    @db_operation
+    async def defer_publish(self, vote_ids: List[int], not_before: int) -> int:
+        return await self.vote_controller.defer_publish(vote_ids, not_before)
+
+    @db_operation
+    async def get_publish_depth(self) -> Dict[str, int]:
+        return await self.vote_controller.get_publish_depth()
+
+    # Summary operations
+    @db_operation
+    async def get_chunk_summary(self, range_hash: str) -> Optional[str]:
+        data = await self.summary_controller.get_chunk_summary(range_hash)
+        return data['summary'] if data else None
+
+    @db_operation
+    async def save_chunk_summary(self, chunk_data: Dict[str, Any]) -> bool:
+        return await self.summary_controller.save_chunk_summary(chunk_data)
+
+    @db_operation
+    async def get_summary_checkpoint(self, chat_id: int, level: str, period_start: str) -> Optional[Dict[str, Any]]:
+        return await self.summary_controller.get_checkpoint(chat_id, level, period_start)
+
+    @db_operation
+    async def save_summary_checkpoint(self, checkpoint: Dict[str, Any]) -> bool:
+        return await self.summary_controller.save_checkpoint(checkpoint)
+
+    @db_operation
+    async def get_summary_checkpoints(self, chat_id: int, level: str, period_prefix: str) -> List[Dict[str, Any]]:
+        return await self.summary_controller.get_checkpoints(chat_id, level, period_prefix)
+
+    @db_operation
+    async def get_last_checkpoint_message_id(self, chat_id: int, level: str = 'hour') -> Optional[int]:
+        return await self.summary_controller.get_last_checkpoint_message_id(chat_id, level)
+
+    @db_operation
+    async def get_pending_summary_days(self, chat_id: int) -> List[str]:
+        return await self.summary_controller.get_pending_days(chat_id)
+
+    # Lifecycle operations
+    @db_operation
+    async def save_pending_streams(self, streams: List[Dict[str, Any]]) -> bool:
+        """记录关闭时未完成的流式回复"""
+        return await self.lifecycle_controller.save_pending_streams(streams)
+
+    @db_operation
+    async def get_pending_streams(self) -> List[Dict[str, Any]]:
+        return await self.lifecycle_controller.get_pending_streams()
+
+    @db_operation
+    async def delete_pending_stream(self, chat_id: int, message_id: int) -> bool:
+        return await self.lifecycle_controller.delete_pending_stream(chat_id, message_id)
+
+    @db_operation
+    async def record_lifecycle_event(self, event: str, at: float, detail: Optional[str] = None) -> bool:
+        return await self.lifecycle_controller.record_event(event, at, detail)
+
+    @db_operation
+    async def get_last_lifecycle_event(self, event: str) -> Optional[Dict[str, Any]]:
+        return await self.lifecycle_controller.get_last_event(event)
+
+    # Media operations
+    @db_operation
+    async def get_media_text(self, file_unique_id: str) -> Optional[str]:
+        data = await self.media_controller.get_media_text(file_unique_id)
+        return data['text'] if data else None
+
+    @db_operation
+    async def save_media_text(self, file_unique_id: str, kind: str, text: str) -> bool:
+        return await self.media_controller.save_media_text(file_unique_id, kind, text)
+
+    @db_operation
+    async def get_document_chunks(self, file_unique_id: str) -> Dict[int, str]:
+        return await self.media_controller.get_document_chunks(file_unique_id)
+
+    @db_operation
+    async def save_document_chunk(self, file_unique_id: str, chunk_index: int, summary: str) -> bool:
+        return await self.media_controller.save_document_chunk(file_unique_id, chunk_index, summary)
+
+    # Link operations
+    @db_operation
+    async def get_link(self, url: str) -> Optional[Dict[str, Any]]:
+        return await self.link_controller.get_link(url)
+
+    @db_operation
+    async def save_link(self, link: Dict[str, Any]) -> bool:
+        return await self.link_controller.save_link(link)
+
+    @db_operation
+    async def touch_link(self, url: str, fetched_at: float) -> bool:
+        return await self.link_controller.touch_link(url, fetched_at)
@@ -0,0 +1,63 @@
+from typing import Optional, Dict, Any, List
+from .base_controller import BaseController
+
+class LifecycleController(BaseController):
+    async def init(self):
+        """初始化运行状态表"""
+        await self.execute('''
+            CREATE TABLE IF NOT EXISTS pending_streams (
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                text TEXT,
+                parse_mode TEXT,
+                resume_message TEXT,
+                resume_prompt TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (chat_id, message_id)
+            )
+        ''')
+        await self.execute('''
+            CREATE TABLE IF NOT EXISTS lifecycle_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event TEXT NOT NULL,
+                at REAL NOT NULL,
+                detail TEXT
+            )
+        ''')
+
+    async def save_pending_streams(self, streams: List[Dict[str, Any]]) -> bool:
+        """记录关闭时未完成的流式回复"""
+        return await self.execute_many('''
+            INSERT OR REPLACE INTO pending_streams
+            (chat_id, message_id, text, parse_mode, resume_message, resume_prompt)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(
+            stream['chat_id'],
+            stream['message_id'],
+            stream.get('text'),
+            stream.get('parse_mode'),
+            stream.get('resume_message'),
+            stream.get('resume_prompt')
+        ) for stream in streams])
+
+    async def get_pending_streams(self) -> List[Dict[str, Any]]:
+        return await self.fetch_all('SELECT * FROM pending_streams ORDER BY created_at ASC')
+
+    async def delete_pending_stream(self, chat_id: int, message_id: int) -> bool:
+        return await self.execute(
+            'DELETE FROM pending_streams WHERE chat_id = ? AND message_id = ?',
+            (chat_id, message_id)
+        )
+
+    async def record_event(self, event: str, at: float, detail: Optional[str] = None) -> bool:
+        """记录启动/关闭事件，用于统计重启耗时"""
+        return await self.execute(
+            'INSERT INTO lifecycle_events (event, at, detail) VALUES (?, ?, ?)',
+            (event, at, detail)
+        )
+
+    async def get_last_event(self, event: str) -> Optional[Dict[str, Any]]:
+        return await self.fetch_one(
+            'SELECT * FROM lifecycle_events WHERE event = ? ORDER BY id DESC LIMIT 1',
+            (event,)
+        )
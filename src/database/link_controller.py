@@ -0,0 +1,44 @@
+from typing import Optional, Dict, Any
+from .base_controller import BaseController
+
+class LinkController(BaseController):
+    async def init(self):
+        """初始化链接内容缓存表"""
+        await self.execute('''
+            CREATE TABLE IF NOT EXISTS link_cache (
+                url TEXT PRIMARY KEY,
+                final_url TEXT,
+                title TEXT,
+                text TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL
+            )
+        ''')
+
+    async def get_link(self, url: str) -> Optional[Dict[str, Any]]:
+        """获取链接缓存"""
+        return await self.fetch_one('SELECT * FROM link_cache WHERE url = ?', (url,))
+
+    async def save_link(self, link: Dict[str, Any]) -> bool:
+        """保存链接内容及校验信息"""
+        return await self.execute('''
+            INSERT OR REPLACE INTO link_cache
+            (url, final_url, title, text, etag, last_modified, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            link['url'],
+            link.get('final_url'),
+            link.get('title'),
+            link.get('text'),
+            link.get('etag'),
+            link.get('last_modified'),
+            link['fetched_at']
+        ))
+
+    async def touch_link(self, url: str, fetched_at: float) -> bool:
+        """重新验证未变化（304）时刷新缓存时间"""
+        return await self.execute(
+            'UPDATE link_cache SET fetched_at = ? WHERE url = ?',
+            (fetched_at, url)
+        )
@@ -0,0 +1,52 @@
+from typing import Optional, Dict, Any
+from .base_controller import BaseController
+
+class MediaController(BaseController):
+    async def init(self):
+        """初始化媒体文本缓存表"""
+        await self.execute('''
+            CREATE TABLE IF NOT EXISTS media_texts (
+                file_unique_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        await self.execute('''
+            CREATE TABLE IF NOT EXISTS document_chunks (
+                file_unique_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (file_unique_id, chunk_index)
+            )
+        ''')
+
+    async def get_media_text(self, file_unique_id: str) -> Optional[Dict[str, Any]]:
+        """获取已提取的媒体文本"""
+        return await self.fetch_one(
+            'SELECT * FROM media_texts WHERE file_unique_id = ?',
+            (file_unique_id,)
+        )
+
+    async def save_media_text(self, file_unique_id: str, kind: str, text: str) -> bool:
+        """保存媒体文本，同一文件只保留一份"""
+        return await self.execute(
+            'INSERT OR REPLACE INTO media_texts (file_unique_id, kind, text) VALUES (?, ?, ?)',
+            (file_unique_id, kind, text)
+        )
+
+    async def get_document_chunks(self, file_unique_id: str) -> Dict[int, str]:
+        """获取文档已完成的分段总结"""
+        rows = await self.fetch_all(
+            'SELECT chunk_index, summary FROM document_chunks WHERE file_unique_id = ?',
+            (file_unique_id,)
+        )
+        return {row['chunk_index']: row['summary'] for row in rows}
+
+    async def save_document_chunk(self, file_unique_id: str, chunk_index: int, summary: str) -> bool:
+        """保存文档分段总结"""
+        return await self.execute(
+            'INSERT OR REPLACE INTO document_chunks (file_unique_id, chunk_index, summary) VALUES (?, ?, ?)',
+            (file_unique_id, chunk_index, summary)
+        )
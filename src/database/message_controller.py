@@ -1,4 +1,4 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncGenerator, Tuple, Union
 import json
 from .base_controller import BaseController
 
@@ -32,25 +32,16 @@ class MessageController(BaseController):
         return data
 
     async def save_message(self, message_data: Dict[str, Any]) -> bool:
-        """保存或更新消息"""
+        """保存或更新消息，单条语句完成，不先查询是否存在"""
         metadata_json = json.dumps(message_data.get('metadata', {}), ensure_ascii=False)
-        
-        if await self.get_message(message_data['message_id'], message_data['chat_id']):
-            return await self.execute('''
-                UPDATE messages 
-                SET text = ?, metadata = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE message_id = ? AND chat_id = ?
-            ''', (
-                message_data.get('text'),
-                metadata_json,
-                message_data['message_id'],
-                message_data['chat_id']
-            ))
-        
         return await self.execute('''
             INSERT INTO messages 
             (message_id, chat_id, user_id, text, type, chat_type, reply_to_message_id, metadata)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(message_id, chat_id) DO UPDATE SET
+                text = excluded.text,
+                metadata = excluded.metadata,
+                updated_at = CURRENT_TIMESTAMP
         ''', (
             message_data['message_id'],
             message_data['chat_id'],
@@ -95,6 +86,88 @@ class MessageController(BaseController):
             message['metadata'] = json.loads(message['metadata']) if message['metadata'] else {}
         return messages 
 
+    async def iter_chat_history(
+        self,
+        chat_id: int,
+        since: Union[str, Tuple[str, ...], None] = None,
+        last_n: Optional[int] = None,
+        after_message_id: Optional[int] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """按时间顺序游标遍历用户消息，用于聊天记录总结
+
+        Args:
+            since: SQLite 时间修饰符，如 '-2 hours'，多个修饰符用元组传入
+            last_n: 仅取最近 N 条
+            after_message_id: 仅取该消息之后的记录
+        """
+        conditions = ["m.chat_id = ?", "m.type = 'user_message'", "m.text IS NOT NULL", "m.text != ''"]
+        params: List[Any] = [chat_id]
+        if since:
+            modifiers = (since,) if isinstance(since, str) else tuple(since)
+            conditions.append(f"m.created_at >= datetime('now', {', '.join('?' * len(modifiers))})")
+            params.extend(modifiers)
+        if after_message_id:
+            conditions.append("m.message_id > ?")
+            params.append(after_message_id)
+        if last_n:
+            conditions.append('''m.message_id >= COALESCE((
+                SELECT message_id FROM messages
+                WHERE chat_id = ? AND type = 'user_message' AND text IS NOT NULL AND text != ''
+                ORDER BY message_id DESC LIMIT 1 OFFSET ?
+            ), 0)''')
+            params.extend([chat_id, last_n - 1])
+
+        query = f'''
+            SELECT m.message_id, m.user_id, m.text, m.created_at,
+                   strftime('%H:%M', m.created_at, 'localtime') AS local_time,
+                   strftime('%Y-%m-%d %H:00', m.created_at, 'localtime') AS local_hour,
+                   COALESCE(u.username, u.first_name, json_extract(m.metadata, '$.sender'), CAST(m.user_id AS TEXT)) AS sender
+            FROM messages m
+            LEFT JOIN users u ON u.user_id = m.user_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY m.message_id ASC
+        '''
+        async for row in self.iter_rows(query, tuple(params)):
+            yield row
+
+    async def get_recent_turns(self, chat_id: int, limit: int = 20) -> List[Dict[str, Any]]:
+        """获取最近的对话消息（不含元数据），按时间正序"""
+        rows = await self.fetch_all('''
+            SELECT message_id, user_id, text, type FROM messages
+            WHERE chat_id = ? AND text IS NOT NULL AND text != ''
+            ORDER BY message_id DESC LIMIT ?
+        ''', (chat_id, limit))
+        return rows[::-1]
+
+    async def get_reply_chain(self, chat_id: int, message_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        """沿回复关系向上获取消息及其祖先（不含元数据），按时间正序"""
+        rows = await self.fetch_all('''
+            WITH RECURSIVE chain(message_id, reply_to_message_id, text, type, depth) AS (
+                SELECT message_id, reply_to_message_id, text, type, 0 FROM messages
+                WHERE chat_id = ? AND message_id = ?
+
+                UNION ALL
+
+                SELECT m.message_id, m.reply_to_message_id, m.text, m.type, c.depth + 1 FROM messages m
+                INNER JOIN chain c ON m.message_id = c.reply_to_message_id
+                WHERE m.chat_id = ? AND c.depth + 1 < ?
+            )
+            SELECT message_id, text, type FROM chain
+            WHERE text IS NOT NULL AND text != ''
+            ORDER BY message_id
+        ''', (chat_id, message_id, chat_id, limit))
+        return rows
+
+    async def count_messages_after(self, chat_id: int, after_message_id: int) -> Dict[str, Any]:
+        """统计某消息之后的用户消息数量及最早的小时（本地时间）"""
+        return await self.fetch_one('''
+            SELECT COUNT(*) AS count,
+                   MIN(strftime('%Y-%m-%d %H:00', created_at, 'localtime')) AS first_hour
+            FROM messages
+            WHERE chat_id = ? AND message_id > ? AND type = 'user_message'
+              AND text IS NOT NULL AND text != ''
+        ''', (chat_id, after_message_id))
+
     async def update_message(self, message_data: Dict[str, Any]) -> bool:
         """更新消息内容"""
         metadata_json = json.dumps(message_data.get('metadata', {}), ensure_ascii=False)
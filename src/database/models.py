@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from typing import Optional, Dict, Any
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 
 @dataclass
 class Message:
@@ -38,12 +38,32 @@ class User:
     def to_dict(self) -> Dict[str, Any]:
         return {k: v for k, v in self.__dict__.items() if v is not None}
 
-    @property
+    def usage_today(self, today: Optional[str] = None) -> int:
+        """当日（UTC，与 increment_usage 的 date('now') 一致）已使用次数"""
+        today = today or datetime.now(timezone.utc).date().isoformat()
+        if str(self.last_usage_date or '')[:10] != today:
+            return 0
+        return self.daily_usage_count
+
     def can_use(self, daily_limit: int = 50) -> bool:
         """检查用户是否可以继续使用"""
-        if self.last_usage_date != date.today():
-            return True
-        return self.daily_usage_count < daily_limit 
+        return self.usage_today() < daily_limit
+
+# 投稿状态机：pending → polling → approved/rejected → published
+VOTE_PENDING = "pending"
+VOTE_POLLING = "polling"
+VOTE_APPROVED = "approved"
+VOTE_REJECTED = "rejected"
+VOTE_PUBLISHED = "published"
+
+# 目标状态 → 允许的前置状态
+VOTE_TRANSITIONS = {
+    VOTE_POLLING: (VOTE_PENDING,),
+    # 状态机上线前发起的投票仍停留在 pending
+    VOTE_APPROVED: (VOTE_POLLING, VOTE_PENDING),
+    VOTE_REJECTED: (VOTE_POLLING, VOTE_PENDING),
+    VOTE_PUBLISHED: (VOTE_APPROVED,),
+}
 
 @dataclass
 class Vote:
@@ -58,7 +78,7 @@ class Vote:
     introduction: Optional[str] = None  # 投票介绍
     message_id: Optional[int] = None  # 投票消息ID
     chat_id: Optional[int] = None  # 群组ID
-    status: str = "pending"  # 状态：pending/approved/rejected
+    status: str = "pending"  # 状态：pending/polling/approved/rejected/published
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
     metadata: Dict[str, Any] = None
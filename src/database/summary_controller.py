@@ -0,0 +1,106 @@
+from typing import Optional, Dict, Any, List
+from .base_controller import BaseController
+
+class SummaryController(BaseController):
+    async def init(self):
+        """初始化总结缓存表"""
+        await self.execute('''
+            CREATE TABLE IF NOT EXISTS summary_chunks (
+                range_hash TEXT PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                first_message_id INTEGER NOT NULL,
+                last_message_id INTEGER NOT NULL,
+                message_count INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        await self.execute('''
+            CREATE TABLE IF NOT EXISTS summary_checkpoints (
+                chat_id INTEGER NOT NULL,
+                level TEXT NOT NULL,
+                period_start TEXT NOT NULL,
+                first_message_id INTEGER NOT NULL,
+                last_message_id INTEGER NOT NULL,
+                message_count INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (chat_id, level, period_start)
+            )
+        ''')
+
+    async def get_chunk_summary(self, range_hash: str) -> Optional[Dict[str, Any]]:
+        """获取分块总结缓存"""
+        return await self.fetch_one(
+            'SELECT * FROM summary_chunks WHERE range_hash = ?',
+            (range_hash,)
+        )
+
+    async def save_chunk_summary(self, chunk_data: Dict[str, Any]) -> bool:
+        """保存分块总结缓存"""
+        return await self.execute('''
+            INSERT OR REPLACE INTO summary_chunks
+            (range_hash, chat_id, first_message_id, last_message_id, message_count, summary)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (
+            chunk_data['range_hash'],
+            chunk_data['chat_id'],
+            chunk_data['first_message_id'],
+            chunk_data['last_message_id'],
+            chunk_data['message_count'],
+            chunk_data['summary']
+        ))
+
+    async def get_checkpoint(self, chat_id: int, level: str, period_start: str) -> Optional[Dict[str, Any]]:
+        """获取总结检查点，level 为 hour/day，period_start 为本地时间"""
+        return await self.fetch_one(
+            'SELECT * FROM summary_checkpoints WHERE chat_id = ? AND level = ? AND period_start = ?',
+            (chat_id, level, period_start)
+        )
+
+    async def save_checkpoint(self, checkpoint: Dict[str, Any]) -> bool:
+        """保存或覆盖总结检查点"""
+        return await self.execute('''
+            INSERT OR REPLACE INTO summary_checkpoints
+            (chat_id, level, period_start, first_message_id, last_message_id, message_count, summary, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (
+            checkpoint['chat_id'],
+            checkpoint['level'],
+            checkpoint['period_start'],
+            checkpoint['first_message_id'],
+            checkpoint['last_message_id'],
+            checkpoint['message_count'],
+            checkpoint['summary']
+        ))
+
+    async def get_checkpoints(self, chat_id: int, level: str, period_prefix: str) -> List[Dict[str, Any]]:
+        """按时间顺序获取某时段前缀下的检查点，如某天的全部小时检查点"""
+        return await self.fetch_all('''
+            SELECT * FROM summary_checkpoints
+            WHERE chat_id = ? AND level = ? AND period_start LIKE ?
+            ORDER BY period_start ASC
+        ''', (chat_id, level, f"{period_prefix}%"))
+
+    async def get_last_checkpoint_message_id(self, chat_id: int, level: str = 'hour') -> Optional[int]:
+        """获取已归档的最后一条消息ID"""
+        data = await self.fetch_one(
+            'SELECT MAX(last_message_id) AS last_id FROM summary_checkpoints WHERE chat_id = ? AND level = ?',
+            (chat_id, level)
+        )
+        return data['last_id'] if data else None
+
+    async def get_pending_days(self, chat_id: int) -> List[str]:
+        """获取已结束但日总结落后于小时总结的日期"""
+        rows = await self.fetch_all('''
+            SELECT substr(h.period_start, 1, 10) AS day
+            FROM summary_checkpoints h
+            WHERE h.chat_id = ? AND h.level = 'hour'
+              AND substr(h.period_start, 1, 10) < date('now', 'localtime')
+            GROUP BY substr(h.period_start, 1, 10)
+            HAVING MAX(h.last_message_id) > COALESCE((
+                SELECT d.last_message_id FROM summary_checkpoints d
+                WHERE d.chat_id = ? AND d.level = 'day' AND d.period_start = substr(h.period_start, 1, 10)
+            ), 0)
+        ''', (chat_id, chat_id))
+        return [row['day'] for row in rows]
@@ -1,4 +1,4 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
 from .base_controller import BaseController
 import json
@@ -86,4 +86,20 @@ class UserController(BaseController):
                 END,
                 last_active_at = CURRENT_TIMESTAMP
             WHERE user_id = ?
-        ''', (user_id,)) 
\ No newline at end of file
+        ''', (user_id,)) 
+
+    async def add_usage(self, usages: List[Tuple[int, int]]) -> bool:
+        """批量累加使用次数，元素为 (user_id, 次数)"""
+        return await self.execute_many('''
+            UPDATE users 
+            SET 
+                total_usage_count = total_usage_count + ?,
+                daily_usage_count = CASE 
+                    WHEN date(last_usage_date) = date('now') 
+                    THEN daily_usage_count + ? 
+                    ELSE ? 
+                END,
+                last_usage_date = date('now'),
+                last_active_at = CURRENT_TIMESTAMP
+            WHERE user_id = ?
+        ''', [(count, count, count, user_id) for user_id, count in usages])
@@ -1,5 +1,6 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from .base_controller import BaseController
+from .models import VOTE_PENDING
 import json
 
 class VoteController(BaseController):
@@ -24,9 +25,47 @@ class VoteController(BaseController):
                 UNIQUE(original_message_id, original_chat_id)
             )
         ''')
+        await self.execute('''
+            CREATE TABLE IF NOT EXISTS vote_fingerprints (
+                vote_id INTEGER PRIMARY KEY,
+                simhash INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        await self.execute('''
+            CREATE TABLE IF NOT EXISTS vote_tallies (
+                vote_id INTEGER PRIMARY KEY,
+                poll_id TEXT NOT NULL UNIQUE,
+                message_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                yes_count INTEGER DEFAULT 0,
+                no_count INTEGER DEFAULT 0,
+                opened_at INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        await self.execute('''
+            CREATE TABLE IF NOT EXISTS publish_queue (
+                vote_id INTEGER PRIMARY KEY,
+                content TEXT NOT NULL,
+                status TEXT DEFAULT 'queued',
+                attempts INTEGER DEFAULT 0,
+                not_before INTEGER DEFAULT 0,
+                enqueued_at INTEGER NOT NULL,
+                sent_at INTEGER,
+                channel_message_id INTEGER
+            )
+        ''')
+        await self.execute(
+            'CREATE INDEX IF NOT EXISTS idx_publish_queue_status ON publish_queue(status, not_before)'
+        )
 
     async def save_vote(self, vote_data: Dict[str, Any]) -> bool:
-        """保存投票信息"""
+        """保存投票信息
+
+        已存在的投稿只在 pending 时更新投稿人和内容，不改动状态和已生成的分析，
+        重复 /submit 不会把投票中或已处理的投稿打回 pending。
+        """
         metadata_json = json.dumps(vote_data.get('metadata', {}), ensure_ascii=False)
         
         if await self.get_vote_by_original(vote_data['original_message_id'], vote_data['original_chat_id']):
@@ -34,25 +73,16 @@ class VoteController(BaseController):
                 UPDATE votes 
                 SET username = ?,
                     contribute = ?,
-                    analyse = ?,
-                    introduction = ?,
-                    message_id = ?,
-                    chat_id = ?,
-                    status = ?,
                     metadata = ?,
                     updated_at = CURRENT_TIMESTAMP
-                WHERE original_message_id = ? AND original_chat_id = ?
+                WHERE original_message_id = ? AND original_chat_id = ? AND status = ?
             ''', (
                 vote_data.get('username'),
                 vote_data.get('contribute'),
-                vote_data.get('analyse'),
-                vote_data.get('introduction'),
-                vote_data.get('message_id'),
-                vote_data.get('chat_id'),
-                vote_data.get('status', 'pending'),
                 metadata_json,
                 vote_data['original_message_id'],
-                vote_data['original_chat_id']
+                vote_data['original_chat_id'],
+                VOTE_PENDING
             ))
         
         return await self.execute('''
@@ -113,6 +143,27 @@ class VoteController(BaseController):
             WHERE vote_id = ?
         ''', (status, vote_id)) 
 
+    async def transition_status(self, vote_id: int, from_statuses: Tuple[str, ...], to_status: str) -> bool:
+        """原子地变更投票状态，仅当当前状态属于 from_statuses 时成功"""
+        placeholders = ', '.join('?' * len(from_statuses))
+        return await self.execute_rowcount(f'''
+            UPDATE votes
+            SET status = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE vote_id = ? AND status IN ({placeholders})
+        ''', (to_status, vote_id, *from_statuses)) == 1
+
+    async def get_votes_by_status(self, statuses: Tuple[str, ...]) -> List[Dict[str, Any]]:
+        """获取处于指定状态的投票，用于重启后恢复"""
+        placeholders = ', '.join('?' * len(statuses))
+        votes = await self.fetch_all(
+            f'SELECT * FROM votes WHERE status IN ({placeholders}) ORDER BY vote_id ASC',
+            tuple(statuses)
+        )
+        for vote in votes:
+            vote['metadata'] = json.loads(vote['metadata']) if vote['metadata'] else {}
+        return votes
+
     async def get_vote_by_original(self, original_message_id: int, original_chat_id: int) -> Optional[Dict[str, Any]]:
         """通过原始消息ID获取投票"""
         data = await self.fetch_one(
@@ -141,4 +192,97 @@ class VoteController(BaseController):
                 chat_id = ?,
                 updated_at = CURRENT_TIMESTAMP
             WHERE vote_id = ?
-        ''', (message_id, chat_id, vote_id)) 
\ No newline at end of file
+        ''', (message_id, chat_id, vote_id))
+
+    async def save_fingerprint(self, vote_id: int, simhash: int) -> bool:
+        """保存投稿文本指纹"""
+        return await self.execute('''
+            INSERT OR REPLACE INTO vote_fingerprints (vote_id, simhash)
+            VALUES (?, ?)
+        ''', (vote_id, simhash))
+
+    async def get_fingerprints(self) -> List[Dict[str, Any]]:
+        """获取全部投稿指纹"""
+        return await self.fetch_all('SELECT vote_id, simhash FROM vote_fingerprints')
+
+    async def save_tally(self, vote_id: int, poll_id: str, message_id: int, chat_id: int, opened_at: int) -> bool:
+        """登记投票对应的群内 poll"""
+        return await self.execute('''
+            INSERT OR REPLACE INTO vote_tallies
+            (vote_id, poll_id, message_id, chat_id, opened_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (vote_id, poll_id, message_id, chat_id, opened_at))
+
+    async def update_tallies(self, tallies: List[Tuple[int, int, int]]) -> bool:
+        """批量写入计票结果 (yes_count, no_count, vote_id)"""
+        return await self.execute_many('''
+            UPDATE vote_tallies
+            SET yes_count = ?,
+                no_count = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE vote_id = ?
+        ''', tallies)
+
+    async def get_open_tallies(self) -> List[Dict[str, Any]]:
+        """获取仍在投票中的计票记录"""
+        return await self.fetch_all('''
+            SELECT t.* FROM vote_tallies t
+            JOIN votes v ON v.vote_id = t.vote_id
+            WHERE v.status = 'polling'
+        ''')
+
+    async def enqueue_publish(self, vote_id: int, content: str, enqueued_at: int) -> bool:
+        """加入发布队列，同一投稿只会入队一次"""
+        return await self.execute_rowcount('''
+            INSERT OR IGNORE INTO publish_queue (vote_id, content, enqueued_at)
+            VALUES (?, ?, ?)
+        ''', (vote_id, content, enqueued_at)) == 1
+
+    async def get_due_publish(self, now: int, limit: int) -> List[Dict[str, Any]]:
+        """获取已到发布时间的队列项，附带投稿者ID"""
+        return await self.fetch_all('''
+            SELECT q.*, v.user_id FROM publish_queue q
+            JOIN votes v ON v.vote_id = q.vote_id
+            WHERE q.status = 'queued' AND q.not_before <= ?
+            ORDER BY q.enqueued_at ASC
+            LIMIT ?
+        ''', (now, limit))
+
+    async def get_publish_ids(self, status: str) -> List[int]:
+        """获取处于指定状态的队列项"""
+        rows = await self.fetch_all('SELECT vote_id FROM publish_queue WHERE status = ?', (status,))
+        return [row['vote_id'] for row in rows]
+
+    async def set_publish_status(
+        self,
+        vote_ids: List[int],
+        from_status: str,
+        to_status: str,
+        **fields: Any
+    ) -> int:
+        """批量变更队列项状态，仅更新当前处于 from_status 的项，返回影响行数"""
+        assignments = ''.join(f', {name} = ?' for name in fields)
+        placeholders = ', '.join('?' * len(vote_ids))
+        return await self.execute_rowcount(f'''
+            UPDATE publish_queue
+            SET status = ?{assignments}
+            WHERE status = ? AND vote_id IN ({placeholders})
+        ''', (to_status, *fields.values(), from_status, *vote_ids))
+
+    async def defer_publish(self, vote_ids: List[int], not_before: int) -> int:
+        """发送失败后退回队列，延后到 not_before 再试"""
+        placeholders = ', '.join('?' * len(vote_ids))
+        return await self.execute_rowcount(f'''
+            UPDATE publish_queue
+            SET status = 'queued',
+                attempts = attempts + 1,
+                not_before = ?
+            WHERE status = 'sending' AND vote_id IN ({placeholders})
+        ''', (not_before, *vote_ids))
+
+    async def get_publish_depth(self) -> Dict[str, int]:
+        """各状态的队列项数量"""
+        rows = await self.fetch_all(
+            'SELECT status, COUNT(*) AS count FROM publish_queue GROUP BY status'
+        )
+        return {row['status']: row['count'] for row in rows}
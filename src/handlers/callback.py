@@ -1,4 +1,6 @@
 import re
+import html
+import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 import logging
@@ -16,6 +18,9 @@ from utils.buttons import (
 )
 from handlers.vote_handler import VoteHandler
 from utils.response_controller import ResponseController
+from utils.telegram_client import run_concurrently
+from database.models import VOTE_APPROVED, VOTE_POLLING, VOTE_TRANSITIONS
+from utils.envelope import forward_origin
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +30,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     query = update.callback_query
     
     # 检查用户权限
-    if query.data in ['admin_approve', 'admin_reject']:
+    if query.data.startswith(('admin_approve', 'admin_reject')):
         if not await response_controller.is_user_admin(query.from_user.id, context):
             await query.answer("仅管理员可操作", show_alert=True)
             return
@@ -34,6 +39,10 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if await response_controller.is_user_blacklisted(query.from_user.id, context):
         await query.answer("你已被禁止使用此功能", show_alert=True)
         return
+
+    if query.data == 'stop_generation':
+        await stop_generation(query, context, response_controller)
+        return
         
     await query.answer()
 
@@ -63,16 +72,10 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 context.user_data['generation_chat_id'] = generation_message.chat_id
                 
                 try:
-                    last_text = ""
-                    async for accumulated_text, should_update in get_ai_response(original_text, prompt):
-                        if should_update:
-                            last_text = accumulated_text
-                            await handler.edit_message(generation_message, accumulated_text, parse_mode='Markdown')
-                    
-                    await handler.edit_message(
+                    await handler.stream_process_message(
+                        get_ai_response(original_text, prompt),
                         generation_message,
-                        last_text,
-                        parse_mode='Markdown'
+                        parse_mode='HTML'
                     )
                 except Exception as e:
                     logger.error(f"Failed to generate content: {e}")
@@ -89,25 +92,9 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await query.message.edit_text(text=query.message.text)
         
     elif query.data == 'start_vote':
-        # 从forward_origin获取原始消息信息
+        # 获取原始消息信息（频道转发时为原频道消息）
         original_message = context.user_data.get('original_message')
-        
-        # 从api_kwargs中获取forward_origin信息
-        forward_origin = original_message.api_kwargs.get('forward_origin') if hasattr(original_message, 'api_kwargs') else None
-        
-        if forward_origin and forward_origin.get('type') == 'channel':
-            # 如果是从频道转发的消息
-            chat_info = forward_origin.get('chat', {})
-            original_chat_id = chat_info.get('id')
-            original_message_id = forward_origin.get('message_id')
-        elif original_message.forward_from_chat:
-            # 兼容旧的转发消息格式
-            original_chat_id = original_message.forward_from_chat.id
-            original_message_id = original_message.forward_from_message_id
-        else:
-            # 普通消息
-            original_chat_id = original_message.chat_id
-            original_message_id = original_message.message_id
+        original_chat_id, original_message_id = forward_origin(original_message)
         
         # 获取投票数据
         vote_data = await context.bot_data['db'].get_vote_by_original(
@@ -119,81 +106,137 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             await handler.send_notification("投票数据不存在")
             return
         
-        # 更新分析内容
-        classification_result = context.user_data.get('classification_result', '新投稿')  # 添加默认值
-        await context.bot_data['db'].update_vote_content(
+        # 先原子地占用 pending→polling 状态，重复点击或并发点击只有一次能发起投票
+        if not await context.bot_data['db'].transition_vote(vote_data.vote_id, VOTE_POLLING):
+            await handler.send_notification("该投稿已发起投票或已处理", auto_delete=True)
+            return
+        try:
+            await publish_vote_poll(handler, context, query, original_message, vote_data)
+        except Exception:
+            await context.bot_data['db'].revert_vote_polling(vote_data.vote_id)
+            raise
+
+    elif query.data.startswith(('admin_approve', 'admin_reject')):
+        vote_handler = VoteHandler(handler)
+        try:
+            # 回调数据携带 vote_id，旧按钮按投票消息查找
+            action_name, _, vote_id = query.data.partition(':')
+            if vote_id.isdigit():
+                vote = await context.bot_data['db'].get_vote(int(vote_id))
+            else:
+                vote = await context.bot_data['db'].get_vote_by_message(query.message.message_id, GROUP_ID)
+            if not vote:
+                await handler.send_notification("投票数据不存在", auto_delete=True)
+                return
+            if vote.status not in VOTE_TRANSITIONS[VOTE_APPROVED]:
+                await handler.send_notification("该投稿已处理", auto_delete=True)
+                return
+
+            # 按顺序执行：先完成管理员的状态变更，再丢弃计票并关闭投票，
+            # 避免关闭投票触发的自动结算抢先按票数改变状态
+            if action_name == 'admin_approve':
+                action, notice = vote_handler.admin_approve(context, vote), "✅ 管理员已通过"
+            else:
+                action, notice = vote_handler.admin_reject(context, vote), "❌ 管理员已拒绝"
+            if not await action:
+                await handler.send_notification("该投稿已处理", auto_delete=True)
+                return
+
+            tally = context.bot_data['vote_tally'].find(vote.vote_id)
+            if tally:
+                context.bot_data['vote_tally'].discard(tally.poll_id)
+            try:
+                await context.bot.stop_poll(GROUP_ID, query.message.message_id)
+            except Exception as e:
+                # 投票可能已关闭或被删除，不影响管理员操作的结果
+                logger.warning(f"Failed to stop poll for vote {vote.vote_id}: {e}")
+            await handler.send_message(notice, reply_to_message_id=query.message.message_id)
+        except Exception as e:
+            logger.error(f"Failed to handle admin action: {e}")
+            await handler.send_notification(
+                "操作失败，请重试",
+                auto_delete=True
+            )
+
+
+async def stop_generation(query, context: ContextTypes.DEFAULT_TYPE, response_controller: ResponseController) -> None:
+    """停止按钮：仅发起者或管理员可停止，生成任务取消后由 stream_process_message 收尾"""
+    cancellations = context.bot_data['cancellations']
+    chat_id, message_id = query.message.chat_id, query.message.message_id
+    owner = cancellations.owner(chat_id, message_id)
+    if owner is None:
+        await query.answer("生成已结束")
+        return
+    if owner != query.from_user.id and not await response_controller.is_user_admin(query.from_user.id, context):
+        await query.answer("只有发起者可以停止", show_alert=True)
+        return
+    cancellations.cancel(chat_id, message_id)
+    await query.answer("已停止生成")
+
+
+async def publish_vote_poll(handler, context: ContextTypes.DEFAULT_TYPE, query, original_message, vote_data) -> None:
+    """转发投稿并在群组发起投票，调用前投票已进入 polling 状态"""
+    # 更新分析内容
+    classification_result = context.user_data.get('classification_result', '新投稿')  # 添加默认值
+    # 内容分页时按钮消息只有最后一页，优先使用完整的生成内容
+    generated_text = context.user_data.get('generated_text')
+    analyse_text = html.unescape(re.sub(r'<[^>]+>', '', generated_text)).strip() if generated_text else query.message.text
+    # 更新分析内容的同时转发原始消息到群组
+    _, forwarded = await asyncio.gather(
+        context.bot_data['db'].update_vote_content(
             vote_data.vote_id,
-            query.message.text,  # 分析内容
+            analyse_text,  # 分析内容
             classification_result  # 投票介绍
-        )
-        
-        # 转发原始消息到群组
-        forwarded = await context.bot.forward_message(
+        ),
+        context.bot.forward_message(
             chat_id=GROUP_ID,
             from_chat_id=original_message.chat_id,
             message_id=original_message.message_id
         )
+    )
 
-        result_to_text = re.sub(r'<i>.*?</i>|<blockquote expandable>|</blockquote>', '', classification_result)
-        
-        # 发起投票
-        vote_text = (
-            f"{result_to_text}\n"
-            f" | [用户 @{vote_data.username} 发起了投稿]\n"
-        )
-        
-        vote_message = await context.bot.send_poll(
-            chat_id=GROUP_ID,
-            question=vote_text[:300],
-            options=["👍 同意", "👎 反对"],
-            is_anonymous=True,
-            reply_to_message_id=forwarded.message_id,
-            reply_markup=get_vote_buttons(),
-            explanation=vote_data.analyse,
-            explanation_parse_mode='HTML'
-        )
-        # 清除私聊中的按钮
-        text_to_html = "<blockquote expandable>\n" + query.message.text + "\n</blockquote>"
-        # await query.message.edit_text(text=query.message.text, parse_mode="HTML", reply_markup=None)
-        await handler.edit_message(
+    result_to_text = re.sub(r'<i>.*?</i>|<blockquote expandable>|</blockquote>', '', classification_result)
+    
+    # 发起投票
+    vote_text = (
+        f"{result_to_text}\n"
+        f" | [用户 @{vote_data.username} 发起了投稿]\n"
+    )
+    
+    vote_message = await context.bot.send_poll(
+        chat_id=GROUP_ID,
+        question=vote_text[:300],
+        options=["👍 同意", "👎 反对"],
+        is_anonymous=True,
+        reply_to_message_id=forwarded.message_id,
+        reply_markup=get_vote_buttons(vote_data.vote_id),
+        explanation=vote_data.analyse,
+        explanation_parse_mode='HTML'
+    )
+    # 清除私聊中的按钮
+    text_to_html = "<blockquote expandable>\n" + query.message.text + "\n</blockquote>"
+    # await query.message.edit_text(text=query.message.text, parse_mode="HTML", reply_markup=None)
+    await run_concurrently(
+        handler.edit_message(
             query.message,
             text_to_html,
             reply_markup=None,
             parse_mode='HTML',
-        )
+        ),
         # 更新投票消息ID
-        await context.bot_data['db'].update_vote_message(
+        context.bot_data['db'].update_vote_message(
             vote_data.vote_id,
             vote_message.message_id,
             GROUP_ID
+        ),
+        # 登记 poll 以便自动计票与到期结算
+        context.bot_data['db'].save_vote_tally(
+            vote_data.vote_id,
+            vote_message.poll.id,
+            vote_message.message_id,
+            GROUP_ID,
+            context.bot_data['vote_tally'].register(
+                vote_data.vote_id, vote_message.poll.id, vote_message.message_id, GROUP_ID
+            ).opened_at
         )
-
-    elif query.data in ['admin_approve', 'admin_reject']:
-        vote_handler = VoteHandler(handler)
-        try:
-            # 设置投票消息ID
-            context.chat_data['vote_message_id'] = query.message.message_id
-            context.chat_data['vote_initiator'] = query.message.reply_to_message.from_user.id if query.message.reply_to_message else None
-            
-            # 停止投票
-            await context.bot.stop_poll(GROUP_ID, query.message.message_id)
-            
-            if query.data == 'admin_approve':
-                await vote_handler.admin_approve(context)
-                # 发送新消息而不是编辑
-                await handler.send_message(
-                    f"✅ 管理员已通过",
-                    reply_to_message_id=query.message.message_id
-                )
-            else:
-                await vote_handler.admin_reject(context)
-                await handler.send_message(
-                    f"❌ 管理员已拒绝",
-                    reply_to_message_id=query.message.message_id
-                )
-        except Exception as e:
-            logger.error(f"Failed to handle admin action: {e}")
-            await handler.send_notification(
-                "操作失败，请重试",
-                auto_delete=True
-            )
\ No newline at end of file
+    )
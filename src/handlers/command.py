@@ -3,6 +3,10 @@ from telegram import Update, Chat
 from telegram.ext import ContextTypes
 from config.settings import TELEGRAM_USER_ID, CHANNEL_ID, GROUP_ID
 from services.ai_service import get_ai_response
+from services.summary_service import ChatSummarizer, parse_summary_range
+from services.ocr_service import message_text_with_image
+from services.document_service import document_kind
+from services.transcribe_service import audio_media
 from prompts.prompts import CLASSIFY_PROMPT, SUMMARY_PROMPT
 from utils.buttons import (
     get_content_options_buttons,
@@ -11,9 +15,14 @@ from utils.buttons import (
 from prompts.prompts import TECH_PROMPT, NEWS_PROMPT, CULTURE_PROMPT, KNOWLEDGE_PROMPT, CHAT_PROMPT
 from utils.telegram_handler import TelegramMessageHandler
 import re
+import html
 import asyncio
+from typing import Optional
 from utils.response_controller import ResponseController
+from utils.similarity_index import simhash, to_signed
 from database.models import Vote
+from utils.admission import admission_controlled
+from utils.envelope import envelope
 
 logger = logging.getLogger(__name__)
 
@@ -57,6 +66,7 @@ async def get_id_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             reply_to_message_id=update.message.message_id,
             auto_delete=False
         )
+@admission_controlled
 async def submit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     handler = TelegramMessageHandler(update, context)
     response_controller = ResponseController()
@@ -75,25 +85,9 @@ async def submit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
         
-    # 获取原始消息信息
+    # 获取原始消息信息（频道转发时为原频道消息）
     original_message = message.reply_to_message
-    
-    # 从api_kwargs中获取forward_origin信息
-    forward_origin = original_message.api_kwargs.get('forward_origin') if hasattr(original_message, 'api_kwargs') else None
-    
-    if forward_origin and forward_origin.get('type') == 'channel':
-        # 如果是从频道转发的消息
-        chat_info = forward_origin.get('chat', {})
-        original_chat_id = chat_info.get('id')
-        original_message_id = forward_origin.get('message_id')
-    elif original_message.forward_from_chat:
-        # 兼容旧的转发消息格式
-        original_chat_id = original_message.forward_from_chat.id
-        original_message_id = original_message.forward_from_message_id
-    else:
-        # 普通消息
-        original_chat_id = original_message.chat_id
-        original_message_id = original_message.message_id
+    original_chat_id, original_message_id = envelope(update).reply.origin
 
     # 保存基础投票数据
     vote = Vote(
@@ -108,7 +102,7 @@ async def submit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await handler.reply_to_command("保存投票失败")
         return
 
-    reply_text = message.reply_to_message.text or message.reply_to_message.caption
+    reply_text = await get_reply_content(context, message.reply_to_message)
     if not reply_text:
         await handler.reply_to_command(
             "无法处理此类型的消息",
@@ -117,62 +111,33 @@ async def submit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
 
-    try:
-        last_text = ""
-        prompt_type = None
-        analyzing_msg = await handler.send_message(
-            "正在分析内容...",
-            reply_to_message_id=message.reply_to_message.message_id
-        )
-        
-        async for classification_text, should_update in get_ai_response(reply_text, CLASSIFY_PROMPT):
-            if should_update:
-                try:
-                    cleaned_text = classification_text
-                    await handler.edit_message(analyzing_msg, cleaned_text, parse_mode='HTML')
-                    last_text = cleaned_text
-                except Exception as e:
-                    await handler.edit_message(analyzing_msg, classification_text, parse_mode=None)
-                    last_text = classification_text
-                
-                if 'TECH_PROMPT' in classification_text:
-                    selected_prompt = TECH_PROMPT
-                elif 'NEWS_PROMPT' in classification_text:
-                    selected_prompt = NEWS_PROMPT
-                elif 'CULTURE_PROMPT' in classification_text:
-                    selected_prompt = CULTURE_PROMPT
-                elif 'KNOWLEDGE_PROMPT' in classification_text:
-                    selected_prompt = KNOWLEDGE_PROMPT
-                else:
-                    selected_prompt = CHAT_PROMPT
-        
+    # 近似重复检测，命中则复用历史分析
+    similar_vote = await find_similar_vote(context, original_message_id, original_chat_id, reply_text)
+    if similar_vote:
         context.user_data['original_message'] = message.reply_to_message
-        context.user_data['classification_result'] = last_text
-        context.user_data['prompt_type'] = prompt_type
-        
-        generated_text = ""
-        generation_msg = await handler.send_message(
-            "正在生成内容...",
+        context.user_data['classification_result'] = similar_vote.introduction or ''
+        # 覆盖上次投稿留下的生成内容，start_vote 会去掉标签并反转义还原
+        context.user_data['generated_text'] = html.escape(similar_vote.analyse or '')
+        await handler.send_message(
+            f"⚠️ 该内容与投稿 #{similar_vote.vote_id} 高度相似（状态：{similar_vote.status}），已复用其分析结果",
             reply_to_message_id=message.reply_to_message.message_id
         )
-        
-        async for content_text, should_update in get_ai_response(reply_text, selected_prompt):
-            if should_update:
-                try:
-                    cleaned_text = content_text
-                    await handler.edit_message(generation_msg, cleaned_text, parse_mode='HTML')
-                    generated_text = cleaned_text
-                except Exception as e:
-                    await handler.edit_message(generation_msg, content_text, parse_mode=None)
-                    generated_text = content_text
-        
-        await handler.edit_message(
-            generation_msg,
-            generated_text,
+        await handler.send_message(
+            f"<blockquote expandable>\n{html.escape(similar_vote.analyse)}\n</blockquote>",
+            reply_to_message_id=message.reply_to_message.message_id,
             reply_markup=get_content_options_buttons(),
             parse_mode='HTML'
         )
-        
+        return
+
+    try:
+        await generate_submission_content(
+            handler,
+            context,
+            message.reply_to_message,
+            reply_text,
+            reply_to_message_id=message.reply_to_message.message_id
+        )
     except Exception as e:
         logger.error(f"Analysis failed: {e}")
         await handler.send_notification(
@@ -181,6 +146,120 @@ async def submit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             auto_delete=False
         )
 
+async def get_document_content(context: ContextTypes.DEFAULT_TYPE, message) -> Optional[str]:
+    """文档说明及文档内容（原文或摘要）"""
+    content = await context.bot_data['documents'].get_text(context.bot, context.bot_data['db'], message)
+    if not content:
+        return message.caption
+    return f"{message.caption}\n\n[文档内容]\n{content}" if message.caption else f"[文档内容]\n{content}"
+
+async def get_audio_content(context: ContextTypes.DEFAULT_TYPE, message) -> Optional[str]:
+    """音频说明及转写文字"""
+    transcript = await context.bot_data['transcriber'].get_text(context.bot, context.bot_data['db'], message)
+    if not transcript:
+        return message.caption
+    return f"{message.caption}\n\n[语音转写]\n{transcript}" if message.caption else f"[语音转写]\n{transcript}"
+
+async def get_reply_content(context: ContextTypes.DEFAULT_TYPE, message) -> Optional[str]:
+    """被引用消息的文字：图片附上识别出的文字，文档附上文档内容，语音附上转写，链接附上网页正文"""
+    if document_kind(message):
+        content = get_document_content(context, message)
+    elif audio_media(message):
+        content = get_audio_content(context, message)
+    else:
+        content = message_text_with_image(context.bot, context.bot_data['db'], message)
+    text, linked = await asyncio.gather(content, context.bot_data['links'].link_context(message))
+    if not linked:
+        return text
+    return f"{text}\n\n{linked}" if text else linked
+
+def select_content_prompt(classification_text: str) -> str:
+    """根据分类结果中的处理器标识选择生成提示词"""
+    if 'TECH_PROMPT' in classification_text:
+        return TECH_PROMPT
+    elif 'NEWS_PROMPT' in classification_text:
+        return NEWS_PROMPT
+    elif 'CULTURE_PROMPT' in classification_text:
+        return CULTURE_PROMPT
+    elif 'KNOWLEDGE_PROMPT' in classification_text:
+        return KNOWLEDGE_PROMPT
+    return CHAT_PROMPT
+
+async def generate_submission_content(
+    handler: TelegramMessageHandler,
+    context: ContextTypes.DEFAULT_TYPE,
+    source_message,
+    reply_text: str,
+    reply_to_message_id: int,
+    chat_id: Optional[int] = None
+) -> Optional[str]:
+    """分类并生成投稿内容，结果超长时自动分页"""
+    analyzing_msg = await handler.send_message(
+        "正在分析内容...",
+        chat_id=chat_id,
+        reply_to_message_id=reply_to_message_id
+    )
+    if not analyzing_msg:
+        return None
+    classification_text = await handler.stream_process_message(
+        get_ai_response(reply_text, CLASSIFY_PROMPT),
+        analyzing_msg,
+        parse_mode='HTML'
+    )
+    if not classification_text:
+        return None
+
+    context.user_data['original_message'] = source_message
+    context.user_data['classification_result'] = classification_text
+    context.user_data['prompt_type'] = None
+
+    generation_msg = await handler.send_message(
+        "正在生成内容...",
+        chat_id=chat_id,
+        reply_to_message_id=reply_to_message_id
+    )
+    if not generation_msg:
+        return None
+    generated_text = await handler.stream_process_message(
+        get_ai_response(reply_text, select_content_prompt(classification_text)),
+        generation_msg,
+        final_markup=get_content_options_buttons(),
+        parse_mode='HTML'
+    )
+    # 分页后按钮所在消息只含最后一页，完整内容留给投稿使用
+    context.user_data['generated_text'] = generated_text
+    return generated_text
+
+async def find_similar_vote(
+    context: ContextTypes.DEFAULT_TYPE,
+    original_message_id: int,
+    original_chat_id: int,
+    text: str
+) -> Optional[Vote]:
+    """登记投稿指纹，并返回已有分析结果的相似历史投稿"""
+    index = context.bot_data.get('similarity_index')
+    fingerprint = simhash(text)
+    if index is None or fingerprint is None:
+        return None
+
+    db = context.bot_data['db']
+    vote = await db.get_vote_by_original(original_message_id, original_chat_id)
+    if not vote:
+        return None
+
+    match = index.query(fingerprint, exclude=vote.vote_id)
+    if vote.vote_id not in index:
+        index.add(vote.vote_id, fingerprint)
+        await db.save_vote_fingerprint(vote.vote_id, to_signed(fingerprint))
+
+    if not match:
+        return None
+    similar_vote = await db.get_vote(match[0])
+    if not similar_vote or not similar_vote.analyse:
+        return None
+    logger.info(f"Vote {vote.vote_id} is similar to vote {similar_vote.vote_id} (distance {match[1]})")
+    return similar_vote
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     handler = TelegramMessageHandler(update, context)
     await handler.reply_to_command(
@@ -195,6 +274,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         auto_delete=False
     )
 
+@admission_controlled
 async def analyze_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     handler = TelegramMessageHandler(update, context)
     response_controller = ResponseController()
@@ -214,7 +294,7 @@ async def analyze_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
         
-    reply_text = message.reply_to_message.text or message.reply_to_message.caption
+    reply_text = await get_reply_content(context, message.reply_to_message)
     if not reply_text:
         await handler.reply_to_command(
             "无法分析此类型的消息",
@@ -224,6 +304,7 @@ async def analyze_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
 
     # 在群组中发送提示并删除
+    forwarded = None
     if chat.id == GROUP_ID:
         await handler.reply_to_command(
             "已开始分析，请前往 @rk_pin_bot 查看",
@@ -241,65 +322,14 @@ async def analyze_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
     
     try:
-        last_text = ""
-        prompt_type = None
-        analyzing_msg = await handler.send_message(
-            "正在分析内容...",
-            chat_id=user.id,
-            reply_to_message_id=forwarded.message_id
-        )
-        
-        async for classification_text, should_update in get_ai_response(reply_text, CLASSIFY_PROMPT):
-            if should_update:
-                try:
-                    # 尝试清理和修复 Markdown
-                    cleaned_text = classification_text.replace('*', '\\*').replace('_', '\\_').replace('`', '\\`')
-                    await handler.edit_message(analyzing_msg, cleaned_text, parse_mode='Markdown')
-                    last_text = cleaned_text
-                except Exception as e:
-                    # 如果 Markdown 解析失败，尝试不使用解析发送
-                    await handler.edit_message(analyzing_msg, classification_text, parse_mode=None)
-                    last_text = classification_text
-                
-                if 'TECH_PROMPT' in classification_text:
-                    selected_prompt = TECH_PROMPT
-                elif 'NEWS_PROMPT' in classification_text:
-                    selected_prompt = NEWS_PROMPT
-                elif 'CULTURE_PROMPT' in classification_text:
-                    selected_prompt = CULTURE_PROMPT
-                elif 'KNOWLEDGE_PROMPT' in classification_text:
-                    selected_prompt = KNOWLEDGE_PROMPT
-                else:
-                    selected_prompt = CHAT_PROMPT
-        
-        context.user_data['original_message'] = message.reply_to_message
-        context.user_data['classification_result'] = last_text
-        context.user_data['prompt_type'] = prompt_type
-        
-        generated_text = ""
-        generation_msg = await handler.send_message(
-            "正在生成内容...",
-            chat_id=user.id,
-            reply_to_message_id=forwarded.message_id
-        )
-        
-        async for content_text, should_update in get_ai_response(reply_text, selected_prompt):
-            if should_update:
-                try:
-                    cleaned_text = content_text.replace('*', '\\*').replace('_', '\\_').replace('`', '\\`')
-                    await handler.edit_message(generation_msg, cleaned_text, parse_mode='Markdown')
-                    generated_text = cleaned_text
-                except Exception as e:
-                    await handler.edit_message(generation_msg, content_text, parse_mode=None)
-                    generated_text = content_text
-        
-        await handler.edit_message(
-            generation_msg,
-            generated_text,
-            reply_markup=get_content_options_buttons(),
-            parse_mode='Markdown'
+        await generate_submission_content(
+            handler,
+            context,
+            message.reply_to_message,
+            reply_text,
+            reply_to_message_id=forwarded.message_id if forwarded else message.reply_to_message.message_id,
+            chat_id=user.id
         )
-        
     except Exception as e:
         logger.error(f"Analysis failed: {e}")
         await handler.send_notification(
@@ -309,6 +339,7 @@ async def analyze_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             auto_delete=False
         )
 
+@admission_controlled
 async def summarize_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     handler = TelegramMessageHandler(update, context)
     response_controller = ResponseController()
@@ -318,17 +349,15 @@ async def summarize_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
     chat = update.effective_chat
     message = update.message
+    user = update.effective_user
     
     if not message.reply_to_message:
-        await handler.reply_to_command(
-            "请引用要总结的消息使用此命令",
-            reply_to_message_id=message.message_id,
-            auto_delete=True
-        )
+        await summarize_history(handler, context, chat.id)
         return
         
-    reply_text = message.reply_to_message.text or message.reply_to_message.caption
-    if not reply_text:
+    is_document = document_kind(message.reply_to_message) is not None
+    reply_text = None if is_document else await get_reply_content(context, message.reply_to_message)
+    if not is_document and not reply_text:
         await handler.reply_to_command(
             "无法总结此类型的消息",
             reply_to_message_id=message.message_id,
@@ -338,15 +367,25 @@ async def summarize_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
     summarizing_msg = await handler.send_message("正在总结内容...", reply_to_message_id=message.reply_to_message.message_id, delete_command=True)
     
+    if not summarizing_msg:
+        return
     try:
-        last_text = ""
-        async for summary_text, should_update in get_ai_response(reply_text, SUMMARY_PROMPT):
-            if should_update and summary_text != last_text:
-                last_text = summary_text
-                await handler.edit_message(summarizing_msg, summary_text, parse_mode='Markdown')
-                    
-        if last_text != summarizing_msg.text:
-            await handler.edit_message(summarizing_msg, last_text, parse_mode='Markdown')
+        if is_document:
+            # 文档解析进度与总结共用同一条状态消息
+            processor = context.bot_data['documents'].respond(
+                context.bot,
+                context.bot_data['db'],
+                message.reply_to_message,
+                message.reply_to_message.caption or "总结这份文档",
+                SUMMARY_PROMPT
+            )
+        else:
+            processor = get_ai_response(reply_text, SUMMARY_PROMPT)
+        await handler.stream_process_message(
+            processor,
+            summarizing_msg,
+            parse_mode='HTML'
+        )
     except Exception as e:
         logger.error(f"Summarization failed: {e}")
         await handler.send_notification(
@@ -354,4 +393,31 @@ async def summarize_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             chat_id=user.id,
             reply_to_message_id=message.message_id,
             auto_delete=False
-        )
\ No newline at end of file
+        )
+
+async def summarize_history(handler: TelegramMessageHandler, context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
+    """总结聊天记录：/summarize [条数|30m|2h|1d|today]"""
+    summarizer = ChatSummarizer(context.bot_data['db'])
+    if context.args and context.args[0].lower() == 'today':
+        status_msg = await handler.send_message("正在总结今日聊天...", delete_command=True)
+        if status_msg:
+            await handler.stream_process_message(summarizer.summarize_today(chat_id), status_msg, parse_mode='HTML')
+        return
+
+    since, last_n = parse_summary_range(context.args)
+    if context.args and not (since or last_n):
+        await handler.reply_to_command(
+            "用法：引用消息使用 /summarize，或 /summarize [条数|30m|2h|1d|today] 总结聊天记录",
+            reply_to_message_id=handler.message.message_id,
+            auto_delete=True
+        )
+        return
+
+    status_msg = await handler.send_message("正在总结聊天记录...", delete_command=True)
+    if not status_msg:
+        return
+    await handler.stream_process_message(
+        summarizer.summarize(chat_id, since=since, last_n=last_n or (None if since else 100)),
+        status_msg,
+        parse_mode='HTML'
+    )
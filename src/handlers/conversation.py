@@ -2,7 +2,8 @@ import logging
 from telegram import Update, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from config.settings import TELEGRAM_USER_ID, DEFAULT_MODE, CHANNEL_ID, GROUP_ID
-from services.ai_service import get_ai_response, get_vision_response
+from services.ai_service import get_ai_response, get_vision_album_response
+from services.ocr_service import get_image_text
 from prompts.prompts import (
     CLASSIFY_PROMPT, CHAT_PROMPT, TECH_PROMPT, NEWS_PROMPT, CULTURE_PROMPT, KNOWLEDGE_PROMPT, NORMAL_PROMPT
 )
@@ -10,32 +11,73 @@ import asyncio
 import re
 from telegram.error import NetworkError, TimedOut
 from utils.telegram_handler import TelegramMessageHandler
-from utils.response_controller import ResponseController
+from utils.response_controller import ResponseController, is_addressed, persistence_policy
 from database.models import Message
+from utils.admission import ADMITTED, coalesce_key, reject_admission
+from utils.media_group import fetch_images_base64, image_file_id
+from services.video_service import VideoFrameError
+from services.transcribe_service import TranscriptionError
+from utils.envelope import Envelope, envelope
+import base64
 
 
 logger = logging.getLogger(__name__)
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    handler = TelegramMessageHandler(update, context)
-    # 获取有效消息，可能是普通消息或频道消息
+    # 先用原始字段做廉价的预筛，群组里与机器人无关的消息只按存储策略落库，不解析、不查库
     message = update.effective_message
-    logger.info(f"类型：{message.chat.type}")
+    addressed = is_addressed(update)
+    policy = persistence_policy(message.chat.id, message.chat.type)
+    env = envelope(update) if addressed or policy == 'full' else None
 
-    try:
-        message_obj = Message(
-            message_id=message.message_id,
-            chat_id=message.chat.id,
-            user_id=message.from_user.id if message.from_user else None,
-            text=message.text or message.caption,
-            type='user_message',
-            chat_type=message.chat.type,
-            reply_to_message_id=message.reply_to_message.message_id if message.reply_to_message else None,
-            metadata=update.to_dict()
-        )
-        await context.bot_data['db'].save_message(message_obj)
-    except Exception as e:
-        logger.error(f"Error saving message: {e}")  
+    if policy != 'none':
+        try:
+            metadata = env.serialized() if policy == 'full' else {}
+            if policy == 'compact' and message.from_user:
+                # 未登记的用户在聊天总结中按此显示
+                metadata['sender'] = message.from_user.username or message.from_user.first_name
+            message_obj = Message(
+                message_id=message.message_id,
+                chat_id=message.chat.id,
+                user_id=message.from_user.id if message.from_user else None,
+                text=message.text or message.caption,
+                type='user_message',
+                chat_type=message.chat.type,
+                reply_to_message_id=message.reply_to_message.message_id if message.reply_to_message else None,
+                metadata=metadata
+            )
+            await context.bot_data['db'].save_message(message_obj)
+        except Exception as e:
+            logger.error(f"Error saving message: {e}")
+
+    if not addressed:
+        return
+    handler = TelegramMessageHandler(update, context)
+    logger.info(f"类型：{env.chat_type}")
+
+    # 相册的各部分先在内存中汇总，由最先到达的更新统一处理，优先以带说明文字的部分作为代表
+    album = None
+    if message.media_group_id:
+        parts = await context.bot_data['media_groups'].collect(update)
+        if parts is None:
+            return
+        update = next((part for part in parts if part.effective_message.caption), parts[0])
+        if not is_addressed(update, collected=True):
+            return
+        env = envelope(update)
+        message = env.message
+        handler = TelegramMessageHandler(update, context)
+        album = [part.effective_message for part in parts]
+
+    # 编辑消息：连续编辑只处理最后一次，变化很小时不重新生成
+    edits = context.bot_data['edits']
+    edit_key = (env.chat_id, env.message_id)
+    if update.edited_message is not None or update.edited_channel_post is not None:
+        if not await edits.debounce(edit_key):
+            return
+        if edits.is_trivial(edit_key, env.text):
+            logger.info(f"Trivial edit of {edit_key}, skipping regeneration")
+            return
 
     response_controller = ResponseController()
     
@@ -46,13 +88,12 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if not should_respond:
         return
         
-    message_text = get_message_text(message)
+    message_text = env.text
     
     # 检查原始消息和引用消息中的媒体文件
-    has_media_result = has_media(message)
-    reply_has_media = message.reply_to_message and has_media(message.reply_to_message)[0]
+    reply_has_media = bool(env.reply and env.reply.media)
     
-    if not message_text and not has_media_result[0] and not reply_has_media:
+    if not message_text and not env.media and not reply_has_media:
         await handler.send_notification(
             "无法处理此类型的消息",
             reply_to_message_id=message.message_id,
@@ -60,55 +101,140 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
     
-    status_msg = await handler.send_message(
-        "正在处理消息...",
-        reply_to_message_id=message.message_id
+    # 编辑后的消息先取消上一版本的生成，之后复用原来的状态消息
+    previous_status = await edits.supersede(edit_key) if is_update else None
+
+    # 准入控制：同一用户对同一被回复消息的重复请求合并，过载时低优先级延后、超限快速回复繁忙
+    admission = context.bot_data['admission']
+    priority = response_controller.response_priority(env, chat_type)
+    async with admission.admit(priority, coalesce_key(update, 'message')) as decision:
+        if decision != ADMITTED:
+            # analyze_update 已扣除额度，未处理的请求退还
+            if env.chat_type != 'channel' and update.effective_user:
+                context.bot_data['quota'].refund(update.effective_user.id, env.chat_id)
+            await reject_admission(update, context, decision)
+            return
+
+        if previous_status and await handler.edit_message(previous_status, "正在根据修改后的消息重新处理..."):
+            status_msg = previous_status
+        else:
+            status_msg = await handler.send_message(
+                "正在处理消息...",
+                reply_to_message_id=message.message_id
+            )
+        if not status_msg:
+            return
+
+        # 相册中的图片合并为一次请求；如果引用消息包含媒体，优先处理引用消息的媒体
+        if album and any(image_file_id(part) for part in album):
+            processor = process_album_with_ai(album, message_text, chat_type, handler, status_msg)
+        elif reply_has_media:
+            processor = process_message_with_ai(env.reply, message_text, chat_type, handler, status_msg)
+        else:
+            processor = process_message_with_ai(env, message_text, chat_type, handler, status_msg)
+        await edits.run(edit_key, status_msg, message_text, processor)
+
+async def process_album_with_ai(album, message_text: str, chat_type: str, handler, status_msg) -> None:
+    """并发下载相册中的全部图片，合并为一次（或按 provider 上限分批的）视觉请求"""
+    images = await fetch_images_base64(handler.context.bot, album)
+    if not images:
+        await handler.edit_message(status_msg, "图片获取失败，请重试")
+        return
+    logger.info(f"相册共 {len(album)} 部分，{len(images)} 张图片")
+
+    prompt = CHAT_PROMPT if chat_type == 'private' else NORMAL_PROMPT
+    await handler.stream_process_message(
+        get_vision_album_response(message_text or f"分析这{len(images)}张图片", prompt, images),
+        status_msg,
+        parse_mode='HTML'
     )
-    if not status_msg:
+
+async def process_video_with_ai(message, message_text: str, chat_type: str, handler, status_msg) -> None:
+    """抽取视频/动图的关键帧，按时间顺序作为一次多图视觉请求"""
+    try:
+        frames = await handler.context.bot_data['video_frames'].get_frames(handler.context.bot, message)
+    except VideoFrameError as e:
+        await handler.edit_message(status_msg, str(e))
+        return
+    if not frames:
+        await handler.edit_message(status_msg, "未能从视频中提取画面")
         return
 
-    # 如果引用消息包含媒体，优先处理引用消息的媒体
-    if reply_has_media:
-        await process_message_with_ai(message.reply_to_message, message_text, chat_type, handler, status_msg)
-    else:
-        await process_message_with_ai(message, message_text, chat_type, handler, status_msg)
-
-def has_media(message) -> tuple[bool, str]:
-    """
-    检查消息是否包含媒体文件
-    返回: (是否包含媒体, 媒体类型)
-    """
-    if message.photo:
-        return True, "photo"
-    elif message.document and message.document.mime_type and message.document.mime_type.startswith('image/'):
-        return True, "photo"
-    elif message.video:
-        return True, "video"
-    elif message.document and message.document.mime_type and message.document.mime_type.startswith('video/'):
-        return True, "video"
-    return False, ""
-
-async def process_message_with_ai(message, message_text: str, chat_type: str, handler, status_msg) -> None:
+    images = [base64.b64encode(frame).decode('utf-8') for frame in frames]
+    prompt = CHAT_PROMPT if chat_type == 'private' else NORMAL_PROMPT
+    await handler.stream_process_message(
+        get_vision_album_response(
+            f"以下是按时间顺序从视频中抽取的{len(images)}个关键帧。\n\n{message_text or '分析这段视频'}",
+            prompt,
+            images
+        ),
+        status_msg,
+        parse_mode='HTML'
+    )
+
+async def process_audio_with_ai(message, message_text: str, chat_type: str, handler, status_msg) -> None:
+    """语音/音频先转写为文字（按 file_unique_id 缓存），再走文本模型"""
+    try:
+        transcript = await handler.context.bot_data['transcriber'].transcribe(
+            handler.context.bot,
+            handler.context.bot_data['db'],
+            message
+        )
+    except TranscriptionError as e:
+        await handler.edit_message(status_msg, str(e))
+        return
+    except Exception as e:
+        logger.error(f"Transcription failed: {e}")
+        await handler.edit_message(status_msg, "语音转写失败，请重试")
+        return
+    if not transcript:
+        await handler.edit_message(status_msg, "没有识别到语音内容")
+        return
+
+    prompt = CHAT_PROMPT if chat_type == 'private' else NORMAL_PROMPT
+    ai_input = f"[语音转写]\n{transcript}\n\n{message_text or '回复这段语音'}"
+    await handler.stream_process_message(
+        get_ai_response(ai_input, prompt),
+        status_msg,
+        parse_mode='HTML',
+        resume={'message': ai_input, 'prompt': prompt}
+    )
+
+async def process_message_with_ai(env: Envelope, message_text: str, chat_type: str, handler, status_msg) -> None:
     """处理消息并调用相应的AI服务"""
-    has_media_file, media_type = has_media(message)
+    message = env.message
+    media_type = env.media
     
-    if has_media_file:
+    if media_type:
         if media_type == "photo":
-            # 获取图片文件
-            if message.photo:
-                file_id = message.photo[-1].file_id  # 使用最大的图片
-            else:
-                file_id = message.document.file_id
-                
-            file = await handler.context.bot.get_file(file_id)
-            file_url = file.file_path
-
-            logger.info(f"图片地址 file_url: {file_url}")
-            
-            # 使用 vision response 处理
+            # 图片先识别为文字（按 file_unique_id 缓存），再走文本模型
+            image_text = await get_image_text(handler.context.bot, handler.context.bot_data['db'], message)
+            if not image_text:
+                await handler.edit_message(status_msg, "图片识别失败，请重试")
+                return
+
+            prompt = CHAT_PROMPT if chat_type == 'private' else NORMAL_PROMPT
+            ai_input = f"[图片内容]\n{image_text}\n\n{message_text or '分析图片'}"
+            await handler.stream_process_message(
+                get_ai_response(ai_input, prompt),
+                status_msg,
+                parse_mode='HTML',
+                resume={'message': ai_input, 'prompt': prompt}
+            )
+        elif media_type == "video":
+            await process_video_with_ai(message, message_text, chat_type, handler, status_msg)
+        elif media_type == "audio":
+            await process_audio_with_ai(message, message_text, chat_type, handler, status_msg)
+        elif media_type == "document":
             prompt = CHAT_PROMPT if chat_type == 'private' else NORMAL_PROMPT
             await handler.stream_process_message(
-                get_vision_response(message_text or "分析图片", prompt, file_url),
+                handler.context.bot_data['documents'].respond(
+                    handler.context.bot,
+                    handler.context.bot_data['db'],
+                    message,
+                    message_text or "总结这份文档",
+                    prompt
+                ),
                 status_msg,
                 parse_mode='HTML'
             )
@@ -123,93 +249,22 @@ async def process_message_with_ai(message, message_text: str, chat_type: str, ha
     else:
         # 文本处理
         prompt = CHAT_PROMPT if chat_type == 'private' else NORMAL_PROMPT
-        await handler.stream_process_message(
-            get_ai_response(message_text, prompt),
+        memory = handler.context.bot_data.get('conversation_memory') if chat_type == 'private' else None
+        ai_input = message_text
+        if memory:
+            ai_input = await memory.build_context(
+                handler.context.bot_data['db'],
+                handler.chat_id,
+                message_text,
+                exclude_message_id=message.message_id,
+                reply_to_message_id=message.reply_to_message.message_id if message.reply_to_message else None
+            )
+        result = await handler.stream_process_message(
+            get_ai_response(ai_input, prompt),
             status_msg,
-            parse_mode='HTML'
+            parse_mode='HTML',
+            resume={'message': ai_input, 'prompt': prompt}
         )
-
-def get_message_text(message) -> str:
-    """
-    从消息中提取文本内容，包括引用的消息或回复的消息
-    """
-    text = []
-    
-    # 处理引用/回复的消息
-    if message.reply_to_message:
-        quoted_text = ""
-        if message.reply_to_message.text:
-            quoted_text = message.reply_to_message.text
-        elif message.reply_to_message.caption:
-            quoted_text = message.reply_to_message.caption
-            
-        if quoted_text:
-            # 如果是回复bot的消息，添加标记
-            if (message.reply_to_message.from_user and 
-                message.reply_to_message.from_user.is_bot and 
-                message.reply_to_message.from_user.username == 'rk_pin_bot'):
-                text.append(f"[上文]\n{quoted_text}")
-            else:
-                text.append(f"[引用]\n{quoted_text}")
-    
-    # 处理当前消息
-    current_text = ""
-    if message.text:
-        current_text = message.text
-        # 如果是群组消息且@了机器人，移除@部分
-        if message.chat.type != 'private':
-            for entity in message.entities or []:
-                if entity.type == 'mention':
-                    mention = message.text[entity.offset:entity.offset + entity.length]
-                    current_text = current_text.replace(mention, '').strip()
-    elif message.caption:
-        current_text = message.caption
-        
-    # 处理文本实体（加粗、链接等）
-    if current_text and (message.entities or message.caption_entities):
-        entities = message.entities or message.caption_entities
-        current_text = process_text_with_entities(current_text, entities)
-    
-    if current_text:
-        text.append(f"[当前消息]\n{current_text}")
-    
-    return "\n\n".join(text).strip()
-
-def process_text_with_entities(text: str, entities: list) -> str:
-    """处理带格式的文本，保留格式信息"""
-    if not text or not entities:
-        return text
-    
-    # 按位置排序实体
-    sorted_entities = sorted(entities, key=lambda e: e.offset)
-    result = []
-    last_offset = 0
-    
-    for entity in sorted_entities:
-        # 添加实体前的文本
-        result.append(text[last_offset:entity.offset])
-        
-        # 获取实体文本
-        entity_text = text[entity.offset:entity.offset + entity.length]
-        
-        # 根据实体类型处理
-        if entity.type == "text_link":
-            result.append(f"{entity_text}({entity.url})")
-        elif entity.type == "bold":
-            result.append(f"**{entity_text}**")
-        elif entity.type == "italic":
-            result.append(f"*{entity_text}*")
-        elif entity.type == "code":
-            result.append(f"`{entity_text}`")
-        elif entity.type == "pre":
-            result.append(f"```\n{entity_text}\n```")
-        elif entity.type == "mention":
-            continue  # 跳过@提及
-        else:
-            result.append(entity_text)
-        
-        last_offset = entity.offset + entity.length
-    
-    # 添加剩余文本
-    result.append(text[last_offset:])
-    return "".join(result)
\ No newline at end of file
+        if memory and result:
+            memory.add_turn(handler.chat_id, 'user', message_text, message.message_id)
+            memory.add_turn(handler.chat_id, 'assistant', result, status_msg.message_id)
@@ -0,0 +1,57 @@
+from telegram.ext import ContextTypes
+import logging
+from config.response_settings import RESPONSE_SETTINGS
+from services.summary_service import ChatSummarizer
+from handlers.vote_handler import VoteHandler
+
+logger = logging.getLogger(__name__)
+
+async def rolling_summary_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """定时为允许的群组维护小时/日总结检查点"""
+    summarizer = ChatSummarizer(context.bot_data['db'])
+    for group_id in RESPONSE_SETTINGS['group_chat']['allowed_groups']:
+        try:
+            processed = await summarizer.update_checkpoints(int(group_id))
+            if processed:
+                logger.info(f"Summary checkpoint updated for chat {group_id}: {processed} messages")
+        except Exception as e:
+            logger.error(f"Failed to update summary checkpoint for chat {group_id}: {e}")
+
+async def vote_tally_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """定时批量落库计票，并结算到期的投票"""
+    vote_tally = context.bot_data['vote_tally']
+    try:
+        flushed = await vote_tally.flush(context.bot_data['db'])
+        if flushed:
+            logger.debug(f"Flushed {flushed} vote tallies")
+    except Exception as e:
+        logger.error(f"Failed to flush vote tallies: {e}")
+
+    vote_handler = VoteHandler(None)
+    for tally in vote_tally.due():
+        try:
+            decision = await vote_handler.settle(context, tally)
+            if decision:
+                logger.info(f"Vote {tally.vote_id} settled as {decision} ({tally.yes}/{tally.total})")
+        except Exception as e:
+            logger.error(f"Failed to settle vote {tally.vote_id}: {e}")
+
+async def publish_queue_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """按发布间隔从队列中发出一条频道消息"""
+    publish_queue = context.bot_data['publish_queue']
+    try:
+        published = await publish_queue.drain(context.bot)
+        depth = await publish_queue.depth()
+        if published or depth.get('queued'):
+            logger.info(f"Publish queue: published {published}, depth {depth}, {publish_queue.stats.summary()}")
+    except Exception as e:
+        logger.error(f"Failed to drain publish queue: {e}")
+
+async def quota_flush_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """把内存中累计的使用次数写回 users 表"""
+    try:
+        flushed = await context.bot_data['quota'].flush(context.bot_data['db'])
+        if flushed:
+            logger.debug(f"Reconciled usage for {flushed} users")
+    except Exception as e:
+        logger.error(f"Failed to flush usage quota: {e}")
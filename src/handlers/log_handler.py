@@ -2,7 +2,7 @@ import json
 import logging
 from datetime import datetime
 from pathlib import Path
-from telegram import Update, Message
+from telegram import Message
 from typing import Optional, Union, Dict, Any
 
 logger = logging.getLogger(__name__)
@@ -26,23 +26,23 @@ class LogHandler:
         except Exception as e:
             logger.error(f"Failed to write log: {e}")
 
-    def log_message(self, update: Update) -> None:
-        """记录完整的Update对象"""
+    def log_message(self, update_data: Dict[str, Any]) -> None:
+        """记录完整的Update对象（已序列化，见 Envelope.serialized）"""
         try:
             log_data = {
-                "update": update.to_dict()  # 记录完整的update对象
+                "update": update_data  # 记录完整的update对象
             }
             self._write_log(log_data, self.message_log_file)
         except Exception as e:
             logger.error(f"Failed to log message: {e}")
 
-    def log_bot_action(self, action_type: str, message: Message, update: Update) -> None:
+    def log_bot_action(self, action_type: str, message: Message, update_data: Dict[str, Any]) -> None:
         """记录机器人动作的Message对象"""
         try:
             log_data = {
                 "action_type": action_type,
                 "message": message.to_dict(),  # 记录发送或编辑后的消息对象
-                "update": update.to_dict()  # 记录完整的update对象
+                "update": update_data  # 记录完整的update对象（已序列化）
             }
             self._write_log(log_data, self.bot_log_file)
         except Exception as e:
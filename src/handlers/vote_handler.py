@@ -1,19 +1,23 @@
-from telegram import Update, Message, Poll
+from telegram import Update, Poll
 from telegram.ext import ContextTypes
 from typing import Optional
+import asyncio
+import html
 import logging
 from utils.telegram_handler import TelegramMessageHandler
-from config.settings import CHANNEL_ID, GROUP_ID
+from config.settings import GROUP_ID, VOTE_DURATION
 from utils.buttons import get_vote_buttons
 from utils.response_controller import ResponseController
-from database.models import Message
+from database.models import Message, Vote, VOTE_APPROVED, VOTE_REJECTED
+from handlers.log_handler import LogHandler
+from utils.vote_tally import PollTally
 
 logger = logging.getLogger(__name__)
 
 class VoteHandler:
     def __init__(self, handler: Optional[TelegramMessageHandler]):
         self.handler = handler
-        self.vote_duration = 24 * 60 * 60  # 24小时
+        self.vote_duration = VOTE_DURATION
     
     # 暂时弃用
     async def start_vote(
@@ -113,95 +117,123 @@ class VoteHandler:
             return None
 
     # 保留管理员手动操作的方法
-    async def admin_approve(self, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """管理员强制通过"""
+    async def admin_approve(self, context: ContextTypes.DEFAULT_TYPE, vote: Vote) -> bool:
+        """管理员强制通过，状态 polling → approved → published，重复点击不会重复发布"""
         response_controller = ResponseController()
         
         if not await response_controller.is_user_admin(self.handler.user_id, context):
-            return
+            return False
         
         try:
-            vote_message_id = context.chat_data.get('vote_message_id')
-            vote_message = await context.bot_data['db'].get_message(vote_message_id, GROUP_ID)
-            if vote_message:
-                vote_message.metadata['status'] = 'approved'
-                vote_message.metadata['admin_id'] = self.handler.user_id
-                await context.bot_data['db'].save_message(vote_message)
-            
-            await self._publish_content(context)
+            if not await context.bot_data['db'].transition_vote(vote.vote_id, VOTE_APPROVED):
+                logger.info(f"Vote {vote.vote_id} already handled, skip approve")
+                return False
+            self.handler.log_handler.log_vote({
+                "vote_id": vote.vote_id,
+                "status": VOTE_APPROVED,
+                "admin_id": self.handler.user_id
+            })
+            await self._publish_content(context, vote)
+            return True
         except Exception as e:
             logger.error(f"Failed to admin approve: {e}")
+            return False
 
-    async def admin_reject(self, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """管理员强制拒绝"""
+    async def admin_reject(self, context: ContextTypes.DEFAULT_TYPE, vote: Vote) -> bool:
+        """管理员强制拒绝，状态 polling → rejected"""
         try:
-            vote_message_id = context.chat_data.get('vote_message_id')
-            vote_log_data = {
-                "vote_id": vote_message_id,
+            if not await context.bot_data['db'].transition_vote(vote.vote_id, VOTE_REJECTED):
+                logger.info(f"Vote {vote.vote_id} already handled, skip reject")
+                return False
+            self.handler.log_handler.log_vote({
+                "vote_id": vote.vote_id,
                 "status": "admin_rejected",
                 "admin_id": self.handler.user_id
-            }
-            self.handler.log_handler.log_vote(vote_log_data)
-            
-            await self._reject_content(context)
-            context.chat_data.clear()
+            })
+            await self._reject_content(context, vote)
+            return True
         except Exception as e:
             logger.error(f"Failed to admin reject: {e}")
+            return False
 
     # 保留原有的辅助方法
-    async def _publish_content(self, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """发布通过的内容"""
+    async def _publish_content(self, context: ContextTypes.DEFAULT_TYPE, vote_data: Vote) -> None:
+        """将通过的内容加入频道发布队列，实际发送后状态 approved → published"""
         try:
-            vote_message_id = context.chat_data.get('vote_message_id')
-            vote_data = await context.bot_data['db'].get_vote_by_message(
-                vote_message_id, 
-                GROUP_ID
-            )
-            
-            if not vote_data:
-                logger.error("Vote data not found")
-                return
-            
-            # 组装发布内容
+            # 组装发布内容，投稿和分析都是纯文本，需要转义
             content = (
                 f"<b>投稿内容</b>\n"
-                f"<blockquote expandable>{vote_data.contribute}</blockquote>\n"
+                f"<blockquote expandable>{html.escape(vote_data.contribute or '')}</blockquote>\n"
                 f"<b>AI分析</b>\n"
-                f"<blockquote expandable>{vote_data.analyse}</blockquote>"
+                f"<blockquote expandable>{html.escape(vote_data.analyse or '')}</blockquote>"
             )
-                
-            try:
-                # 发送内容
-                sent_message = await context.bot.send_message(
-                    chat_id=CHANNEL_ID,
-                    text=content,
-                    parse_mode='HTML'
-                )
-                
-                # 通知投稿者
-                await context.bot.send_message(
-                    chat_id=vote_data.user_id,
-                    text="✨ 恭喜！你的投稿已通过并发布"
-                )
-            except Exception as e:
-                logger.error(f"Error sending content: {e}")
-                # 降级处理
-                await context.bot.send_message(
-                    chat_id=CHANNEL_ID,
-                    text=content,
-                    parse_mode=None
-                )
+            await context.bot_data['publish_queue'].enqueue(vote_data.vote_id, content)
         except Exception as e:
             logger.error(f"Failed to publish content: {e}")
 
-    async def _reject_content(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+    async def _reject_content(self, context: ContextTypes.DEFAULT_TYPE, vote_data: Vote) -> None:
         """处理被拒绝的内容"""
         try:
-            user_id = context.chat_data.get('vote_initiator')
-            if user_id:
+            if vote_data.user_id:
                 await context.bot.send_message(
-                    chat_id=user_id,
+                    chat_id=vote_data.user_id,
                     text="感谢你的投稿，虽然没通过，但不是你的问题哦"
                 )
         except Exception as e:
-            logger.error(f"Failed to handle rejected content: {e}") 
\ No newline at end of file
+            logger.error(f"Failed to handle rejected content: {e}")
+
+    async def resume_pending(self, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """重启后恢复：已通过但尚未入队的投稿补入发布队列，投票中的投稿沿用回调数据里的 vote_id"""
+        votes = await context.bot_data['db'].get_votes_by_status(VOTE_APPROVED) or []
+        for vote in votes:
+            await self._publish_content(context, vote)
+        return len(votes)
+
+    async def settle(self, context: ContextTypes.DEFAULT_TYPE, tally: PollTally) -> Optional[str]:
+        """结算已关闭或到期的投票，按阈值自动通过或拒绝
+
+        管理员已手动处理的投稿状态变更会失败，此时只清理计票。
+        """
+        db = context.bot_data['db']
+        context.bot_data['vote_tally'].discard(tally.poll_id)
+
+        if not tally.closed:
+            try:
+                poll = await context.bot.stop_poll(tally.chat_id, tally.message_id)
+                tally.yes, tally.no = poll.options[0].voter_count, poll.options[1].voter_count
+            except Exception as e:
+                # 投票消息可能已被删除或已关闭，沿用最后一次计数
+                logger.warning(f"Failed to stop poll for vote {tally.vote_id}: {e}")
+        await db.update_vote_tallies([(tally.yes, tally.no, tally.vote_id)])
+
+        decision = tally.decision()
+        if not await db.transition_vote(tally.vote_id, decision):
+            return None
+        vote = await db.get_vote(tally.vote_id)
+        LogHandler().log_vote({
+            "vote_id": tally.vote_id,
+            "status": f"auto_{decision}",
+            "yes": tally.yes,
+            "no": tally.no
+        })
+
+        if decision == VOTE_APPROVED:
+            action, notice = self._publish_content(context, vote), f"✅ 投票通过（{tally.yes}/{tally.total}）"
+        else:
+            action, notice = self._reject_content(context, vote), f"❌ 投票未通过（{tally.yes}/{tally.total}）"
+        results = await asyncio.gather(
+            action,
+            context.bot.send_message(chat_id=tally.chat_id, text=notice, reply_to_message_id=tally.message_id),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Failed to finish vote {tally.vote_id}: {result}")
+        return decision
+
+
+async def handle_poll(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """接收 poll 更新，只更新内存计票，关闭时立即结算"""
+    tally = context.bot_data['vote_tally'].record(update.poll)
+    if tally and tally.closed:
+        await VoteHandler(None).settle(context, tally)
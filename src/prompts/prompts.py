@@ -24,6 +24,45 @@ SUMMARY_PROMPT = """你是PickPin，一个擅长总结的bot。请按以下原
 
 💭 PickPin简评：[一句话点评]"""
 
+CHUNK_SUMMARY_PROMPT = """你是PickPin，正在分段整理群聊记录。请总结以下这段聊天：
+
+1. 按话题归纳，每个话题一行，注明主要参与者
+2. 保留关键结论、链接和数字
+3. 忽略寒暄、表情和无意义的刷屏
+4. 不超过200字，不要添加评论"""
+
+CHAT_SUMMARY_PROMPT = """你是PickPin，一个擅长总结的bot。以下是一段群聊记录的分段摘要，请合并为一份完整总结：
+
+1. 合并重复话题，按讨论热度排序
+2. 每个话题注明主要参与者和结论
+3. 总结控制在3-8个要点内
+
+按照以下格式输出：
+📝 聊天总结：
+• [话题1]：[要点]
+• [话题2]：[要点]
+
+💭 PickPin简评：[一句话点评]"""
+
+CONDENSE_PROMPT = """以下是一篇长内容的其中一段，请提炼这一段的要点：
+
+1. 保留事实、数据、引用和链接
+2. 按原文顺序列出，不要评论
+3. 不超过原文长度的五分之一"""
+
+MEMORY_SUMMARY_PROMPT = """请将以下对话压缩为一段简短的摘要，供后续对话参考：
+
+1. 保留用户的问题、偏好和已确认的结论
+2. 保留关键名词、数字和链接
+3. 不超过150字，使用第三人称描述"""
+
+OCR_PROMPT = """提取这张图片中的全部文字：
+
+1. 按阅读顺序逐字输出原文，保留换行和列表结构，不要翻译或改写
+2. 表格用 | 分隔各列
+3. 文字之后用一两句话描述图片中的非文字内容（人物、界面、图表等）
+4. 图片中没有文字时只输出描述"""
+
 CLASSIFY_HELP_TEXT = """
 📝 请发送你想要分析的内容，我会帮你进行分类：
 
@@ -1,60 +1,236 @@
-from config.settings import AI_PROVIDER
+from config.settings import (
+    AI_PROVIDER, GOOGLE_MODEL, SILICONFLOW_MODEL, ZHIPU_MODEL, INPUT_MAP_REDUCE_RATIO, SUMMARY_CONCURRENCY,
+    VISION_MAX_IMAGES
+)
+from prompts.prompts import CONDENSE_PROMPT
 # from .openai_service import get_openai_response
-from .google_service import get_google_response, get_google_vision_response
+from .google_service import get_google_response, get_google_vision_response, get_google_vision_images_response
 from .siliconflow_service import get_siliconflow_response
-from .zhipu_service import get_zhipu_response, get_zhipu_vision_response, get_zhipu_vision_response_base64
+from .zhipu_service import (
+    get_zhipu_response, get_zhipu_vision_response, get_zhipu_vision_response_base64, get_zhipu_vision_images_response
+)
+from .token_budget import estimate_tokens, input_token_limit, truncate_to_budget, split_by_tokens
+from utils.html_renderer import StreamingHTMLRenderer
+from contextlib import aclosing
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
+_MARKDOWN_SPECIAL = re.compile(r'([_*\[\]()~`>#+\-=|{}.!])')
+
 def escape_markdown(text: str) -> str:
     """转义 Markdown V2 特殊字符"""
-    special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    for char in special_chars:
-        text = text.replace(char, f'\\{char}')
-    return text
+    return _MARKDOWN_SPECIAL.sub(r'\\\1', text)
 
-async def get_ai_response(message: str, system_prompt: str):
-    accumulated_text = ""
-    
-    if AI_PROVIDER == "google":
-        async for text, update, footer in get_google_response(message, system_prompt):
-            accumulated_text = text
+async def render_stream(stream):
+    """将 provider 的累计文本流增量渲染为 Telegram HTML，产出 (html, update)
+
+    自身被关闭时一并关闭 provider 流，上游连接随之释放。
+    """
+    renderer = StreamingHTMLRenderer()
+    async with aclosing(stream):
+        async for text, update, footer in stream:
+            renderer.feed(text)
             if update:  # 最终更新
-                yield f"<blockquote expandable>\n{text}\n</blockquote>{footer}", update
+                yield "<blockquote expandable>\n" + renderer.html(final=True) + "\n</blockquote>" + footer, update
             else:
-                yield f"正在生成中：\n<blockquote expandable>\n{text}\n</blockquote>", update
-                
+                yield "正在生成中：\n<blockquote expandable>\n" + renderer.html() + "\n</blockquote>", update
+
+def get_current_model() -> str:
+    """当前 AI_PROVIDER 使用的文本模型"""
+    return {
+        "google": GOOGLE_MODEL,
+        "siliconflow": SILICONFLOW_MODEL,
+        "zhipu": ZHIPU_MODEL,
+    }.get(AI_PROVIDER, "")
+
+def input_budget(system_prompt: str, model: str = None) -> int:
+    """扣除系统提示词后可用于用户输入的 token 数"""
+    return max(input_token_limit(model or get_current_model()) - estimate_tokens(system_prompt), 256)
+
+def get_provider_response(message: str, system_prompt: str):
+    """按 AI_PROVIDER 选择文本对话的原始流，产出 (text, update, footer)
+
+    所有文本请求都经过这里，超出模型上限的输入在此被截断，不会无界地发往服务端。
+    """
+    message = truncate_to_budget(message, input_budget(system_prompt))
+    if AI_PROVIDER == "google":
+        return get_google_response(message, system_prompt)
     elif AI_PROVIDER == "siliconflow":
-        async for text, update, footer in get_siliconflow_response(message, system_prompt):
-            accumulated_text = text
-            if update:
-                yield f"<blockquote expandable>\n{text}\n</blockquote>{footer}", update
-            else:
-                yield f"正在生成中：\n<blockquote expandable>\n{text}\n</blockquote>", update
-                
+        return get_siliconflow_response(message, system_prompt)
     elif AI_PROVIDER == "zhipu":
-        async for text, update, footer in get_zhipu_response(message, system_prompt):
-            accumulated_text = text
-            if update:
-                yield f"<blockquote expandable>\n{text}\n</blockquote>{footer}", update
+        return get_zhipu_response(message, system_prompt)
+    raise ValueError(f"Unsupported AI provider: {AI_PROVIDER}")
+
+async def fit_input(message: str, system_prompt: str) -> str:
+    """将输入压缩到模型预算内
+
+    略超上限时截断中间部分；远超上限时按段落分块并发提炼要点（map），
+    再把提炼结果交给原始提示词处理（reduce）。
+    """
+    budget = input_budget(system_prompt)
+    tokens = estimate_tokens(message)
+    if tokens <= budget:
+        return message
+    if tokens <= budget * INPUT_MAP_REDUCE_RATIO:
+        logger.info(f"Input truncated: {tokens} tokens > budget {budget}")
+        return truncate_to_budget(message, budget)
+
+    chunks = split_by_tokens(message, input_budget(CONDENSE_PROMPT))
+    logger.info(f"Input map-reduce: {tokens} tokens split into {len(chunks)} chunks")
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def condense(chunk: str) -> str:
+        async with semaphore:
+            return await get_ai_text(chunk, CONDENSE_PROMPT)
+
+    condensed = await asyncio.gather(*(condense(chunk) for chunk in chunks))
+    return truncate_to_budget("\n\n".join(text for text in condensed if text), budget)
+
+class _Flight:
+    """一次进行中的上游请求，订阅者共享其最新快照"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.latest: Optional[Tuple[str, bool]] = None
+        self.version = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    async def publish(self) -> None:
+        async with self.changed:
+            self.changed.notify_all()
+
+
+_flights: Dict[str, _Flight] = {}
+
+def _flight_key(message: str, system_prompt: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (AI_PROVIDER, get_current_model(), system_prompt, message):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+async def _run_flight(flight: _Flight, message: str, system_prompt: str) -> None:
+    # 输入压缩和创建上游流也可能失败，放在 try 内保证总能结束并通知订阅者
+    stream = None
+    try:
+        stream = render_stream(get_provider_response(await fit_input(message, system_prompt), system_prompt))
+        async for item in stream:
+            flight.latest = item
+            flight.version += 1
+            await flight.publish()
+    except Exception as e:
+        flight.error = e
+    finally:
+        if stream is not None:
+            await stream.aclose()
+        flight.done = True
+        if _flights.get(flight.key) is flight:
+            del _flights[flight.key]
+        await flight.publish()
+
+async def get_ai_response(message: str, system_prompt: str):
+    """流式对话，相同输入的并发请求共享同一个上游流（single-flight）
+
+    每个快照都是完整的累计内容，订阅者只需拿到最新一份，最终快照保证送达。
+    所有订阅者都退出后才取消上游请求，并等待上游流关闭后再返回。
+    """
+    key = _flight_key(message, system_prompt)
+    flight = _flights.get(key)
+    if flight is None:
+        flight = _flights[key] = _Flight(key)
+        flight.task = asyncio.create_task(_run_flight(flight, message, system_prompt))
+    else:
+        logger.info(f"Joined in-flight AI request {key[:8]} ({flight.subscribers + 1} subscribers)")
+    flight.subscribers += 1
+
+    seen = 0
+    try:
+        while True:
+            async with flight.changed:
+                await flight.changed.wait_for(lambda: flight.version > seen or flight.done)
+            if flight.version > seen:
+                seen = flight.version
+                yield flight.latest
+            elif flight.error:
+                raise flight.error
             else:
-                yield f"正在生成中：\n<blockquote expandable>\n{text}\n</blockquote>", update
+                return
+    finally:
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.done:
+            logger.info(f"All subscribers left, cancelling AI request {key[:8]}")
+            if _flights.get(key) is flight:
+                del _flights[key]
+            flight.task.cancel()
+            await asyncio.wait([flight.task])
 
-async def get_vision_response(message: str, system_prompt: str, image_url: str):
-    accumulated_text = ""
+async def get_ai_text(message: str, system_prompt: str) -> str:
+    """非流式调用，返回完整的原始文本（用于中间步骤，超长输入直接截断）"""
+    result = ""
+    async with aclosing(get_provider_response(message, system_prompt)) as stream:
+        async for text, update, footer in stream:
+            result = text
+    return result
 
+async def get_vision_response(message: str, system_prompt: str, image_url: str):
     if AI_PROVIDER == "zhipu":
-        async for text, update, footer in get_zhipu_vision_response_base64(message, system_prompt, image_url):
-            accumulated_text = text
-            if update:
-                yield f"<blockquote expandable>\n{text}\n</blockquote>{footer}", update
-            else:
-                yield f"正在生成中：\n<blockquote expandable>\n{text}\n</blockquote>", update
+        stream = get_zhipu_vision_response_base64(message, system_prompt, image_url)
     elif AI_PROVIDER == "google":
-        async for text, update, footer in get_google_vision_response(message, image_url, system_prompt):
-            accumulated_text = text
-            if update:
-                yield f"<blockquote expandable>\n{text}\n</blockquote>{footer}", update
-            else:
-                yield f"正在生成中：\n<blockquote expandable>\n{text}\n</blockquote>", update
+        stream = get_google_vision_response(message, image_url, system_prompt)
+    else:
+        return
+    async with aclosing(render_stream(stream)) as rendered:
+        async for html, update in rendered:
+            yield html, update
+
+def _vision_images_stream(message: str, system_prompt: str, images_base64: List[str]):
+    if AI_PROVIDER == "zhipu":
+        return get_zhipu_vision_images_response(message, system_prompt, images_base64)
+    return get_google_vision_images_response(message, images_base64, system_prompt)
+
+async def _batched_vision_stream(message: str, system_prompt: str, batches: List[List[str]]):
+    """依次请求各批图片，把各批结果拼接成一个累计文本流"""
+    done = ""
+    start = 1
+    for index, batch in enumerate(batches):
+        end = start + len(batch) - 1
+        label = f"图片 {start}" if end == start else f"图片 {start}-{end}"
+        header = f"**{label}**\n" if len(batches) > 1 else ""
+        is_last = index == len(batches) - 1
+        async with aclosing(_vision_images_stream(message, system_prompt, batch)) as stream:
+            async for text, update, footer in stream:
+                if update and not is_last:
+                    done += header + text + "\n\n"
+                    yield done, False, ""
+                else:
+                    yield done + header + text, update, footer
+        start += len(batch)
+
+async def get_vision_text(message: str, images_base64: List[str]) -> Optional[str]:
+    """非流式视觉调用，返回完整的原始文本；请求失败（没有正常结束）时返回 None"""
+    if AI_PROVIDER not in ("zhipu", "google") or not images_base64:
+        return None
+    result, footer = "", ""
+    async with aclosing(_vision_images_stream(message, "", images_base64)) as stream:
+        async for result, update, footer in stream:
+            pass
+    return result if footer else None
+
+async def get_vision_album_response(message: str, system_prompt: str, images_base64: List[str]):
+    """相册多图分析：尽量一次请求分析全部图片，provider 有单次图片上限时分批并合并为一条回复"""
+    if AI_PROVIDER not in ("zhipu", "google") or not images_base64:
+        return
+    limit = max(VISION_MAX_IMAGES.get(AI_PROVIDER, 1), 1)
+    batches = [images_base64[i:i + limit] for i in range(0, len(images_base64), limit)]
+    async with aclosing(render_stream(_batched_vision_stream(message, system_prompt, batches))) as rendered:
+        async for html, update in rendered:
+            yield html, update
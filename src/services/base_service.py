@@ -1,10 +1,19 @@
 from typing import AsyncGenerator, Tuple
+import asyncio
 import logging
 import time
+from .token_budget import token_stats
 
 logger = logging.getLogger(__name__)
 
-async def stream_response(stream, accumulated_text="") -> AsyncGenerator[Tuple[str, bool, str], None]:
+_DONE = object()
+
+
+def _next_chunk(chunks):
+    return next(chunks, _DONE)
+
+
+async def stream_response(stream, accumulated_text="", estimated_tokens: int = 0) -> AsyncGenerator[Tuple[str, bool, str], None]:
     last_update_time = 0
     last_text = accumulated_text
     UPDATE_INTERVAL = 1
@@ -14,13 +23,17 @@ async def stream_response(stream, accumulated_text="") -> AsyncGenerator[Tuple[s
     try:
         model_info = None
         completion_tokens = 0
+        prompt_tokens = 0
         
-        for chunk in stream:
+        # 同步客户端的流在读取下一块时会阻塞，放到线程中读取，不阻塞事件循环
+        chunks = iter(stream)
+        while (chunk := await asyncio.to_thread(_next_chunk, chunks)) is not _DONE:
             if not model_info and hasattr(chunk, 'model'):
                 model_info = chunk.model
                 
             if hasattr(chunk, 'usage') and chunk.usage:
                 completion_tokens = chunk.usage.completion_tokens
+                prompt_tokens = getattr(chunk.usage, 'prompt_tokens', 0) or prompt_tokens
                 
             if hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content:
                 accumulated_text += chunk.choices[0].delta.content
@@ -33,6 +46,7 @@ async def stream_response(stream, accumulated_text="") -> AsyncGenerator[Tuple[s
                     last_text = accumulated_text
                     yield accumulated_text, False, ""
         
+        token_stats.record(model_info, estimated_tokens, prompt_tokens)
         if accumulated_text:
             elapsed_time = round(time.time() - start_time, 2)
             footer = (
@@ -46,4 +60,9 @@ async def stream_response(stream, accumulated_text="") -> AsyncGenerator[Tuple[s
         logger.error(f"Error in stream_response: {e}")
         if accumulated_text and accumulated_text != last_text:
             yield accumulated_text, True, ""
-        raise
\ No newline at end of file
+        raise
+    finally:
+        # 消费方提前退出（停止、编辑失败、取消）时立即关闭上游 HTTP 流，不再继续消耗 token
+        close = getattr(stream, 'close', None)
+        if close:
+            close()
\ No newline at end of file
@@ -0,0 +1,306 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+import asyncio
+import codecs
+import logging
+import os
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from telegram import Bot, Message
+from config.settings import (
+    DOCUMENT_MAX_BYTES,
+    DOCUMENT_WORKERS,
+    DOCUMENT_CHUNK_TOKENS,
+    DOCUMENT_CACHE_DIR,
+    SUMMARY_CONCURRENCY
+)
+from prompts.prompts import CONDENSE_PROMPT
+from .ai_service import get_ai_response, get_ai_text
+from .token_budget import estimate_tokens
+
+try:
+    import pypdf
+except ImportError:  # 可选依赖，缺失时不支持 PDF
+    pypdf = None
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_POLL_INTERVAL = 1.0  # 等待共享任务时检查进度的间隔（秒）
+
+_DOCX_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_DOCUMENT_TYPES = {
+    'application/pdf': 'pdf',
+    'text/plain': 'txt',
+    'text/markdown': 'txt',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'docx',
+}
+_DOCUMENT_EXTENSIONS = {'.pdf': 'pdf', '.txt': 'txt', '.md': 'txt', '.docx': 'docx'}
+
+
+class DocumentError(Exception):
+    """无法处理的文档，消息内容直接展示给用户"""
+
+
+def document_kind(message: Message) -> Optional[str]:
+    """按 MIME 类型或扩展名识别 pdf/txt/docx 文档"""
+    document = message.document
+    if not document:
+        return None
+    kind = _DOCUMENT_TYPES.get(document.mime_type or '')
+    if kind is None and document.file_name:
+        kind = _DOCUMENT_EXTENSIONS.get(os.path.splitext(document.file_name)[1].lower())
+    return kind
+
+
+def _detect_encoding(path: str) -> str:
+    with open(path, 'rb') as f:
+        head = f.read(64 * 1024)
+    try:
+        # 末尾可能截断在多字节字符中间，使用增量解码器忽略未完成的部分
+        codecs.getincrementaldecoder('utf-8-sig')().decode(head)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'gb18030'
+
+
+def _extract_txt(source: str, output) -> int:
+    lines = 0
+    with open(source, encoding=_detect_encoding(source), errors='replace') as f:
+        for line in f:
+            output.write(line)
+            lines += 1
+    return lines
+
+
+def _extract_docx(source: str, output) -> int:
+    paragraphs = 0
+    with zipfile.ZipFile(source) as archive, archive.open('word/document.xml') as xml:
+        for _, element in ET.iterparse(xml, events=('end',)):
+            if element.tag == f'{_DOCX_NS}p':
+                output.write(''.join(node.text or '' for node in element.iter(f'{_DOCX_NS}t')) + '\n')
+                paragraphs += 1
+                element.clear()
+    return paragraphs
+
+
+def _extract_pdf(source: str, output) -> int:
+    reader = pypdf.PdfReader(source)
+    for page in reader.pages:
+        output.write((page.extract_text() or '') + '\n\n')
+    return len(reader.pages)
+
+
+def extract_document_text(kind: str, source: str, target: str) -> int:
+    """在工作进程中逐页/逐段提取文字并写入 target，返回页数（或段落、行数）
+
+    提取结果直接写盘，不在内存中拼接整篇文字。
+    """
+    extractor = {'pdf': _extract_pdf, 'txt': _extract_txt, 'docx': _extract_docx}[kind]
+    partial = f"{target}.part"
+    with open(partial, 'w', encoding='utf-8') as output:
+        count = extractor(source, output)
+    os.replace(partial, target)
+    return count
+
+
+def iter_text_chunks(path: str, max_tokens: int):
+    """按行流式读取文字文件，打包为不超过 max_tokens 的分块"""
+    chunk: List[str] = []
+    chunk_tokens = 0
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            tokens = estimate_tokens(line)
+            if chunk and chunk_tokens + tokens > max_tokens:
+                yield ''.join(chunk)
+                chunk, chunk_tokens = [], 0
+            chunk.append(line)
+            chunk_tokens += tokens
+    if chunk:
+        yield ''.join(chunk)
+
+
+class DocumentReader:
+    """PDF/TXT/DOCX 文档解析
+
+    文件下载到磁盘后在进程池中提取文字，按 token 分段并发提炼要点，
+    各段结果和整篇摘要按 file_unique_id 存库，同一文档只处理一次，
+    并发的相同请求共享同一个处理任务和进度；全程流式读写，内存占用与文档大小无关。
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DOCUMENT_MAX_BYTES,
+        workers: int = DOCUMENT_WORKERS,
+        chunk_tokens: int = DOCUMENT_CHUNK_TOKENS,
+        cache_dir: str = DOCUMENT_CACHE_DIR,
+        concurrency: int = SUMMARY_CONCURRENCY
+    ):
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.chunk_tokens = chunk_tokens
+        self.cache_dir = cache_dir
+        self.concurrency = concurrency
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._progress: Dict[str, str] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _extract(self, bot: Bot, kind: str, document, text_path: str) -> int:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=self.cache_dir) as work_dir:
+            source = os.path.join(work_dir, 'source')
+            file = await bot.get_file(document.file_id)
+            await file.download_to_drive(source)
+            if os.path.getsize(source) > self.max_bytes:
+                raise DocumentError(self._too_large_text())
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._get_pool(), extract_document_text, kind, source, text_path)
+            except Exception as e:
+                # 各格式解析库的异常没有统一基类
+                logger.error(f"Failed to extract text from {document.file_unique_id}: {e}")
+                raise DocumentError("文档解析失败，请确认文件未损坏")
+
+    def _too_large_text(self) -> str:
+        return f"文档超过 {self.max_bytes // (1024 * 1024)}MB，暂不支持处理"
+
+    async def _condense(self, db, file_unique_id: str, text_path: str) -> AsyncGenerator[str, None]:
+        """分段提炼要点，已完成的分段直接复用，产出进度文字"""
+        done: Dict[int, str] = await db.get_document_chunks(file_unique_id) or {}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def condense(index: int, chunk: str) -> None:
+            try:
+                summary = await get_ai_text(chunk, CONDENSE_PROMPT)
+                if summary:
+                    done[index] = summary
+                    await db.save_document_chunk(file_unique_id, index, summary)
+            finally:
+                semaphore.release()
+
+        tasks = []
+        total = 0
+        for index, chunk in enumerate(iter_text_chunks(text_path, self.chunk_tokens)):
+            total += 1
+            if index in done:
+                continue
+            # 先占用并发名额再读取下一段，限制同时驻留内存的分段数量
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(condense(index, chunk)))
+
+        cached = total - len(tasks)
+        for finished, task in enumerate(asyncio.as_completed(tasks), start=1):
+            await task
+            yield f"正在分段总结文档：{cached + finished}/{total}（{cached} 段来自缓存）"
+        if len(done) < total:
+            raise DocumentError("部分段落总结失败，请重试")
+
+    async def read(self, bot: Bot, db, message: Message) -> AsyncGenerator[Tuple[str, Optional[str]], None]:
+        """处理文档，产出 (进度, None)，最后产出 ("", 文档内容)
+
+        不超过分段上限的文档直接返回原文，否则返回各段要点拼接的摘要。
+        """
+        kind = document_kind(message)
+        document = message.document
+        if kind is None:
+            raise DocumentError("暂不支持处理此类型的文件")
+        if kind == 'pdf' and pypdf is None:
+            raise DocumentError("暂不支持处理 PDF 文件")
+
+        file_unique_id = document.file_unique_id
+        cached = await db.get_media_text(file_unique_id)
+        if cached:
+            yield "", cached
+            return
+        if document.file_size and document.file_size > self.max_bytes:
+            raise DocumentError(self._too_large_text())
+
+        # 相同文档的并发请求共享一个任务，避免争用同一个文字文件；
+        # 任务不随单个请求取消，完成后结果已存库
+        task = self._pending.get(file_unique_id)
+        if task is None:
+            task = self._pending[file_unique_id] = asyncio.create_task(
+                self._process(bot, db, kind, document)
+            )
+            task.add_done_callback(lambda _: self._finish(file_unique_id))
+        shown = None
+        while not task.done():
+            progress = self._progress.get(file_unique_id)
+            if progress and progress != shown:
+                shown = progress
+                yield progress, None
+            await asyncio.wait([task], timeout=PROGRESS_POLL_INTERVAL)
+        yield "", task.result()
+
+    def _finish(self, file_unique_id: str) -> None:
+        self._pending.pop(file_unique_id, None)
+        self._progress.pop(file_unique_id, None)
+
+    async def _process(self, bot: Bot, db, kind: str, document) -> str:
+        """提取并（必要时）分段总结文档，进度写入 _progress 供所有等待的请求读取"""
+        file_unique_id = document.file_unique_id
+        text_path = os.path.join(self.cache_dir, f"{file_unique_id}.txt")
+        if not os.path.exists(text_path):
+            self._progress[file_unique_id] = "正在下载并提取文档文字..."
+            count = await self._extract(bot, kind, document, text_path)
+            logger.info(f"Extracted {count} {'pages' if kind == 'pdf' else 'lines'} from {file_unique_id}")
+
+        if os.path.getsize(text_path) == 0:
+            os.remove(text_path)
+            raise DocumentError("文档中没有可识别的文字")
+
+        chunks = iter_text_chunks(text_path, self.chunk_tokens)
+        first, second = next(chunks), next(chunks, None)
+        chunks.close()
+        if second is None:
+            content = first
+        else:
+            async for progress in self._condense(db, file_unique_id, text_path):
+                self._progress[file_unique_id] = progress
+            summaries = await db.get_document_chunks(file_unique_id) or {}
+            content = "\n\n".join(summaries[index] for index in sorted(summaries))
+
+        await db.save_media_text(file_unique_id, 'document', content)
+        os.remove(text_path)
+        return content
+
+    async def get_text(self, bot: Bot, db, message: Message) -> Optional[str]:
+        """文档内容（原文或摘要），失败时返回 None"""
+        try:
+            async for _, content in self.read(bot, db, message):
+                if content is not None:
+                    return content
+        except DocumentError as e:
+            logger.warning(f"Document not processed: {e}")
+        return None
+
+    async def respond(
+        self,
+        bot: Bot,
+        db,
+        message: Message,
+        question: str,
+        system_prompt: str
+    ) -> AsyncGenerator[Tuple[str, bool], None]:
+        """处理文档后回答问题，进度和回答共用同一条状态消息，产出与 get_ai_response 一致的 (text, update)"""
+        content = None
+        try:
+            async for progress, content in self.read(bot, db, message):
+                if content is None:
+                    yield progress, False
+        except DocumentError as e:
+            yield str(e), True
+            return
+
+        async for text, update in get_ai_response(f"[文档内容]\n{content}\n\n{question}", system_prompt):
+            yield text, update
@@ -1,7 +1,10 @@
+from contextlib import aclosing
 import base64
+from typing import List
 from openai import OpenAI
 from config.settings import GOOGLE_API_KEY, GOOGLE_MODEL
 from .base_service import stream_response
+from .token_budget import estimate_tokens, is_context_length_error
 import asyncio
 import logging
 import requests
@@ -30,7 +33,8 @@ async def get_google_response(message: str, system_prompt: str):
     
     for attempt in range(max_retries):
         try:
-            response = client.chat.completions.create(
+            response = await asyncio.to_thread(
+                client.chat.completions.create,
                 model=current_model,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -39,11 +43,17 @@ async def get_google_response(message: str, system_prompt: str):
                 stream=True
             )
             
-            async for text, update, footer in stream_response(response):
-                yield text, update, footer
+            async with aclosing(stream_response(response, estimated_tokens=estimate_tokens(system_prompt) + estimate_tokens(message))) as chunks:
+                async for text, update, footer in chunks:
+                    yield text, update, footer
             return
             
         except Exception as e:
+            if is_context_length_error(e):
+                logger.error(f"Input exceeds context length for {current_model}: {str(e)}")
+                yield "抱歉，内容过长，超出模型上下文限制。", True, ""
+                return
+
             if "429" in str(e) and current_model == GOOGLE_MODEL:
                 logger.info(f"Quota exceeded for {current_model}, switching to gemini-1.5-flash")
                 current_model = "gemini-1.5-flash"
@@ -72,33 +82,41 @@ def image_to_base64(image_url: str) -> str:
 
 
 async def get_google_vision_response(message: str, image_url: str, system_prompt: str):
+    async for text, update, footer in get_google_vision_images_response(message, [image_to_base64(image_url)], system_prompt):
+        yield text, update, footer
+
+
+async def get_google_vision_images_response(message: str, images_base64: List[str], system_prompt: str):
+    """一次请求分析多张图片"""
     max_retries = 3
     base_delay = 1
     
-    image_base64 = image_to_base64(image_url)
+    content = [{"type": "text", "text": message}] + [
+        {
+            "type": "image_url",
+            "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
+        }
+        for image_base64 in images_base64
+    ]
     
     for attempt in range(max_retries):
         try:
-            response = client.chat.completions.create(
+            response = await asyncio.to_thread(
+                client.chat.completions.create,
                 model=GOOGLE_MODEL,
                 messages=[
                     # {"role": "system", "content": system_prompt},
                     {
                         "role": "user",
-                        "content": [
-                            {"type": "text", "text": message},
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-                            }
-                        ]
+                        "content": content
                     }
                 ],
                 stream=True
             )
             
-            async for text, update, footer in stream_response(response):
-                yield text, update, footer
+            async with aclosing(stream_response(response)) as chunks:
+                async for text, update, footer in chunks:
+                    yield text, update, footer
             return
             
         except Exception as e:
@@ -111,4 +129,4 @@ async def get_google_vision_response(message: str, image_url: str, system_prompt
             else:
                 logger.error(f"Failed after {max_retries} attempts: {str(e)}")
                 yield f"抱歉，服务暂时不可用，请稍后重试。错误: {str(e)}", True, ""
-                return
\ No newline at end of file
+                return
@@ -0,0 +1,308 @@
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+import asyncio
+import ipaddress
+import logging
+import re
+import time
+import httpx
+from telegram import Message
+from config.settings import (
+    HTTP_PROXY,
+    LINK_FETCH_TIMEOUT,
+    LINK_MAX_BYTES,
+    LINK_POOL_SIZE,
+    LINK_PER_HOST,
+    LINK_CACHE_TTL,
+    LINK_MAX_PER_MESSAGE,
+    LINK_MAX_CHARS
+)
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (compatible; PickPinBot/1.0)"
+MAX_REDIRECTS = 5
+
+_SKIP_TAGS = {'script', 'style', 'noscript', 'nav', 'header', 'footer', 'aside', 'form', 'svg', 'iframe', 'template'}
+_BLOCK_TAGS = {'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'pre', 'blockquote', 'td', 'div', 'section', 'br'}
+_MAIN_TAGS = {'article', 'main'}
+_VOID_TAGS = {'br', 'img', 'meta', 'link', 'input', 'hr', 'source', 'wbr'}
+
+
+class _ArticleParser(HTMLParser):
+    """提取标题、描述和正文段落，<article>/<main> 内的段落单独记录"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.description = ""
+        self.blocks: List[Tuple[str, bool]] = []
+        self._in_title = False
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._buffer: List[str] = []
+
+    def _flush(self) -> None:
+        text = re.sub(r'\s+', ' ', ''.join(self._buffer)).strip()
+        if text:
+            self.blocks.append((text, self._main_depth > 0))
+        self._buffer = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'meta':
+            attrs = dict(attrs)
+            key = attrs.get('property') or attrs.get('name')
+            if key in ('og:title', 'twitter:title') and not self.title:
+                self.title = (attrs.get('content') or '').strip()
+            elif key in ('og:description', 'description') and not self.description:
+                self.description = (attrs.get('content') or '').strip()
+            return
+        if tag in _VOID_TAGS:
+            if tag == 'br':
+                self._buffer.append('\n')
+            return
+        if tag == 'title':
+            self._in_title = True
+        elif tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in _MAIN_TAGS:
+            self._flush()
+            self._main_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self._in_title = False
+        elif tag in _SKIP_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag in _MAIN_TAGS:
+            self._flush()
+            self._main_depth = max(self._main_depth - 1, 0)
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._in_title:
+            if not self.title:
+                self.title = data.strip()
+        elif not self._skip_depth:
+            self._buffer.append(data)
+
+
+def extract_article(html: str) -> Tuple[str, str]:
+    """从 HTML 中提取 (标题, 正文)
+
+    优先使用 <article>/<main> 内的段落，其次使用全部较长的段落，都没有时退回页面描述。
+    """
+    parser = _ArticleParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception as e:
+        logger.warning(f"HTML parse error: {e}")
+    parser._flush()
+
+    main = [text for text, in_main in parser.blocks if in_main]
+    if sum(len(text) for text in main) < 200:
+        main = [text for text, _ in parser.blocks if len(text) >= 40]
+    text = "\n".join(main) or parser.description
+    return parser.title, text
+
+
+def message_urls(message: Message, limit: int = LINK_MAX_PER_MESSAGE) -> List[str]:
+    """消息正文和说明中的链接（url 与 text_link 实体），去重后按出现顺序返回"""
+    urls: List[str] = []
+    for entities in (
+        message.parse_entities(['url', 'text_link']),
+        message.parse_caption_entities(['url', 'text_link'])
+    ):
+        for entity, text in entities.items():
+            url = entity.url if entity.type == 'text_link' else text
+            if not re.match(r'https?://', url, re.IGNORECASE):
+                url = f"https://{url}"
+            if url not in urls:
+                urls.append(url)
+    return urls[:limit]
+
+
+def _is_public_host(host: Optional[str]) -> bool:
+    """拒绝本机和内网地址（IP 字面量），域名需再经 _resolves_public 检查解析结果"""
+    if not host or host == 'localhost' or host.endswith('.local'):
+        return False
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return True
+    return address.is_global
+
+
+async def _resolves_public(host: Optional[str]) -> bool:
+    """解析域名，所有解析出的地址都是公网地址时才允许访问，避免通过机器人访问内部服务"""
+    if not _is_public_host(host):
+        return False
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        pass
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None)
+    except OSError:
+        return False
+    addresses = {info[4][0].split('%')[0] for info in infos}
+    return bool(addresses) and all(ipaddress.ip_address(address).is_global for address in addresses)
+
+
+class LinkFetcher:
+    """链接内容抓取
+
+    共用一个 httpx 连接池，按站点限制并发，读取超过 max_bytes 时截断；
+    重定向逐跳手动跟随，每一跳都重新检查目标地址。
+    结果存入 link_cache 表，ttl 内直接复用，过期后带 ETag/Last-Modified 重新验证；
+    同一链接的并发请求共用一次抓取，抓取失败时退回过期缓存。
+    """
+
+    def __init__(
+        self,
+        db,
+        timeout: float = LINK_FETCH_TIMEOUT,
+        max_bytes: int = LINK_MAX_BYTES,
+        pool_size: int = LINK_POOL_SIZE,
+        per_host: int = LINK_PER_HOST,
+        ttl: int = LINK_CACHE_TTL,
+        max_chars: int = LINK_MAX_CHARS,
+        proxy: Optional[str] = HTTP_PROXY,
+        allow_private: bool = False
+    ):
+        self.db = db
+        self.max_bytes = max_bytes
+        self.per_host = per_host
+        self.ttl = ttl
+        self.max_chars = max_chars
+        self.allow_private = allow_private
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            follow_redirects=False,
+            headers={'User-Agent': USER_AGENT},
+            proxy=proxy
+        )
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        semaphore = self._hosts.get(host)
+        if semaphore is None:
+            semaphore = self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return semaphore
+
+    async def _allowed(self, url: str) -> bool:
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            return False
+        return self.allow_private or await _resolves_public(parts.hostname)
+
+    async def fetch(self, url: str) -> Optional[Dict[str, Any]]:
+        """获取链接内容 {'url', 'final_url', 'title', 'text', ...}，无法获取时返回 None"""
+        host = urlsplit(url).hostname
+        if not await self._allowed(url):
+            return None
+        cached = await self.db.get_link(url)
+        if cached and time.time() - cached['fetched_at'] < self.ttl:
+            return cached
+
+        task = self._pending.get(url)
+        if task is None:
+            task = self._pending[url] = asyncio.create_task(self._refresh(url, host, cached))
+            task.add_done_callback(lambda _: self._pending.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, url: str, host: str, cached: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        headers = {}
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+        try:
+            async with self._host_limit(host):
+                current = url
+                for _ in range(MAX_REDIRECTS + 1):
+                    async with self.client.stream('GET', current, headers=headers) as response:
+                        if response.status_code == 304 and cached:
+                            await self.db.touch_link(url, time.time())
+                            return cached
+                        if response.is_redirect and 'location' in response.headers:
+                            current = urljoin(current, response.headers['location'])
+                            if not await self._allowed(current):
+                                logger.warning(f"Fetch {url} redirected to disallowed {current}")
+                                return None
+                            # 条件请求头只对原链接有效
+                            headers = {}
+                            continue
+                        if response.status_code != 200:
+                            logger.warning(f"Fetch {url} returned {response.status_code}")
+                            return cached
+                        content_type = response.headers.get('content-type', '')
+                        if 'html' not in content_type and not content_type.startswith('text/'):
+                            return None
+                        body = bytearray()
+                        async for chunk in response.aiter_bytes():
+                            body += chunk
+                            if len(body) >= self.max_bytes:
+                                break
+                        content = bytes(body[:self.max_bytes]).decode(response.encoding or 'utf-8', errors='replace')
+                        final_url = str(response.url)
+                        etag = response.headers.get('etag')
+                        last_modified = response.headers.get('last-modified')
+                        break
+                else:
+                    logger.warning(f"Fetch {url} exceeded {MAX_REDIRECTS} redirects")
+                    return cached
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to fetch {url}: {e}")
+            return cached
+
+        if 'html' in content_type:
+            # 大页面解析较慢，放到线程中避免阻塞事件循环
+            title, text = await asyncio.to_thread(extract_article, content)
+        else:
+            title, text = "", content
+        link = {
+            'url': url,
+            'final_url': final_url,
+            'title': title,
+            'text': text[:self.max_chars],
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': time.time()
+        }
+        await self.db.save_link(link)
+        logger.info(f"Fetched {url}: {len(body)} bytes, {len(link['text'])} chars extracted")
+        return link
+
+    async def fetch_all(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """并发抓取多个链接，跳过失败的链接"""
+        results = await asyncio.gather(*(self.fetch(url) for url in urls), return_exceptions=True)
+        links = []
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to fetch {url}: {result}")
+            elif result and result.get('text'):
+                links.append(result)
+        return links
+
+    async def link_context(self, message: Message) -> str:
+        """把消息中链接的正文整理为供 AI 参考的文本，没有可用链接时返回空字符串"""
+        urls = message_urls(message)
+        if not urls:
+            return ""
+        return "\n\n".join(
+            f"[链接内容] {link['title'] or ''}\n{link['final_url'] or link['url']}\n{link['text']}"
+            for link in await self.fetch_all(urls)
+        )
@@ -0,0 +1,60 @@
+from typing import Dict, Optional
+import asyncio
+import base64
+import logging
+from telegram import Bot, Message
+from prompts.prompts import OCR_PROMPT
+from services.ai_service import get_vision_text
+from utils.media_group import image_media
+
+logger = logging.getLogger(__name__)
+
+# 正在识别的图片，同一图片的并发请求共用一次视觉调用
+_pending: Dict[str, asyncio.Task] = {}
+
+
+async def _extract_text(bot: Bot, db, file_id: str, file_unique_id: str) -> Optional[str]:
+    file = await bot.get_file(file_id)
+    image = base64.b64encode(bytes(await file.download_as_bytearray())).decode('utf-8')
+    text = await get_vision_text(OCR_PROMPT, [image])
+    if text:
+        await db.save_media_text(file_unique_id, 'ocr', text)
+        logger.info(f"OCR extracted {len(text)} chars from {file_unique_id}")
+    return text
+
+
+async def get_image_text(bot: Bot, db, message: Message) -> Optional[str]:
+    """图片文字识别：每个 file_unique_id 只调用一次视觉模型，结果持久化，失败时返回 None"""
+    media = image_media(message)
+    if media is None:
+        return None
+    file_unique_id = media.file_unique_id
+    cached = await db.get_media_text(file_unique_id)
+    if cached:
+        return cached
+
+    task = _pending.get(file_unique_id)
+    if task is None:
+        task = _pending[file_unique_id] = asyncio.create_task(
+            _extract_text(bot, db, media.file_id, file_unique_id)
+        )
+        task.add_done_callback(lambda _: _pending.pop(file_unique_id, None))
+    try:
+        # 单个等待方取消时不影响其他等待方
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to extract text from {file_unique_id}: {e}")
+        return None
+
+
+async def message_text_with_image(bot: Bot, db, message: Message) -> Optional[str]:
+    """消息的文字或说明；带图片时附上识别出的图片文字，供文本模型处理"""
+    text = message.text or message.caption
+    if image_media(message) is None:
+        return text
+    image_text = await get_image_text(bot, db, message)
+    if not image_text:
+        return text
+    return f"{text}\n\n[图片内容]\n{image_text}" if text else f"[图片内容]\n{image_text}"
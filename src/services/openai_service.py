@@ -1,6 +1,8 @@
+import asyncio
 from openai import OpenAI
 from config.settings import OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL
 from .base_service import stream_response
+from .token_budget import estimate_tokens
 
 client = OpenAI(
     api_key=OPENAI_API_KEY,
@@ -8,7 +10,8 @@ client = OpenAI(
 )
 
 async def get_openai_response(message: str, system_prompt: str):
-    stream = client.chat.completions.create(
+    stream = await asyncio.to_thread(
+        client.chat.completions.create,
         model=OPENAI_MODEL,
         messages=[
             {"role": "system", "content": system_prompt},
@@ -17,5 +20,5 @@ async def get_openai_response(message: str, system_prompt: str):
         stream=True
     )
     
-    async for text, update, footer in stream_response(stream):
+    async for text, update, footer in stream_response(stream, estimated_tokens=estimate_tokens(system_prompt) + estimate_tokens(message)):
         yield text, update, footer
\ No newline at end of file
@@ -1,6 +1,9 @@
+from contextlib import aclosing
 from openai import OpenAI
 from config.settings import SILICONFLOW_API_KEY, SILICONFLOW_MODEL
 from .base_service import stream_response
+from .token_budget import estimate_tokens
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,7 +16,8 @@ client = OpenAI(
 async def get_siliconflow_response(message: str, system_prompt: str):
     """处理 SiliconFlow API 的对话请求"""
     try:
-        response = client.chat.completions.create(
+        response = await asyncio.to_thread(
+            client.chat.completions.create,
             model=SILICONFLOW_MODEL,  # 使用 Qwen 等模型
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -22,8 +26,9 @@ async def get_siliconflow_response(message: str, system_prompt: str):
             stream=True
         )
         
-        async for text, update, footer in stream_response(response):
-            yield text, update, footer
+        async with aclosing(stream_response(response, estimated_tokens=estimate_tokens(system_prompt) + estimate_tokens(message))) as chunks:
+            async for text, update, footer in chunks:
+                yield text, update, footer
             
     except Exception as e:
         logger.error(f"Error in siliconflow_response: {e}")
@@ -0,0 +1,278 @@
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, Any, List, Optional, Tuple, Union
+from config.settings import (
+    SUMMARY_CHUNK_TOKENS, SUMMARY_BLOCK_SIZE, SUMMARY_CONCURRENCY, SUMMARY_CHECKPOINT_MESSAGES
+)
+from prompts.prompts import CHUNK_SUMMARY_PROMPT, CHAT_SUMMARY_PROMPT
+from .ai_service import get_ai_response, get_ai_text
+from .token_budget import estimate_tokens
+from datetime import datetime
+import asyncio
+import hashlib
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# 本地时间今天零点（换算回 UTC 与 created_at 比较）
+TODAY_START = ('localtime', 'start of day', 'utc')
+
+def parse_summary_range(args: List[str]) -> Tuple[Optional[str], Optional[int]]:
+    """解析 /summarize 参数，返回 (since, last_n)
+
+    支持 `100`（最近100条）、`30m`、`2h`、`1d`；`today` 由检查点处理，不在此解析
+    """
+    if not args:
+        return None, None
+    arg = args[0].lower()
+    if arg.isdigit():
+        return None, min(int(arg), 5000)
+    match = re.fullmatch(r'(\d+)([mhd])', arg)
+    if match:
+        unit = {'m': 'minutes', 'h': 'hours', 'd': 'days'}[match.group(2)]
+        return f"-{match.group(1)} {unit}", None
+    return None, None
+
+
+class ChatSummarizer:
+    """聊天记录 map-reduce 总结
+
+    消息按游标流式读取，按消息ID对齐到固定区块后再按 token 上限切分，
+    使相互重叠的总结范围得到相同的分块，从而复用已缓存的分块总结。
+    """
+
+    def __init__(
+        self,
+        db,
+        chunk_tokens: int = SUMMARY_CHUNK_TOKENS,
+        block_size: int = SUMMARY_BLOCK_SIZE,
+        concurrency: int = SUMMARY_CONCURRENCY
+    ):
+        self.db = db
+        self.chunk_tokens = chunk_tokens
+        self.block_size = block_size
+        self.concurrency = concurrency
+
+    @staticmethod
+    def format_row(row: Dict[str, Any]) -> str:
+        return f"[{row.get('local_time')}] {row.get('sender')}: {row.get('text')}"
+
+    async def pack_chunks(
+        self,
+        rows: AsyncIterator[Dict[str, Any]],
+        split_key: Optional[Callable[[Dict[str, Any]], Any]] = None
+    ) -> AsyncGenerator[List[Dict[str, Any]], None]:
+        """将消息流打包为 token 受限的分块，split_key 变化时强制切分"""
+        split_key = split_key or (lambda row: row['message_id'] // self.block_size)
+        chunk: List[Dict[str, Any]] = []
+        chunk_tokens = 0
+        current_key = None
+        async for row in rows:
+            row['line'] = self.format_row(row)
+            tokens = estimate_tokens(row['line'])
+            key = split_key(row)
+            if chunk and (key != current_key or chunk_tokens + tokens > self.chunk_tokens):
+                yield chunk
+                chunk, chunk_tokens = [], 0
+            chunk.append(row)
+            chunk_tokens += tokens
+            current_key = key
+        if chunk:
+            yield chunk
+
+    def iter_chunks(
+        self,
+        chat_id: int,
+        since: Union[str, Tuple[str, ...], None] = None,
+        last_n: Optional[int] = None,
+        after_message_id: Optional[int] = None
+    ) -> AsyncGenerator[List[Dict[str, Any]], None]:
+        """流式产出 token 受限的消息分块"""
+        return self.pack_chunks(self.db.iter_chat_history(chat_id, since, last_n, after_message_id))
+
+    @staticmethod
+    def chunk_hash(chat_id: int, chunk: List[Dict[str, Any]]) -> str:
+        digest = hashlib.sha1(str(chat_id).encode('utf-8'))
+        for row in chunk:
+            digest.update(f"\0{row['message_id']}:{row['text']}".encode('utf-8'))
+        return digest.hexdigest()
+
+    async def summarize_chunk(self, chat_id: int, chunk: List[Dict[str, Any]]) -> Tuple[str, bool]:
+        """总结单个分块，返回 (总结, 是否命中缓存)"""
+        range_hash = self.chunk_hash(chat_id, chunk)
+        cached = await self.db.get_chunk_summary(range_hash)
+        if cached:
+            return cached, True
+
+        summary = await get_ai_text("\n".join(row['line'] for row in chunk), CHUNK_SUMMARY_PROMPT)
+        if summary:
+            await self.db.save_chunk_summary({
+                'range_hash': range_hash,
+                'chat_id': chat_id,
+                'first_message_id': chunk[0]['message_id'],
+                'last_message_id': chunk[-1]['message_id'],
+                'message_count': len(chunk),
+                'summary': summary
+            })
+        return summary, False
+
+    async def map_chunks(
+        self,
+        chat_id: int,
+        since: Union[str, Tuple[str, ...], None] = None,
+        last_n: Optional[int] = None,
+        after_message_id: Optional[int] = None
+    ) -> Tuple[List[str], int]:
+        """并发总结所有分块，返回 (按时间排序的分块总结, 命中缓存数)"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(chunk):
+            try:
+                return await self.summarize_chunk(chat_id, chunk)
+            finally:
+                semaphore.release()
+
+        tasks = []
+        async for chunk in self.iter_chunks(chat_id, since, last_n, after_message_id):
+            # 先占用并发名额再读取下一块，限制同时驻留内存的分块数量
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(run(chunk)))
+
+        results = await asyncio.gather(*tasks)
+        summaries = [summary for summary, _ in results if summary]
+        return summaries, sum(1 for _, cached in results if cached)
+
+    async def reduce(self, summaries: List[str]) -> str:
+        """逐层合并分块总结，直到能放进单次请求"""
+        while len(summaries) > 1 and estimate_tokens("\n\n".join(summaries)) > self.chunk_tokens:
+            groups: List[List[str]] = [[]]
+            group_tokens = 0
+            for summary in summaries:
+                tokens = estimate_tokens(summary)
+                if groups[-1] and group_tokens + tokens > self.chunk_tokens:
+                    groups.append([])
+                    group_tokens = 0
+                groups[-1].append(summary)
+                group_tokens += tokens
+            if len(groups) == len(summaries):
+                break
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def merge(group):
+                async with semaphore:
+                    return await get_ai_text("\n\n".join(group), CHUNK_SUMMARY_PROMPT)
+
+            summaries = [s for s in await asyncio.gather(*(merge(g) for g in groups)) if s]
+        return "\n\n".join(summaries)
+
+    async def summarize(
+        self,
+        chat_id: int,
+        since: Union[str, Tuple[str, ...], None] = None,
+        last_n: Optional[int] = None
+    ) -> AsyncGenerator[Tuple[str, bool], None]:
+        """流式总结聊天记录，产出与 get_ai_response 一致的 (text, update)"""
+        yield "正在读取聊天记录...", False
+        summaries, cached = await self.map_chunks(chat_id, since, last_n)
+        async for text, update in self._stream_reduce(chat_id, summaries, cached):
+            yield text, update
+
+    async def _stream_reduce(
+        self,
+        chat_id: int,
+        summaries: List[str],
+        cached: int
+    ) -> AsyncGenerator[Tuple[str, bool], None]:
+        if not summaries:
+            yield "该范围内没有可总结的消息", True
+            return
+
+        logger.info(f"Chat {chat_id} summary: {len(summaries)} chunks, {cached} cached")
+        yield f"已整理 {len(summaries)} 个分段（{cached} 个来自缓存），正在汇总...", False
+        async for text, update in get_ai_response(await self.reduce(summaries), CHAT_SUMMARY_PROMPT):
+            yield text, update
+
+    async def summarize_today(self, chat_id: int) -> AsyncGenerator[Tuple[str, bool], None]:
+        """基于小时检查点总结今天的聊天，仅实时处理最后一个检查点之后的消息"""
+        yield "正在读取今日总结检查点...", False
+        today = datetime.now().strftime("%Y-%m-%d")
+        checkpoints = await self.db.get_summary_checkpoints(chat_id, 'hour', today) or []
+        summaries = [checkpoint['summary'] for checkpoint in checkpoints]
+        last_id = max((checkpoint['last_message_id'] for checkpoint in checkpoints), default=None)
+
+        tail, _ = await self.map_chunks(chat_id, since=TODAY_START, after_message_id=last_id)
+        async for text, update in self._stream_reduce(chat_id, summaries + tail, len(summaries)):
+            yield text, update
+
+    async def update_checkpoints(self, chat_id: int, min_messages: int = SUMMARY_CHECKPOINT_MESSAGES) -> int:
+        """增量维护小时/日检查点，返回本次归档的消息数
+
+        新消息达到 min_messages 条，或最早的新消息所在小时已结束时才处理。
+        """
+        last_id = await self.db.get_last_checkpoint_message_id(chat_id)
+        stats = await self.db.count_messages_after(chat_id, last_id or 0)
+        processed = 0
+        current_hour = datetime.now().strftime("%Y-%m-%d %H:00")
+        if stats and stats['count'] and (stats['count'] >= min_messages or stats['first_hour'] < current_hour):
+            # 首次运行只回填最近一天，避免扫描全部历史
+            rows = self.db.iter_chat_history(
+                chat_id,
+                since=None if last_id else '-1 days',
+                after_message_id=last_id
+            )
+            hour, hour_chunks = None, []
+            async for chunk in self.pack_chunks(rows, split_key=lambda row: row['local_hour']):
+                if hour_chunks and chunk[0]['local_hour'] != hour:
+                    await self._save_hour_checkpoint(chat_id, hour, hour_chunks)
+                    hour_chunks = []
+                hour = chunk[0]['local_hour']
+                summary, _ = await self.summarize_chunk(chat_id, chunk)
+                hour_chunks.append((chunk[0]['message_id'], chunk[-1]['message_id'], len(chunk), summary))
+                processed += len(chunk)
+            if hour_chunks:
+                await self._save_hour_checkpoint(chat_id, hour, hour_chunks)
+
+        for day in await self.db.get_pending_summary_days(chat_id) or []:
+            await self._save_day_checkpoint(chat_id, day)
+        return processed
+
+    async def _save_hour_checkpoint(
+        self,
+        chat_id: int,
+        hour: str,
+        chunks: List[Tuple[int, int, int, str]]
+    ) -> None:
+        """合并本小时已有检查点与新分块总结，chunks 为 (首条ID, 末条ID, 条数, 总结)"""
+        existing = await self.db.get_summary_checkpoint(chat_id, 'hour', hour)
+        summaries = ([existing['summary']] if existing else []) + [chunk[3] for chunk in chunks if chunk[3]]
+        if len(summaries) > 1:
+            summary = await get_ai_text("\n\n".join(summaries), CHUNK_SUMMARY_PROMPT)
+        else:
+            summary = summaries[0] if summaries else ""
+        await self.db.save_summary_checkpoint({
+            'chat_id': chat_id,
+            'level': 'hour',
+            'period_start': hour,
+            'first_message_id': existing['first_message_id'] if existing else chunks[0][0],
+            'last_message_id': chunks[-1][1],
+            'message_count': (existing['message_count'] if existing else 0) + sum(chunk[2] for chunk in chunks),
+            'summary': summary
+        })
+
+    async def _save_day_checkpoint(self, chat_id: int, day: str) -> None:
+        """将某天的小时检查点归并为日检查点"""
+        hours = await self.db.get_summary_checkpoints(chat_id, 'hour', day) or []
+        if not hours:
+            return
+        summary = await self.reduce([checkpoint['summary'] for checkpoint in hours])
+        if len(hours) > 1:
+            summary = await get_ai_text(summary, CHUNK_SUMMARY_PROMPT)
+        await self.db.save_summary_checkpoint({
+            'chat_id': chat_id,
+            'level': 'day',
+            'period_start': day,
+            'first_message_id': hours[0]['first_message_id'],
+            'last_message_id': max(checkpoint['last_message_id'] for checkpoint in hours),
+            'message_count': sum(checkpoint['message_count'] for checkpoint in hours),
+            'summary': summary
+        })
@@ -0,0 +1,136 @@
+from functools import lru_cache
+from typing import Dict, List, Optional
+import logging
+import re
+from config.settings import MAX_INPUT_TOKENS
+
+try:
+    import tiktoken
+except ImportError:  # 可选依赖，缺失时使用启发式估算
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]')
+_CONTEXT_ERROR_HINTS = ('context length', 'context_length', 'too long', 'maximum context', 'token limit', 'exceeds the maximum')
+TRUNCATION_MARK = "\n\n……[内容过长，已截断]……\n\n"
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Failed to load tokenizer, falling back to heuristic: {e}")
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 数
+
+    安装 tiktoken 时使用缓存的编码器，否则按中日韩字符约1个token、
+    其余约4个字符1个token估算。
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def input_token_limit(model: str) -> int:
+    """模型允许的输入 token 上限"""
+    return MAX_INPUT_TOKENS.get(model, MAX_INPUT_TOKENS['default'])
+
+
+def _chars_for_tokens(text: str, max_tokens: int) -> int:
+    """按文本的平均 token 密度换算字符数"""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return len(text)
+    return max(int(len(text) * max_tokens / tokens), 0)
+
+
+def truncate_to_budget(text: str, max_tokens: int) -> str:
+    """超出预算时保留首尾、截去中间部分"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max(max_tokens - estimate_tokens(TRUNCATION_MARK), 0)
+    keep = _chars_for_tokens(text, budget)
+    while True:
+        head = keep * 2 // 3
+        tail = keep - head
+        result = text[:head] + TRUNCATION_MARK + (text[-tail:] if tail else "")
+        # 首尾密度可能与整体不同，超出时按比例继续收缩
+        tokens = estimate_tokens(result)
+        if tokens <= max_tokens or keep == 0:
+            return result
+        keep = int(keep * budget / max(tokens, 1))
+
+
+def split_by_tokens(text: str, max_tokens: int) -> List[str]:
+    """按段落/句子边界切分为不超过 max_tokens 的分块"""
+    pieces = re.split(r'(?<=\n\n)|(?<=[。！？.!?]\s)|(?<=[。！？])', text)
+    chunks: List[str] = []
+    current, current_tokens = [], 0
+    for piece in pieces:
+        if not piece:
+            continue
+        tokens = estimate_tokens(piece)
+        if tokens > max_tokens:
+            # 单句过长时按字符硬切
+            step = max(_chars_for_tokens(piece, max_tokens), 1)
+            parts = [piece[i:i + step] for i in range(0, len(piece), step)]
+        else:
+            parts = [piece]
+        for part in parts:
+            part_tokens = tokens if len(parts) == 1 else estimate_tokens(part)
+            if current and current_tokens + part_tokens > max_tokens:
+                chunks.append("".join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += part_tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def is_context_length_error(error: Exception) -> bool:
+    """判断是否为上下文超长错误，此类错误重试无意义"""
+    message = str(error).lower()
+    return any(hint in message for hint in _CONTEXT_ERROR_HINTS)
+
+
+class TokenUsageStats:
+    """记录估算与实际输入 token 的偏差"""
+
+    def __init__(self, log_every: int = 100):
+        self.log_every = log_every
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, model: Optional[str], estimated: int, actual: int) -> None:
+        if not estimated or not actual:
+            return
+        stats = self._stats.setdefault(model or 'unknown', {'count': 0, 'estimated': 0, 'actual': 0})
+        stats['count'] += 1
+        stats['estimated'] += estimated
+        stats['actual'] += actual
+        if stats['count'] % self.log_every == 0:
+            logger.info(f"Token estimate for {model}: {self.ratio(model):.2f}x of actual over {stats['count']} calls")
+
+    def ratio(self, model: Optional[str]) -> float:
+        """估算值/实际值，>1 表示高估"""
+        stats = self._stats.get(model or 'unknown')
+        if not stats or not stats['actual']:
+            return 1.0
+        return stats['estimated'] / stats['actual']
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        return {model: dict(stats) for model, stats in self._stats.items()}
+
+
+token_stats = TokenUsageStats()
@@ -0,0 +1,159 @@
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+from openai import AsyncOpenAI, OpenAIError
+from telegram import Bot, Message
+from config.settings import (
+    TRANSCRIBE_API_KEY,
+    TRANSCRIBE_BASE_URL,
+    TRANSCRIBE_MODEL,
+    AUDIO_MAX_BYTES,
+    TRANSCRIBE_CHUNK_SECONDS,
+    TRANSCRIBE_CONCURRENCY,
+    TRANSCRIBE_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# 转写接口按扩展名识别格式，Telegram 语音的 .oga 需要改为 .ogg
+_EXTENSION_ALIASES = {'.oga': '.ogg', '.opus': '.ogg'}
+
+
+class TranscriptionError(Exception):
+    """无法转写的音频，消息内容直接展示给用户"""
+
+
+def audio_media(message: Message):
+    """语音、音频或音频文档"""
+    if message.voice:
+        return message.voice
+    if message.audio:
+        return message.audio
+    if message.document and message.document.mime_type and message.document.mime_type.startswith('audio/'):
+        return message.document
+    return None
+
+
+async def split_audio(path: str, output_dir: str, chunk_seconds: int, timeout: float) -> List[str]:
+    """用 ffmpeg 子进程把音频转为单声道 mp3 并按时长切分，返回按顺序排列的分段路径"""
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-v', 'error', '-nostdin', '-i', path,
+        '-vn', '-ac', '1', '-ar', '16000', '-c:a', 'libmp3lame', '-b:a', '48k',
+        '-f', 'segment', '-segment_time', str(chunk_seconds), '-reset_timestamps', '1',
+        os.path.join(output_dir, 'chunk_%03d.mp3'),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise TranscriptionError("音频解码超时")
+    if process.returncode:
+        logger.error(f"ffmpeg failed to split audio: {stderr.decode(errors='replace')[-500:]}")
+        raise TranscriptionError("音频解码失败")
+    return [os.path.join(output_dir, name) for name in sorted(os.listdir(output_dir)) if name.startswith('chunk_')]
+
+
+class AudioTranscriber:
+    """语音/音频转写
+
+    音频异步下载到临时目录，长音频用 ffmpeg 切分后并发转写，
+    总耗时取决于最长的分段而非总时长；转写结果按 file_unique_id 存库，
+    同一音频的并发请求共用一次转写。
+    """
+
+    def __init__(
+        self,
+        api_key: str = TRANSCRIBE_API_KEY,
+        base_url: str = TRANSCRIBE_BASE_URL,
+        model: str = TRANSCRIBE_MODEL,
+        max_bytes: int = AUDIO_MAX_BYTES,
+        chunk_seconds: int = TRANSCRIBE_CHUNK_SECONDS,
+        concurrency: int = TRANSCRIBE_CONCURRENCY,
+        timeout: float = TRANSCRIBE_TIMEOUT
+    ):
+        self.model = model
+        self.max_bytes = max_bytes
+        self.chunk_seconds = chunk_seconds
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout) if api_key else None
+        self.can_split = shutil.which('ffmpeg') is not None
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    async def close(self) -> None:
+        if self.client:
+            await self.client.close()
+
+    async def _transcribe_file(self, path: str, semaphore: asyncio.Semaphore) -> str:
+        async with semaphore:
+            with open(path, 'rb') as f:
+                result = await self.client.audio.transcriptions.create(model=self.model, file=f)
+        return result.text.strip()
+
+    async def _transcribe(self, bot: Bot, media, db) -> str:
+        with tempfile.TemporaryDirectory() as work_dir:
+            file = await bot.get_file(media.file_id)
+            extension = os.path.splitext(file.file_path or getattr(media, 'file_name', None) or '')[1].lower()
+            path = os.path.join(work_dir, f"audio{_EXTENSION_ALIASES.get(extension, extension or '.ogg')}")
+            await file.download_to_drive(path)
+            if os.path.getsize(path) > self.max_bytes:
+                raise TranscriptionError(self._too_large_text())
+
+            # 音频文档没有 duration，时长未知时总是切分，短音频只会得到一段
+            duration = getattr(media, 'duration', None)
+            paths = [path]
+            if self.can_split and (duration is None or duration > self.chunk_seconds):
+                paths = await split_audio(path, work_dir, self.chunk_seconds, self.timeout)
+            semaphore = asyncio.Semaphore(self.concurrency)
+            try:
+                texts = await asyncio.gather(*(self._transcribe_file(chunk, semaphore) for chunk in paths))
+            except OpenAIError as e:
+                logger.error(f"Failed to transcribe {media.file_unique_id}: {e}")
+                raise TranscriptionError("语音转写失败，请重试")
+
+        transcript = "\n".join(text for text in texts if text)
+        if transcript:
+            await db.save_media_text(media.file_unique_id, 'transcript', transcript)
+        logger.info(f"Transcribed {media.file_unique_id}: {len(paths)} chunks, {len(transcript)} chars")
+        return transcript
+
+    def _too_large_text(self) -> str:
+        return f"音频超过 {self.max_bytes // (1024 * 1024)}MB，暂不支持处理"
+
+    async def transcribe(self, bot: Bot, db, message: Message) -> str:
+        """返回音频的转写文字，无法处理时抛出 TranscriptionError"""
+        media = audio_media(message)
+        if media is None:
+            raise TranscriptionError("未找到音频文件")
+        if self.client is None:
+            raise TranscriptionError("暂不支持处理语音消息")
+
+        file_unique_id = media.file_unique_id
+        cached = await db.get_media_text(file_unique_id)
+        if cached:
+            return cached
+        if media.file_size and media.file_size > self.max_bytes:
+            raise TranscriptionError(self._too_large_text())
+
+        task = self._pending.get(file_unique_id)
+        if task is None:
+            task = self._pending[file_unique_id] = asyncio.create_task(self._transcribe(bot, media, db))
+            task.add_done_callback(lambda _: self._pending.pop(file_unique_id, None))
+        # 单个等待方取消时不影响其他等待方
+        return await asyncio.shield(task)
+
+    async def get_text(self, bot: Bot, db, message: Message) -> Optional[str]:
+        """转写文字，失败时返回 None"""
+        try:
+            return await self.transcribe(bot, db, message)
+        except TranscriptionError as e:
+            logger.warning(f"Audio not transcribed: {e}")
+        except Exception as e:
+            logger.error(f"Failed to transcribe audio: {e}")
+        return None
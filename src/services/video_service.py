@@ -0,0 +1,148 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+import asyncio
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from telegram import Bot, Message
+from config.settings import (
+    VIDEO_MAX_BYTES,
+    VIDEO_MAX_FRAMES,
+    VIDEO_FRAME_WIDTH,
+    VIDEO_WORKERS,
+    VIDEO_DECODE_TIMEOUT,
+    VIDEO_FRAME_CACHE_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+
+class VideoFrameError(Exception):
+    """无法抽帧的视频，消息内容直接展示给用户"""
+
+
+def video_media(message: Message):
+    """视频、动图或视频文档"""
+    if message.video:
+        return message.video
+    if message.animation:
+        return message.animation
+    if message.document and message.document.mime_type and message.document.mime_type.startswith('video/'):
+        return message.document
+    return None
+
+
+def _probe_duration(path: str) -> float:
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+        capture_output=True, text=True, timeout=30
+    )
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        return 0.0
+
+
+def extract_keyframes(path: str, max_frames: int, width: int, duration: float, timeout: float) -> List[bytes]:
+    """在工作进程中用 ffmpeg 均匀抽帧
+
+    fps 滤镜按时长均匀采样，mpdecimate 丢弃与前一帧几乎相同的画面，
+    输出缩放到固定宽度的 JPEG。ffmpeg 流式解码，内存占用与视频长度无关。
+    """
+    duration = duration or _probe_duration(path)
+    fps = max_frames / duration if duration > 0 else 1
+    with tempfile.TemporaryDirectory() as output_dir:
+        subprocess.run([
+            'ffmpeg', '-v', 'error', '-nostdin', '-i', path,
+            '-vf', f'fps={fps:.6f},mpdecimate,scale={width}:-2',
+            '-vsync', 'vfr', '-frames:v', str(max_frames), '-q:v', '4',
+            os.path.join(output_dir, 'frame_%03d.jpg')
+        ], check=True, capture_output=True, timeout=timeout)
+        frames = []
+        for name in sorted(os.listdir(output_dir)):
+            with open(os.path.join(output_dir, name), 'rb') as f:
+                frames.append(f.read())
+        return frames
+
+
+class VideoFrameExtractor:
+    """视频关键帧提取
+
+    文件异步下载到临时目录，解码在进程池中进行，不阻塞事件循环；
+    结果按 file_unique_id 做 LRU 缓存，同一视频再次分析无需重新下载解码。
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = VIDEO_MAX_BYTES,
+        max_frames: int = VIDEO_MAX_FRAMES,
+        width: int = VIDEO_FRAME_WIDTH,
+        workers: int = VIDEO_WORKERS,
+        timeout: float = VIDEO_DECODE_TIMEOUT,
+        cache_size: int = VIDEO_FRAME_CACHE_SIZE
+    ):
+        self.max_bytes = max_bytes
+        self.max_frames = max_frames
+        self.width = width
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.available = shutil.which('ffmpeg') is not None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._cache: "OrderedDict[str, List[bytes]]" = OrderedDict()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def get_frames(self, bot: Bot, message: Message) -> List[bytes]:
+        media = video_media(message)
+        if media is None:
+            raise VideoFrameError("未找到视频文件")
+        if not self.available:
+            raise VideoFrameError("暂不支持处理video类型的文件")
+
+        cached = self._cache.get(media.file_unique_id)
+        if cached is not None:
+            self._cache.move_to_end(media.file_unique_id)
+            return cached
+
+        if media.file_size and media.file_size > self.max_bytes:
+            raise VideoFrameError(f"视频超过 {self.max_bytes // (1024 * 1024)}MB，暂不支持处理")
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            path = os.path.join(work_dir, 'video')
+            file = await bot.get_file(media.file_id)
+            await file.download_to_drive(path)
+            if os.path.getsize(path) > self.max_bytes:
+                raise VideoFrameError(f"视频超过 {self.max_bytes // (1024 * 1024)}MB，暂不支持处理")
+
+            loop = asyncio.get_running_loop()
+            try:
+                frames = await loop.run_in_executor(
+                    self._get_pool(),
+                    extract_keyframes,
+                    path,
+                    self.max_frames,
+                    self.width,
+                    float(getattr(media, 'duration', 0) or 0),
+                    self.timeout
+                )
+            except (subprocess.SubprocessError, OSError) as e:
+                logger.error(f"Failed to extract keyframes from {media.file_unique_id}: {e}")
+                raise VideoFrameError("视频解码失败，请重试")
+
+        logger.info(f"Extracted {len(frames)} keyframes from {media.file_unique_id}")
+        self._cache[media.file_unique_id] = frames
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return frames
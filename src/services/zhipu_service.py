@@ -1,8 +1,12 @@
+from contextlib import aclosing
 import base64
+from typing import List
 import requests
 from openai import OpenAI
 from config.settings import ZHIPU_API_KEY, ZHIPU_MODEL, ZHIPU_VISION_MODEL
 from .base_service import stream_response
+from .token_budget import estimate_tokens
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,7 +19,8 @@ client = OpenAI(
 async def get_zhipu_response(message: str, system_prompt: str):
     """处理纯文本对话"""
     try:
-        response = client.chat.completions.create(
+        response = await asyncio.to_thread(
+            client.chat.completions.create,
             model=ZHIPU_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -24,8 +29,9 @@ async def get_zhipu_response(message: str, system_prompt: str):
             stream=True
         )
         
-        async for text, update, footer in stream_response(response):
-            yield text, update, footer
+        async with aclosing(stream_response(response, estimated_tokens=estimate_tokens(system_prompt) + estimate_tokens(message))) as chunks:
+            async for text, update, footer in chunks:
+                yield text, update, footer
             
     except Exception as e:
         logger.error(f"Error in zhipu_response: {e}")
@@ -34,7 +40,8 @@ async def get_zhipu_response(message: str, system_prompt: str):
 async def get_zhipu_vision_response(message: str, system_prompt: str, image_url: str):
     """处理图片分析对话"""
     try:
-        response = client.chat.completions.create(
+        response = await asyncio.to_thread(
+            client.chat.completions.create,
             model=ZHIPU_VISION_MODEL,  # 使用支持图片的模型
             messages=[
                 # {"role": "system", "content": system_prompt},
@@ -55,8 +62,9 @@ async def get_zhipu_vision_response(message: str, system_prompt: str, image_url:
             stream=True
         )
         
-        async for text, update, footer in stream_response(response):
-            yield text, update, footer
+        async with aclosing(stream_response(response)) as chunks:
+            async for text, update, footer in chunks:
+                yield text, update, footer
             
     except Exception as e:
         logger.error(f"Error in zhipu_vision_response: {e}")
@@ -76,7 +84,17 @@ async def get_zhipu_vision_response_base64(message: str, system_prompt: str, ima
     """使用base64处理图片分析对话"""
     try:
         image_base64 = image_to_base64(image_url)
-        response = client.chat.completions.create(
+    except Exception as e:
+        yield f"智谱AI图片分析服务暂时不可用，请稍后重试。错误: {str(e)}", True, ""
+        return
+    async for text, update, footer in get_zhipu_vision_images_response(message, system_prompt, [image_base64]):
+        yield text, update, footer
+
+async def get_zhipu_vision_images_response(message: str, system_prompt: str, images_base64: List[str]):
+    """一次请求分析多张图片（数量受 VISION_MAX_IMAGES 限制）"""
+    try:
+        response = await asyncio.to_thread(
+            client.chat.completions.create,
             model=ZHIPU_VISION_MODEL,
             messages=[
                 # {"role": "system", "content": system_prompt},
@@ -86,7 +104,9 @@ async def get_zhipu_vision_response_base64(message: str, system_prompt: str, ima
                         {
                             "type": "image_url",
                             "image_url": {"url": image_base64}
-                        },
+                        }
+                        for image_base64 in images_base64
+                    ] + [
                         {
                             "type": "text",
                             "text": message
@@ -97,9 +117,10 @@ async def get_zhipu_vision_response_base64(message: str, system_prompt: str, ima
             stream=True
         )
         
-        async for text, update, footer in stream_response(response):
-            yield text, update, footer
+        async with aclosing(stream_response(response)) as chunks:
+            async for text, update, footer in chunks:
+                yield text, update, footer
             
     except Exception as e:
-        logger.error(f"Error in zhipu_vision_response_base64: {e}")
-        yield f"智谱AI图片分析服务暂时不可用，请稍后重试。错误: {str(e)}", True, ""
\ No newline at end of file
+        logger.error(f"Error in zhipu_vision_images_response: {e}")
+        yield f"智谱AI图片分析服务暂时不可用，请稍后重试。错误: {str(e)}", True, ""
@@ -0,0 +1,180 @@
+from contextlib import asynccontextmanager
+from functools import wraps
+from typing import AsyncIterator, Dict, Hashable, Optional, Set
+import asyncio
+import logging
+from telegram import Update
+from telegram.ext import ContextTypes
+from config.settings import (
+    ADMISSION_MAX_INFLIGHT,
+    ADMISSION_MAX_WAITING,
+    ADMISSION_MAX_LAG,
+    ADMISSION_DEFER_PRIORITY,
+    ADMISSION_WAIT_TIMEOUT
+)
+from config.response_settings import RESPONSE_PRIORITY
+from utils.telegram_handler import TelegramMessageHandler
+
+logger = logging.getLogger(__name__)
+
+ADMITTED, COALESCED, BUSY = "admitted", "coalesced", "busy"
+
+BUSY_TEXT = "当前请求较多，请稍后再试"
+COALESCED_TEXT = "这条消息正在处理中，请稍候"
+
+
+class AdmissionController:
+    """AI 请求的准入控制
+
+    统计进行中的 AI 请求数、排队数和事件循环延迟。高优先级请求（命令、@）
+    可用全部并发槽位，低优先级请求只能占用一半，负载较高时进入等待；
+    同一用户针对同一条被回复消息的重复请求直接合并；排队已满或等待超时时快速回复繁忙。
+    """
+
+    def __init__(
+        self,
+        max_inflight: int = ADMISSION_MAX_INFLIGHT,
+        max_waiting: int = ADMISSION_MAX_WAITING,
+        max_lag: float = ADMISSION_MAX_LAG,
+        defer_priority: int = ADMISSION_DEFER_PRIORITY,
+        wait_timeout: float = ADMISSION_WAIT_TIMEOUT
+    ):
+        self.max_inflight = max_inflight
+        self.max_waiting = max_waiting
+        self.max_lag = max_lag
+        self.defer_priority = defer_priority
+        self.wait_timeout = wait_timeout
+        self.inflight = 0
+        self.waiting = 0
+        self.lag = 0.0
+        self._keys: Set[Hashable] = set()
+        self._cond = asyncio.Condition()
+        self._monitor: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {ADMITTED: 0, COALESCED: 0, BUSY: 0, 'deferred': 0}
+
+    def start(self, interval: float = 0.5) -> None:
+        """启动事件循环延迟监测"""
+        if self._monitor is None:
+            self._monitor = asyncio.create_task(self._monitor_lag(interval))
+
+    async def stop(self) -> None:
+        if self._monitor:
+            self._monitor.cancel()
+            self._monitor = None
+
+    async def _monitor_lag(self, interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(loop.time() - start - interval, 0.0)
+            if lag > self.max_lag >= self.lag:
+                logger.warning(f"Event loop lag {lag * 1000:.0f}ms, shedding load: {self.snapshot()}")
+            self.lag = lag
+            if self.waiting and lag <= self.max_lag:
+                async with self._cond:
+                    self._cond.notify_all()
+
+    def _limit_for(self, priority: int) -> int:
+        if priority >= self.defer_priority:
+            return max(self.max_inflight // 2, 1)
+        return self.max_inflight
+
+    def _can_start(self, priority: int) -> bool:
+        return self.inflight < self._limit_for(priority) and self.lag <= self.max_lag
+
+    def snapshot(self) -> Dict[str, float]:
+        return {'inflight': self.inflight, 'waiting': self.waiting, 'lag': round(self.lag, 3), **self.stats}
+
+    async def acquire(self, priority: int, key: Optional[Hashable] = None) -> str:
+        """申请一个 AI 请求槽位，返回 ADMITTED/COALESCED/BUSY"""
+        if key is not None and key in self._keys:
+            self.stats[COALESCED] += 1
+            return COALESCED
+        if self._can_start(priority):
+            self.inflight += 1
+            self._reserve(key)
+            self.stats[ADMITTED] += 1
+            return ADMITTED
+        if self.waiting >= self.max_waiting:
+            self.stats[BUSY] += 1
+            logger.warning(f"Admission queue full, rejecting request: {self.snapshot()}")
+            return BUSY
+
+        self._reserve(key)
+        self.waiting += 1
+        if priority >= self.defer_priority:
+            self.stats['deferred'] += 1
+        try:
+            async with self._cond:
+                await asyncio.wait_for(self._cond.wait_for(lambda: self._can_start(priority)), self.wait_timeout)
+                self.inflight += 1
+        except asyncio.TimeoutError:
+            self._keys.discard(key)
+            self.stats[BUSY] += 1
+            return BUSY
+        except BaseException:
+            self._keys.discard(key)
+            raise
+        finally:
+            self.waiting -= 1
+        self.stats[ADMITTED] += 1
+        return ADMITTED
+
+    def _reserve(self, key: Optional[Hashable]) -> None:
+        if key is not None:
+            self._keys.add(key)
+
+    async def release(self, key: Optional[Hashable] = None) -> None:
+        self.inflight -= 1
+        self._keys.discard(key)
+        async with self._cond:
+            self._cond.notify_all()
+
+    @asynccontextmanager
+    async def admit(self, priority: int, key: Optional[Hashable] = None) -> AsyncIterator[str]:
+        """申请槽位，仅在 ADMITTED 时于退出时释放"""
+        decision = await self.acquire(priority, key)
+        try:
+            yield decision
+        finally:
+            if decision == ADMITTED:
+                await self.release(key)
+
+
+def coalesce_key(update: Update, kind: str) -> Optional[Hashable]:
+    """同一用户针对同一条被回复消息重复发出的相同请求使用相同的合并键
+
+    不同用户或不同问题各自处理，相同输入由 get_ai_response 的 single-flight 共享上游请求。
+    """
+    message = update.effective_message
+    if not message or not message.reply_to_message:
+        return None
+    user_id = update.effective_user.id if update.effective_user else None
+    text = ' '.join((message.text or message.caption or '').split()).casefold()
+    return (message.chat_id, message.reply_to_message.message_id, kind, user_id, text)
+
+
+async def reject_admission(update: Update, context: ContextTypes.DEFAULT_TYPE, decision: str) -> None:
+    """合并或繁忙时的快速回复，在后台发送并自动删除，不占用更新处理"""
+    message = update.effective_message
+    if not message:
+        return
+    handler = TelegramMessageHandler(update, context)
+    context.application.create_task(handler.send_notification(
+        COALESCED_TEXT if decision == COALESCED else BUSY_TEXT,
+        reply_to_message_id=message.message_id
+    ))
+
+
+def admission_controlled(func):
+    """命令处理器装饰器：按命令优先级申请槽位，同一用户对同一被回复消息的重复命令合并"""
+    @wraps(func)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        admission: AdmissionController = context.bot_data['admission']
+        async with admission.admit(RESPONSE_PRIORITY['commands'], coalesce_key(update, func.__name__)) as decision:
+            if decision != ADMITTED:
+                await reject_admission(update, context, decision)
+                return
+            await func(update, context)
+    return wrapper
@@ -9,12 +9,13 @@ def get_content_options_buttons():
         ]
     ])
 
-def get_vote_buttons():
-    """获取投票按钮 (仅管理员操作)"""
+def get_vote_buttons(vote_id: int = None):
+    """获取投票按钮 (仅管理员操作)，回调数据携带 vote_id"""
+    suffix = f':{vote_id}' if vote_id is not None else ''
     return InlineKeyboardMarkup([
         [
-            InlineKeyboardButton("管理员同意", callback_data='admin_approve'),
-            InlineKeyboardButton("管理员拒绝", callback_data='admin_reject')
+            InlineKeyboardButton("管理员同意", callback_data=f'admin_approve{suffix}'),
+            InlineKeyboardButton("管理员拒绝", callback_data=f'admin_reject{suffix}')
         ]
     ])
 
@@ -32,4 +33,10 @@ def get_prompt_selection_buttons():
         [
             InlineKeyboardButton("聊天", callback_data='prompt_chat')
         ]
-    ]) 
\ No newline at end of file
+    ]) 
+
+def get_stop_button():
+    """生成中的停止按钮"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("⏹ 停止", callback_data='stop_generation')]
+    ])
\ No newline at end of file
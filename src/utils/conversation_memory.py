@@ -0,0 +1,211 @@
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Set
+import asyncio
+import html
+import logging
+import re
+from config.settings import MEMORY_MAX_CHATS, MEMORY_MAX_TURNS, MEMORY_TOKEN_BUDGETS, MEMORY_REPLY_CHAIN
+from prompts.prompts import MEMORY_SUMMARY_PROMPT
+from services.ai_service import get_ai_text, get_current_model
+from services.token_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_FOOTER_PATTERN = re.compile(r'<i>.*?</i>', re.S)
+_TAG_PATTERN = re.compile(r'<[^>]+>')
+_STATUS_PREFIXES = ("正在", "处理失败")
+
+
+def strip_bot_markup(text: str) -> str:
+    """去除机器人回复中的 HTML 标签和页脚"""
+    return html.unescape(_TAG_PATTERN.sub('', _FOOTER_PATTERN.sub('', text or ''))).strip()
+
+
+@dataclass
+class Turn:
+    role: str  # user/assistant
+    text: str
+    tokens: int
+    message_id: Optional[int] = None
+
+
+@dataclass
+class ChatMemory:
+    turns: Deque[Turn] = field(default_factory=lambda: deque(maxlen=MEMORY_MAX_TURNS))
+    summary: str = ""
+    overflow: List[Turn] = field(default_factory=list)
+    compacting: bool = False
+
+
+class ConversationMemory:
+    """私聊多轮对话记忆
+
+    每个会话维护一个定长环形缓冲区，冷启动时从 messages 表回填；
+    回复的消息已不在缓冲区时，沿回复链从 messages 表补充被回复的上文。
+    超出 token 预算的早期轮次在后台压缩为摘要，不阻塞当前请求。
+    全局按 LRU 淘汰空闲会话，内存占用上限为 max_chats * max_turns 轮。
+    """
+
+    def __init__(self, max_chats: int = MEMORY_MAX_CHATS):
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[int, ChatMemory]" = OrderedDict()
+        self._compactions: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def token_budget(model: Optional[str] = None) -> int:
+        model = model or get_current_model()
+        return MEMORY_TOKEN_BUDGETS.get(model, MEMORY_TOKEN_BUDGETS['default'])
+
+    async def _get_chat(self, db, chat_id: int, exclude_message_id: Optional[int] = None) -> ChatMemory:
+        memory = self._chats.get(chat_id)
+        if memory is not None:
+            self._chats.move_to_end(chat_id)
+            return memory
+
+        memory = ChatMemory()
+        for row in await db.get_recent_turns(chat_id, MEMORY_MAX_TURNS + 1) or []:
+            if row['message_id'] != exclude_message_id:
+                turn = self._row_turn(row)
+                if turn:
+                    memory.turns.append(turn)
+
+        self._chats[chat_id] = memory
+        while len(self._chats) > self.max_chats:
+            evicted, _ = self._chats.popitem(last=False)
+            logger.debug(f"Conversation memory evicted chat {evicted}")
+        return memory
+
+    @staticmethod
+    def _row_turn(row: Dict) -> Optional[Turn]:
+        """messages 表中的一行转为对话轮次，跳过状态提示等非对话消息"""
+        if row['type'] == 'bot_message':
+            text = strip_bot_markup(row['text'])
+            if not text or text.startswith(_STATUS_PREFIXES):
+                return None
+            return Turn('assistant', text, estimate_tokens(text), row['message_id'])
+        if row['type'] == 'user_message':
+            return Turn('user', row['text'], estimate_tokens(row['text']), row['message_id'])
+        return None
+
+    @staticmethod
+    def _fit(turns: Deque[Turn], remaining: int) -> int:
+        """从最近一轮往前，预算内能放下的轮数"""
+        count = 0
+        for turn in reversed(turns):
+            if turn.tokens > remaining:
+                break
+            remaining -= turn.tokens
+            count += 1
+        return count
+
+    async def _reply_chain(
+        self,
+        db,
+        chat_id: int,
+        reply_to_message_id: int,
+        known: Set[int],
+        remaining: int
+    ) -> List[Turn]:
+        """回复链上不在 known 中的消息，从最近的开始放入剩余预算"""
+        chain: List[Turn] = []
+        rows = await db.get_reply_chain(chat_id, reply_to_message_id, MEMORY_REPLY_CHAIN) or []
+        for row in reversed(rows):
+            turn = None if row['message_id'] in known else self._row_turn(row)
+            if turn is None:
+                continue
+            if turn.tokens > remaining:
+                break
+            chain.append(turn)
+            remaining -= turn.tokens
+        return chain[::-1]
+
+    async def build_context(
+        self,
+        db,
+        chat_id: int,
+        message_text: str,
+        exclude_message_id: Optional[int] = None,
+        reply_to_message_id: Optional[int] = None
+    ) -> str:
+        """拼接历史上下文与当前消息，保证总量不超过模型预算
+
+        回复的消息已不在缓冲区时，回复链优先占用预算，其余预算再留给最近的轮次。
+        """
+        memory = await self._get_chat(db, chat_id, exclude_message_id)
+        remaining = self.token_budget() - estimate_tokens(message_text) - estimate_tokens(memory.summary)
+
+        # 放不下的早期轮次转入后台压缩
+        dropped = len(memory.turns) - self._fit(memory.turns, remaining)
+        if dropped:
+            for _ in range(dropped):
+                memory.overflow.append(memory.turns.popleft())
+            self._schedule_compaction(chat_id, memory)
+
+        chain: List[Turn] = []
+        if reply_to_message_id and all(turn.message_id != reply_to_message_id for turn in memory.turns):
+            # 被回复的消息本身已作为 [引用] 包含在当前消息中，只补充更早的上文
+            known = {turn.message_id for turn in memory.turns if turn.message_id} | {reply_to_message_id}
+            chain = await self._reply_chain(db, chat_id, reply_to_message_id, known, remaining)
+            remaining -= sum(turn.tokens for turn in chain)
+
+        # 回复链占用的预算只让出本次请求中最早的轮次，不把它们转入压缩
+        count = self._fit(memory.turns, remaining)
+        selected = list(memory.turns)[len(memory.turns) - count:] if count else []
+
+        if not selected and not memory.summary and not chain:
+            return message_text
+
+        parts = []
+        if memory.summary:
+            parts.append(f"[早前对话摘要]\n{memory.summary}")
+        if chain:
+            parts.append("[回复的上文]\n" + "\n".join(
+                f"{'用户' if turn.role == 'user' else 'PickPin'}: {turn.text}" for turn in chain
+            ))
+        if selected:
+            history = "\n".join(
+                f"{'用户' if turn.role == 'user' else 'PickPin'}: {turn.text}" for turn in selected
+            )
+            parts.append(f"[历史对话]\n{history}")
+        parts.append(message_text)
+        return "\n\n".join(parts)
+
+    def add_turn(self, chat_id: int, role: str, text: str, message_id: Optional[int] = None) -> None:
+        """记录一轮对话，assistant 文本会去除 HTML 包装"""
+        memory = self._chats.get(chat_id)
+        if memory is None:
+            return
+        if role == 'assistant':
+            text = strip_bot_markup(text)
+        if not text:
+            return
+        if len(memory.turns) == memory.turns.maxlen:
+            memory.overflow.append(memory.turns[0])
+            self._schedule_compaction(chat_id, memory)
+        memory.turns.append(Turn(role, text, estimate_tokens(text), message_id))
+
+    def _schedule_compaction(self, chat_id: int, memory: ChatMemory) -> None:
+        if memory.compacting or not memory.overflow:
+            return
+        memory.compacting = True
+        # 保留任务引用，避免后台任务在完成前被回收
+        task = asyncio.create_task(self._compact(chat_id, memory))
+        self._compactions.add(task)
+        task.add_done_callback(self._compactions.discard)
+
+    async def _compact(self, chat_id: int, memory: ChatMemory) -> None:
+        try:
+            while memory.overflow:
+                turns, memory.overflow = memory.overflow, []
+                history = "\n".join(
+                    f"{'用户' if turn.role == 'user' else 'PickPin'}: {turn.text}" for turn in turns
+                )
+                source = f"[已有摘要]\n{memory.summary}\n\n{history}" if memory.summary else history
+                summary = await get_ai_text(source, MEMORY_SUMMARY_PROMPT)
+                if summary:
+                    memory.summary = summary
+        except Exception as e:
+            logger.error(f"Failed to compact conversation memory for chat {chat_id}: {e}")
+        finally:
+            memory.compacting = False
@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Awaitable, Dict, Optional, Tuple
+import asyncio
+import logging
+import unicodedata
+from telegram import Message
+from config.settings import EDIT_DEBOUNCE_WINDOW, EDIT_TRIVIAL_RATIO, EDIT_TRACK_SIZE
+
+logger = logging.getLogger(__name__)
+
+EditKey = Tuple[int, int]
+
+
+def normalize_text(text: str) -> str:
+    """去掉空白和标点并统一大小写、全半角，用于判断编辑是否有实质变化"""
+    text = unicodedata.normalize('NFKC', text or "").casefold()
+    return ''.join(ch for ch in text if not ch.isspace() and not unicodedata.category(ch).startswith('P'))
+
+
+@dataclass
+class _Reply:
+    status_msg: Message
+    text: str
+    task: Optional[asyncio.Task] = None
+    owner: Optional[asyncio.Task] = None
+
+
+class EditTracker:
+    """编辑消息的增量重新处理
+
+    按 (chat_id, message_id) 记录每条原消息对应的状态消息、处理时的文字和进行中的生成任务。
+    连续编辑只处理 window 秒内的最后一次；规范化后变化很小的编辑不重新生成；
+    否则取消上一版本仍在进行的生成，复用原状态消息输出新回复。
+    """
+
+    def __init__(
+        self,
+        window: float = EDIT_DEBOUNCE_WINDOW,
+        trivial_ratio: float = EDIT_TRIVIAL_RATIO,
+        max_size: int = EDIT_TRACK_SIZE
+    ):
+        self.window = window
+        self.trivial_ratio = trivial_ratio
+        self.max_size = max_size
+        self._replies: "OrderedDict[EditKey, _Reply]" = OrderedDict()
+        self._versions: Dict[EditKey, int] = {}
+
+    async def debounce(self, key: EditKey) -> bool:
+        """等待编辑停止，只有最后一次编辑返回 True"""
+        version = self._versions[key] = self._versions.get(key, 0) + 1
+        await asyncio.sleep(self.window)
+        if self._versions.get(key) != version:
+            return False
+        del self._versions[key]
+        return True
+
+    def is_trivial(self, key: EditKey, text: str) -> bool:
+        """与上次处理时的文字相比变化很小（如只改了标点、空格或个别错字）"""
+        reply = self._replies.get(key)
+        if reply is None:
+            return False
+        before, after = normalize_text(reply.text), normalize_text(text)
+        return before == after or SequenceMatcher(None, before, after).ratio() >= self.trivial_ratio
+
+    async def supersede(self, key: EditKey) -> Optional[Message]:
+        """取消上一版本进行中的生成，返回可复用的状态消息
+
+        同时等待上一版本的处理流程退出，使其占用的准入名额和合并键先行释放。
+        """
+        reply = self._replies.get(key)
+        if reply is None:
+            return None
+        if reply.task and not reply.task.done():
+            logger.info(f"Cancelling generation for edited message {key}")
+            reply.task.cancel()
+            await asyncio.wait([reply.task])
+            if reply.owner and reply.owner is not asyncio.current_task():
+                await asyncio.wait([reply.owner])
+        return reply.status_msg
+
+    async def run(self, key: EditKey, status_msg: Message, text: str, processor: Awaitable) -> None:
+        """登记并执行一次生成，被后续编辑取消时正常返回"""
+        reply = self._replies[key] = _Reply(status_msg, text, owner=asyncio.current_task())
+        self._replies.move_to_end(key)
+        while len(self._replies) > self.max_size:
+            self._replies.popitem(last=False)
+
+        reply.task = asyncio.create_task(processor)
+        try:
+            await asyncio.wait([reply.task])
+        except asyncio.CancelledError:
+            reply.task.cancel()
+            raise
+        if not reply.task.cancelled() and reply.task.exception():
+            raise reply.task.exception()
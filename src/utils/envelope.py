@@ -0,0 +1,184 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from telegram import Message, Update
+from services.document_service import document_kind
+from services.transcribe_service import audio_media
+
+BOT_USERNAME = 'rk_pin_bot'  # 替换为你的机器人用户名
+
+
+def media_kind(message: Message) -> str:
+    """消息包含的媒体类型：photo/video/audio/document，没有可处理的媒体时为空字符串"""
+    if message.photo:
+        return "photo"
+    document_type = message.document.mime_type if message.document and message.document.mime_type else ""
+    if document_type.startswith('image/'):
+        return "photo"
+    if message.video or message.animation or document_type.startswith('video/'):
+        return "video"
+    if audio_media(message):
+        return "audio"
+    if document_kind(message):
+        return "document"
+    return ""
+
+
+def forward_origin(message: Message) -> Tuple[int, int]:
+    """投稿对应的原始消息 (chat_id, message_id)：频道转发取原频道消息，否则为消息本身"""
+    origin = getattr(message, 'forward_origin', None)
+    if origin is None and hasattr(message, 'api_kwargs'):
+        # 旧版本 python-telegram-bot 把 forward_origin 放在 api_kwargs 中
+        origin = message.api_kwargs.get('forward_origin')
+    if isinstance(origin, dict):
+        if origin.get('type') == 'channel':
+            return origin.get('chat', {}).get('id'), origin.get('message_id')
+    elif origin is not None:
+        if origin.type == 'channel':
+            return origin.chat.id, origin.message_id
+    elif getattr(message, 'forward_from_chat', None):
+        # 兼容旧的转发消息格式（python-telegram-bot 21 起已移除）
+        return message.forward_from_chat.id, message.forward_from_message_id
+    return message.chat_id, message.message_id
+
+
+def process_text_with_entities(text: str, entities: list) -> str:
+    """处理带格式的文本，保留格式信息"""
+    if not text or not entities:
+        return text
+
+    # 按位置排序实体
+    sorted_entities = sorted(entities, key=lambda e: e.offset)
+    result = []
+    last_offset = 0
+
+    for entity in sorted_entities:
+        # 添加实体前的文本
+        result.append(text[last_offset:entity.offset])
+
+        # 获取实体文本
+        entity_text = text[entity.offset:entity.offset + entity.length]
+
+        # 根据实体类型处理
+        if entity.type == "text_link":
+            result.append(f"{entity_text}({entity.url})")
+        elif entity.type == "bold":
+            result.append(f"**{entity_text}**")
+        elif entity.type == "italic":
+            result.append(f"*{entity_text}*")
+        elif entity.type == "code":
+            result.append(f"`{entity_text}`")
+        elif entity.type == "pre":
+            result.append(f"```\n{entity_text}\n```")
+        elif entity.type == "mention":
+            continue  # 跳过@提及
+        else:
+            result.append(entity_text)
+
+        last_offset = entity.offset + entity.length
+
+    # 添加剩余文本
+    result.append(text[last_offset:])
+    return "".join(result)
+
+
+class Envelope:
+    """一条消息解析一次后的只读视图
+
+    实体处理后的文本、是否@机器人、媒体类型、投稿原始消息、被回复消息等
+    在创建时一次算好；序列化结果在首次使用时缓存，供数据库和日志共用。
+    """
+
+    __slots__ = (
+        'update', 'message', 'message_id', 'chat_id', 'chat_type', 'user_id',
+        'raw_text', 'text', 'is_command', 'command', 'mentions_bot', 'replies_to_bot',
+        'media', 'origin', 'reply', '_serialized'
+    )
+
+    def __init__(self, message: Message, update: Optional[Update] = None):
+        set_ = super().__setattr__
+        set_('update', update)
+        set_('message', message)
+        set_('message_id', message.message_id)
+        set_('chat_id', message.chat.id)
+        set_('chat_type', message.chat.type)
+        set_('user_id', message.from_user.id if message.from_user else None)
+
+        raw_text = message.text or message.caption
+        set_('raw_text', raw_text)
+        is_command = bool(message.text and message.text.startswith('/'))
+        set_('is_command', is_command)
+        set_('command', message.text.split()[0][1:] if is_command else None)
+
+        # 一次扫描实体：识别@机器人并去掉群组消息中的@部分
+        mentions_bot = False
+        current_text = raw_text or ""
+        for entity in message.entities or []:
+            if entity.type == 'mention':
+                mention = message.text[entity.offset:entity.offset + entity.length]
+                if mention == f'@{BOT_USERNAME}':
+                    mentions_bot = True
+                if message.chat.type != 'private':
+                    current_text = current_text.replace(mention, '').strip()
+        set_('mentions_bot', mentions_bot)
+
+        reply_to = message.reply_to_message
+        replies_to_bot = bool(reply_to and reply_to.from_user and reply_to.from_user.username == BOT_USERNAME)
+        set_('replies_to_bot', replies_to_bot)
+        set_('media', media_kind(message))
+        set_('origin', forward_origin(message))
+        set_('reply', Envelope(reply_to) if reply_to else None)
+        set_('text', self._prompt_text(message, current_text, replies_to_bot))
+        set_('_serialized', None)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"Envelope is read-only: {name}")
+
+    @staticmethod
+    def _prompt_text(message: Message, current_text: str, replies_to_bot: bool) -> str:
+        """供 AI 使用的文本，包括引用的消息或回复的消息"""
+        text = []
+
+        # 处理引用/回复的消息
+        if message.reply_to_message:
+            quoted_text = message.reply_to_message.text or message.reply_to_message.caption or ""
+            if quoted_text:
+                # 如果是回复bot的消息，添加标记
+                if replies_to_bot:
+                    text.append(f"[上文]\n{quoted_text}")
+                else:
+                    text.append(f"[引用]\n{quoted_text}")
+
+        # 处理文本实体（加粗、链接等）
+        entities = message.entities or message.caption_entities
+        if current_text and entities:
+            current_text = process_text_with_entities(current_text, entities)
+
+        if current_text:
+            text.append(f"[当前消息]\n{current_text}")
+
+        return "\n\n".join(text).strip()
+
+    def serialized(self) -> Dict[str, Any]:
+        """完整的 update（没有时为消息）序列化结果，只计算一次"""
+        if self._serialized is None:
+            super().__setattr__('_serialized', (self.update or self.message).to_dict())
+        return self._serialized
+
+
+# 按 update_id 缓存最近的信封，同一更新的各处理环节共用
+_ENVELOPE_CACHE_SIZE = 256
+_envelopes: "OrderedDict[int, Envelope]" = OrderedDict()
+
+
+def envelope(update: Update) -> Optional[Envelope]:
+    """取得 update 的信封，没有消息（如回调、投票更新）时返回 None"""
+    cached = _envelopes.get(update.update_id)
+    if cached is not None and cached.update is update:
+        return cached
+    message = update.effective_message
+    if message is None:
+        return None
+    env = _envelopes[update.update_id] = Envelope(message, update)
+    while len(_envelopes) > _ENVELOPE_CACHE_SIZE:
+        _envelopes.popitem(last=False)
+    return env
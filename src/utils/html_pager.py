@@ -0,0 +1,78 @@
+from typing import List, Tuple
+import re
+
+TELEGRAM_PAGE_LIMIT = 4000  # Telegram 单条消息上限 4096，预留闭合标签的余量
+
+_TAG_PATTERN = re.compile(r'<(/?)([a-zA-Z-]+)([^>]*)>')
+
+
+def _open_tags_at(text: str, end: int, stack: List[Tuple[str, str]], start: int = 0) -> List[Tuple[str, str]]:
+    """扫描 text[start:end] 中的标签，返回截至 end 仍未闭合的 (标签名, 完整开标签)"""
+    stack = list(stack)
+    for match in _TAG_PATTERN.finditer(text, start, end):
+        closing, name = match.group(1), match.group(2).lower()
+        if closing:
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i][0] == name:
+                    del stack[i:]
+                    break
+        else:
+            stack.append((name, match.group(0)))
+    return stack
+
+
+def _safe_split(text: str, start: int, limit: int) -> int:
+    """在 (start, start+limit] 中找到不切断标签/实体的切分点，优先换行处"""
+    end = min(start + limit, len(text))
+    window = text[start:end]
+
+    # 不能落在标签或实体内部
+    last_lt, last_gt = window.rfind('<'), window.rfind('>')
+    if last_lt > last_gt:
+        end = start + last_lt
+    last_amp = text.rfind('&', start, end)
+    if last_amp != -1 and ';' not in text[last_amp:end]:
+        end = last_amp
+
+    newline = text.rfind('\n', start, end)
+    if newline > start + limit // 2:
+        return newline + 1
+    return end if end > start else min(start + limit, len(text))
+
+
+def paginate_html(text: str, limit: int = TELEGRAM_PAGE_LIMIT) -> List[str]:
+    """将 HTML 文本按长度切分为多页，跨页的标签在页尾闭合、下页开头重新打开
+
+    切分只依赖前缀内容，文本在末尾追加时已切好的前几页保持不变。
+    """
+    if len(text) <= limit:
+        return [text]
+
+    pages = []
+    stack: List[Tuple[str, str]] = []
+    start = 0
+    while start < len(text):
+        reopen = "".join(tag for _, tag in stack)
+        budget = limit - len(reopen) - sum(len(name) + 3 for name, _ in stack) - 64  # 64 为新打开标签的闭合余量
+        if len(text) - start <= limit - len(reopen):
+            pages.append(reopen + text[start:])
+            break
+        end = _safe_split(text, start, max(budget, 1))
+        next_stack = _open_tags_at(text, end, stack, start)
+        close = "".join(f"</{name}>" for name, _ in reversed(next_stack))
+        pages.append(reopen + text[start:end] + close)
+        stack, start = next_stack, end
+    return pages
+
+
+def paginate_text(text: str, limit: int = TELEGRAM_PAGE_LIMIT) -> List[str]:
+    """纯文本分页，优先在换行处切分"""
+    pages = []
+    start = 0
+    while len(text) - start > limit:
+        newline = text.rfind('\n', start, start + limit)
+        end = newline + 1 if newline > start + limit // 2 else start + limit
+        pages.append(text[start:end])
+        start = end
+    pages.append(text[start:])
+    return pages
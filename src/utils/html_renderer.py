@@ -0,0 +1,84 @@
+from typing import List
+import re
+
+HTML_ESCAPE_TABLE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+
+# 模型输出中常见的 Markdown 标记 → Telegram HTML 标签
+_TOKEN_PATTERN = re.compile(r'```|\*\*|`')
+_TOKEN_TAGS = {'```': 'pre', '**': 'b', '`': 'code'}
+_LITERAL_TAGS = ('pre', 'code')
+_RUN_TOKEN_LEN = {'*': 2, '`': 3}  # 连续字符组成的最长标记
+
+
+def escape_html(text: str) -> str:
+    """单次遍历转义 HTML 特殊字符"""
+    return text.translate(HTML_ESCAPE_TABLE)
+
+
+class StreamingHTMLRenderer:
+    """流式输出的增量 HTML 渲染
+
+    providers 产出的是不断增长的累计文本，这里只转义新追加的部分，
+    并跨分块保留标签状态（未闭合的粗体/代码块），末尾可能组成标记的
+    `*`、`` ` `` 暂存到下一次再处理。每次快照只需拼接已渲染内容并补齐闭合标签，
+    总转义成本与输出长度成线性关系。
+    """
+
+    def __init__(self):
+        self._consumed = 0
+        self._body = ""
+        self._parts: List[str] = []
+        self._open: List[str] = []
+        self._pending = ""
+
+    def reset(self) -> None:
+        self.__init__()
+
+    def feed(self, text: str) -> None:
+        """输入累计文本，仅处理自上次以来新增的部分"""
+        if len(text) < self._consumed:
+            # 上游重试后重新开始输出
+            self.reset()
+        chunk = self._pending + text[self._consumed:]
+        self._consumed = len(text)
+
+        # 末尾连续的 * 或 ` 可能与后续字符组成更长的标记，暂不处理
+        cut = len(chunk)
+        if chunk and chunk[-1] in _RUN_TOKEN_LEN:
+            run_char = chunk[-1]
+            while cut > 0 and chunk[cut - 1] == run_char:
+                cut -= 1
+            cut = len(chunk) - (len(chunk) - cut) % _RUN_TOKEN_LEN[run_char]
+        self._pending = chunk[cut:]
+        self._render(chunk[:cut])
+
+    def _render(self, chunk: str) -> None:
+        position = 0
+        for match in _TOKEN_PATTERN.finditer(chunk):
+            self._parts.append(escape_html(chunk[position:match.start()]))
+            self._toggle(match.group(0))
+            position = match.end()
+        self._parts.append(escape_html(chunk[position:]))
+
+    def _toggle(self, token: str) -> None:
+        tag = _TOKEN_TAGS[token]
+        if self._open and self._open[-1] == tag:
+            self._open.pop()
+            self._parts.append(f"</{tag}>")
+        elif (self._open and self._open[-1] in _LITERAL_TAGS) or tag in self._open:
+            # 代码内的标记、交叉嵌套的标记按原文输出
+            self._parts.append(escape_html(token))
+        else:
+            self._open.append(tag)
+            self._parts.append(f"<{tag}>")
+
+    def html(self, final: bool = False) -> str:
+        """当前的 Telegram HTML 快照，未闭合的标签在末尾补齐"""
+        if final and self._pending:
+            self._parts.append(escape_html(self._pending))
+            self._pending = ""
+        if self._parts:
+            self._body += "".join(self._parts)
+            self._parts.clear()
+        closing = "".join(f"</{tag}>" for tag in reversed(self._open))
+        return self._body + escape_html(self._pending) + closing
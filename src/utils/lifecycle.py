@@ -0,0 +1,156 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+from telegram import Bot, Message
+from services.ai_service import get_ai_response
+from utils.html_pager import paginate_html, paginate_text
+
+logger = logging.getLogger(__name__)
+
+GENERATING_PREFIX = "正在生成中："
+INTERRUPTED_NOTE = "（生成因机器人重启中断，请重新发送）"
+RESTARTING_TEXT = "机器人正在重启，请稍后重新发送"
+STOPPED_NOTE = "（已停止生成）"
+
+
+@dataclass
+class ActiveStream:
+    message: Message
+    text: str
+    parse_mode: Optional[str]
+    resume: Optional[Dict[str, str]]
+    task: Optional[asyncio.Task]
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            'chat_id': self.message.chat_id,
+            'message_id': self.message.message_id,
+            'text': self.text,
+            'parse_mode': self.parse_mode,
+            'resume_message': (self.resume or {}).get('message'),
+            'resume_prompt': (self.resume or {}).get('prompt')
+        }
+
+
+class StreamRegistry:
+    """进行中的流式回复登记
+
+    关闭时先停止接收新请求，等待登记的流在期限内完成；
+    期限后仍未完成的流写入 pending_streams 表并取消，下次启动时恢复或收尾。
+    """
+
+    def __init__(self):
+        self.accepting = True
+        self._active: Dict[int, ActiveStream] = {}
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def __len__(self) -> int:
+        return len(self._active)
+
+    def register(
+        self,
+        message: Message,
+        parse_mode: Optional[str] = None,
+        resume: Optional[Dict[str, str]] = None
+    ) -> ActiveStream:
+        stream = ActiveStream(message, message.text or "", parse_mode, resume, asyncio.current_task())
+        self._active[id(stream)] = stream
+        self._idle.clear()
+        return stream
+
+    def unregister(self, stream: ActiveStream) -> None:
+        self._active.pop(id(stream), None)
+        if not self._active:
+            self._idle.set()
+
+    async def drain(self, timeout: float) -> List[ActiveStream]:
+        """停止接收并等待进行中的流完成，返回超时后仍未完成的流"""
+        self.accepting = False
+        if self._active:
+            logger.info(f"Waiting up to {timeout}s for {len(self._active)} in-flight streams")
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(self._active.values())
+
+    def cancel(self, streams: List[ActiveStream]) -> None:
+        for stream in streams:
+            if stream.task and not stream.task.done():
+                stream.task.cancel()
+
+
+class CancellationRegistry:
+    """可由用户停止的生成，按状态消息 (chat_id, message_id) 登记
+
+    停止时取消消费流的任务，流随之关闭，上游请求和准入名额立即释放。
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Tuple[int, int], Tuple[asyncio.Task, Optional[int]]] = {}
+
+    def register(self, message: Message, task: asyncio.Task, user_id: Optional[int]) -> Tuple[int, int]:
+        key = (message.chat_id, message.message_id)
+        self._tasks[key] = (task, user_id)
+        return key
+
+    def unregister(self, key: Tuple[int, int]) -> None:
+        self._tasks.pop(key, None)
+
+    def owner(self, chat_id: int, message_id: int) -> Optional[int]:
+        """发起生成的用户ID，没有进行中的生成时为 None"""
+        entry = self._tasks.get((chat_id, message_id))
+        return entry[1] if entry else None
+
+    def cancel(self, chat_id: int, message_id: int) -> bool:
+        """停止该状态消息上进行中的生成，已结束时返回 False"""
+        entry = self._tasks.pop((chat_id, message_id), None)
+        if entry is None or entry[0].done():
+            return False
+        entry[0].cancel()
+        return True
+
+
+def finalized_text(text: str, note: str = INTERRUPTED_NOTE) -> str:
+    """去掉生成中前缀并附上中断说明"""
+    if text.startswith(GENERATING_PREFIX):
+        text = text[len(GENERATING_PREFIX):].lstrip('\n')
+    return f"{text}\n\n{note}" if text else note
+
+
+async def _resume_stream(bot: Bot, record: Dict[str, Any]) -> None:
+    """重新生成可恢复的回复，完成后一次性写回原消息（超长时续发分页）"""
+    chat_id, message_id = record['chat_id'], record['message_id']
+    await bot.edit_message_text("正在恢复生成...", chat_id=chat_id, message_id=message_id)
+    result = ""
+    async for html, update in get_ai_response(record['resume_message'], record['resume_prompt']):
+        result = html
+    pages = paginate_html(result) if record['parse_mode'] == 'HTML' else paginate_text(result)
+    await bot.edit_message_text(pages[0], chat_id=chat_id, message_id=message_id, parse_mode=record['parse_mode'])
+    reply_to = message_id
+    for page in pages[1:]:
+        sent = await bot.send_message(chat_id, page, reply_to_message_id=reply_to, parse_mode=record['parse_mode'])
+        reply_to = sent.message_id
+
+
+async def resume_streams(bot: Bot, db) -> int:
+    """启动时处理上次关闭遗留的流：有原始输入的重新生成，否则把半成品消息收尾"""
+    records = await db.get_pending_streams() or []
+    for record in records:
+        try:
+            if record['resume_message'] and record['resume_prompt']:
+                await _resume_stream(bot, record)
+            else:
+                await bot.edit_message_text(
+                    finalized_text(record['text'] or ""),
+                    chat_id=record['chat_id'],
+                    message_id=record['message_id'],
+                    parse_mode=record['parse_mode']
+                )
+        except Exception as e:
+            logger.error(f"Failed to resume stream {record['chat_id']}/{record['message_id']}: {e}")
+        finally:
+            await db.delete_pending_stream(record['chat_id'], record['message_id'])
+    return len(records)
@@ -0,0 +1,85 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import asyncio
+import base64
+import logging
+from telegram import Bot, Message, Update
+from config.settings import MEDIA_GROUP_WINDOW, MEDIA_GROUP_MAX_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _PendingGroup:
+    updates: List[Update] = field(default_factory=list)
+    last_seen: float = 0.0
+
+
+class MediaGroupCollector:
+    """按 media_group_id 汇总相册的各个部分
+
+    第一个到达的更新负责等待：最后一部分到达后再等 window 秒（最多等 max_wait 秒），
+    然后拿到全部部分统一处理；其余部分直接返回 None，不再单独回复。
+    依赖并发处理更新，否则首个更新等待期间其余部分无法到达。
+    """
+
+    def __init__(self, window: float = MEDIA_GROUP_WINDOW, max_wait: float = MEDIA_GROUP_MAX_WAIT):
+        self.window = window
+        self.max_wait = max_wait
+        self._groups: Dict[str, _PendingGroup] = {}
+
+    async def collect(self, update: Update) -> Optional[List[Update]]:
+        message = update.effective_message
+        key = f"{message.chat_id}:{message.media_group_id}"
+        loop = asyncio.get_running_loop()
+
+        group = self._groups.get(key)
+        if group is not None:
+            group.updates.append(update)
+            group.last_seen = loop.time()
+            return None
+
+        group = self._groups[key] = _PendingGroup([update], loop.time())
+        deadline = group.last_seen + self.max_wait
+        try:
+            while True:
+                now = loop.time()
+                remaining = min(group.last_seen + self.window, deadline) - now
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(remaining)
+        finally:
+            del self._groups[key]
+        return sorted(group.updates, key=lambda part: part.effective_message.message_id)
+
+
+def image_media(message: Message):
+    """图片（最大尺寸）或图片文档"""
+    if message.photo:
+        return message.photo[-1]
+    if message.document and message.document.mime_type and message.document.mime_type.startswith('image/'):
+        return message.document
+    return None
+
+
+def image_file_id(message: Message) -> Optional[str]:
+    """图片或图片文档的 file_id"""
+    media = image_media(message)
+    return media.file_id if media else None
+
+
+async def fetch_images_base64(bot: Bot, messages: List[Message]) -> List[str]:
+    """并发下载多张图片并编码为 base64，单张失败时跳过"""
+    async def fetch(file_id: str) -> str:
+        file = await bot.get_file(file_id)
+        return base64.b64encode(bytes(await file.download_as_bytearray())).decode('utf-8')
+
+    file_ids = [file_id for file_id in map(image_file_id, messages) if file_id]
+    results = await asyncio.gather(*(fetch(file_id) for file_id in file_ids), return_exceptions=True)
+    images = []
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Failed to fetch album image: {result}")
+        else:
+            images.append(result)
+    return images
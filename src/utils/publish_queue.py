@@ -0,0 +1,219 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import time
+from telegram.error import BadRequest, RetryAfter, TimedOut
+from config.settings import (
+    CHANNEL_ID,
+    PUBLISH_INTERVAL,
+    PUBLISH_WINDOWS,
+    PUBLISH_DIGEST_SIZE,
+    PUBLISH_MAX_ATTEMPTS
+)
+from database.models import VOTE_PUBLISHED
+from utils.html_pager import TELEGRAM_PAGE_LIMIT, paginate_html
+from utils.telegram_client import run_concurrently
+
+logger = logging.getLogger(__name__)
+
+QUEUED, SENDING, SENT, FAILED = "queued", "sending", "sent", "failed"
+TRUNCATED_NOTE = "\n…（内容过长，已截断）"
+
+
+def parse_windows(spec: str) -> List[Tuple[int, int]]:
+    """解析 "08:00-12:00,22:00-02:00" 形式的时段，返回以分钟计的 (开始, 结束)"""
+    windows = []
+    for part in filter(None, (item.strip() for item in spec.split(','))):
+        try:
+            start, end = (
+                int(hour) * 60 + int(minute)
+                for hour, minute in (value.strip().split(':') for value in part.split('-'))
+            )
+            windows.append((start, end))
+        except ValueError:
+            logger.warning(f"Invalid publish window ignored: {part}")
+    return windows
+
+
+def in_windows(windows: List[Tuple[int, int]], now: Optional[datetime] = None) -> bool:
+    """当前本地时间是否处于任一发布时段，未配置时段时总是允许"""
+    if not windows:
+        return True
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    for start, end in windows:
+        if start <= end and start <= minute < end:
+            return True
+        if start > end and (minute >= start or minute < end):  # 跨零点
+            return True
+    return False
+
+
+class PublishStats:
+    """发布队列的吞吐与排队延迟统计"""
+
+    def __init__(self, log_every: int = 20):
+        self.log_every = log_every
+        self.published = 0
+        self.failed = 0
+        self.deferred = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def record_published(self, latencies: List[float]) -> None:
+        for latency in latencies:
+            self.published += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+            if self.published % self.log_every == 0:
+                logger.info(f"Publish queue: {self.summary()}")
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'published': self.published,
+            'failed': self.failed,
+            'deferred': self.deferred,
+            'latency_avg': self._latency_total / self.published if self.published else 0.0,
+            'latency_max': self._latency_max
+        }
+
+    def summary(self) -> str:
+        stats = self.snapshot()
+        return (
+            f"published={stats['published']} failed={stats['failed']} deferred={stats['deferred']} "
+            f"latency avg={stats['latency_avg']:.0f}s max={stats['latency_max']:.0f}s"
+        )
+
+
+class PublishQueue:
+    """持久化的频道发布队列
+
+    通过的投稿先写入 publish_queue 表（vote_id 为主键，重复入队无效），
+    由定时任务按 PUBLISH_INTERVAL 限速、在允许的时段内逐条发出；积压时
+    将多条合并为一条合集。发送前先将队列项标记为 sending，发送结果不明
+    （超时）的项不再重试，重启后遗留的 sending 项同样标记为失败，保证不会重复发布。
+    """
+
+    def __init__(
+        self,
+        db,
+        interval: int = PUBLISH_INTERVAL,
+        windows: str = PUBLISH_WINDOWS,
+        digest_size: int = PUBLISH_DIGEST_SIZE,
+        max_attempts: int = PUBLISH_MAX_ATTEMPTS
+    ):
+        self.db = db
+        self.interval = interval
+        self.windows = parse_windows(windows)
+        self.digest_size = max(digest_size, 1)
+        self.max_attempts = max_attempts
+        self.stats = PublishStats()
+        self._next_send_at = 0.0
+
+    async def recover(self) -> int:
+        """启动时处理上次退出时仍在发送中的项"""
+        vote_ids = await self.db.get_publish_ids(SENDING) or []
+        if vote_ids:
+            logger.warning(f"Publish results unknown for votes {vote_ids}, marked as failed to avoid double posting")
+            await self.db.set_publish_status(vote_ids, SENDING, FAILED)
+        return len(vote_ids)
+
+    async def enqueue(self, vote_id: int, content: str) -> bool:
+        """加入发布队列，超过单条消息上限的 HTML 截断到第一页（标签已闭合），避免发布时被永久拒绝"""
+        pages = paginate_html(content, TELEGRAM_PAGE_LIMIT - len(TRUNCATED_NOTE))
+        if len(pages) > 1:
+            logger.info(f"Vote {vote_id} content truncated from {len(content)} chars")
+            content = pages[0] + TRUNCATED_NOTE
+        queued = await self.db.enqueue_publish(vote_id, content, int(time.time()))
+        if not queued:
+            logger.info(f"Vote {vote_id} already in publish queue")
+        return bool(queued)
+
+    async def depth(self) -> Dict[str, int]:
+        return await self.db.get_publish_depth() or {}
+
+    def _select_batch(self, rows: List[Dict[str, Any]], now: int) -> List[Dict[str, Any]]:
+        """积压（等待超过一个发布间隔）时合并多条，总长度不超过单条消息上限"""
+        batch = [rows[0]]
+        length = len(rows[0]['content'])
+        for row in rows[1:]:
+            if now - row['enqueued_at'] < self.interval:
+                break
+            length += len(row['content']) + 2
+            if length > TELEGRAM_PAGE_LIMIT - 64:
+                break
+            batch.append(row)
+        return batch
+
+    @staticmethod
+    def _render(batch: List[Dict[str, Any]]) -> str:
+        if len(batch) == 1:
+            return batch[0]['content']
+        return f"<b>投稿合集（{len(batch)}）</b>\n\n" + "\n\n".join(row['content'] for row in batch)
+
+    async def _send(self, bot, text: str):
+        try:
+            return await bot.send_message(chat_id=CHANNEL_ID, text=text, parse_mode='HTML')
+        except BadRequest as e:
+            # 仅 HTML 解析失败时降级为纯文本
+            if "parse" not in str(e).lower() and "entit" not in str(e).lower():
+                raise
+            logger.warning(f"HTML publish rejected, falling back to plain text: {e}")
+            return await bot.send_message(chat_id=CHANNEL_ID, text=text, parse_mode=None)
+
+    async def drain(self, bot) -> int:
+        """发出一条（或一条合集），返回发布的投稿数；由定时任务按发布间隔调用"""
+        now = int(time.time())
+        if now < self._next_send_at or not in_windows(self.windows):
+            return 0
+
+        rows = await self.db.get_due_publish(now, self.digest_size) or []
+        if not rows:
+            return 0
+        batch = self._select_batch(rows, now)
+        vote_ids = [row['vote_id'] for row in batch]
+        if await self.db.set_publish_status(vote_ids, QUEUED, SENDING) != len(vote_ids):
+            logger.warning(f"Publish queue items {vote_ids} changed concurrently, skip this round")
+            return 0
+
+        try:
+            message = await self._send(bot, self._render(batch))
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            self._next_send_at = now + retry_after
+            self.stats.deferred += len(vote_ids)
+            logger.warning(f"Publish rate limited, retry after {retry_after}s")
+            await self.db.defer_publish(vote_ids, int(self._next_send_at))
+            return 0
+        except TimedOut as e:
+            # 请求可能已送达，为避免重复发布不再重试
+            self.stats.failed += len(vote_ids)
+            logger.error(f"Publish timed out for votes {vote_ids}, marked as failed for manual check: {e}")
+            await self.db.set_publish_status(vote_ids, SENDING, FAILED)
+            return 0
+        except Exception as e:
+            attempts = max(row['attempts'] for row in batch) + 1
+            if isinstance(e, BadRequest) or attempts >= self.max_attempts:
+                self.stats.failed += len(vote_ids)
+                logger.error(f"Failed to publish votes {vote_ids} after {attempts} attempts: {e}")
+                await self.db.set_publish_status(vote_ids, SENDING, FAILED)
+            else:
+                delay = self.interval * 2 ** attempts
+                self.stats.deferred += len(vote_ids)
+                logger.warning(f"Publish failed for votes {vote_ids}, retry in {delay}s: {e}")
+                await self.db.defer_publish(vote_ids, now + delay)
+            return 0
+
+        sent_at = int(time.time())
+        await self.db.set_publish_status(
+            vote_ids, SENDING, SENT, sent_at=sent_at, channel_message_id=message.message_id
+        )
+        self.stats.record_published([sent_at - row['enqueued_at'] for row in batch])
+
+        await asyncio.gather(*(self.db.transition_vote(vote_id, VOTE_PUBLISHED) for vote_id in vote_ids))
+        await run_concurrently(*(
+            bot.send_message(chat_id=row['user_id'], text="✨ 恭喜！你的投稿已通过并发布")
+            for row in batch if row.get('user_id')
+        ))
+        return len(batch)
@@ -0,0 +1,194 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+import logging
+import time
+from config.response_settings import USER_LISTS, QUOTA_LIMITS, CHAT_QUOTA
+from config.settings import QUOTA_ROLE_TTL
+
+logger = logging.getLogger(__name__)
+
+QUOTA_OK, QUOTA_BURST, QUOTA_DAILY, QUOTA_CHAT = "ok", "burst", "daily", "chat"
+
+
+def in_user_list(name: str, user_id: int) -> bool:
+    """用户是否在 USER_LISTS 指定名单中，名单包含 'all' 时匹配所有用户"""
+    members = USER_LISTS.get(name, [])
+    return 'all' in members or str(user_id) in members
+
+
+def utc_today() -> str:
+    """与 SQLite date('now') 一致的 UTC 日期"""
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+@dataclass
+class TokenBucket:
+    capacity: float
+    rate: float  # 每秒恢复的令牌数
+    tokens: float = field(default=-1.0)
+    updated: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        if self.tokens < 0:
+            self.tokens = self.capacity
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def peek(self, now: Optional[float] = None) -> bool:
+        self._refill(now or time.monotonic())
+        return self.tokens >= 1
+
+    def give(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def take(self, now: Optional[float] = None) -> bool:
+        self._refill(now or time.monotonic())
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+@dataclass
+class UserQuota:
+    role: str
+    bucket: Optional[TokenBucket]
+    daily_used: int = 0
+    day: str = field(default_factory=utc_today)
+    pending: int = 0  # 尚未写入 users 表的使用次数
+    notified: bool = False  # 当日是否已提示超限
+    role_checked: float = field(default_factory=time.monotonic)
+
+
+def _make_bucket(limits: Dict) -> Optional[TokenBucket]:
+    if not limits.get('burst'):
+        return None
+    return TokenBucket(limits['burst'], limits['burst'] / limits.get('burst_window', 60))
+
+
+class QuotaManager:
+    """按用户、按会话的内存令牌桶配额
+
+    突发上限用令牌桶限制，每日上限按 UTC 日计数；额度按角色
+    （admin/whitelist/default）取自 QUOTA_LIMITS。使用次数只在内存中累加，
+    由定时任务批量写回 users 表。已超限的用户在 check 阶段即被拒绝，
+    不触发任何数据库或模型调用。角色缓存 role_ttl 秒，过期后重新读取。
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, Dict] = QUOTA_LIMITS,
+        chat_limits: Dict = CHAT_QUOTA,
+        role_ttl: float = QUOTA_ROLE_TTL
+    ):
+        self.limits = limits
+        self.chat_limits = chat_limits
+        self.role_ttl = role_ttl
+        self._users: Dict[int, UserQuota] = {}
+        self._chats: Dict[int, Optional[TokenBucket]] = {}
+
+    @staticmethod
+    def role_for(user_id: int, is_admin: bool = False) -> str:
+        if is_admin or in_user_list('admin_list', user_id):
+            return 'admin'
+        if in_user_list('whitelist', user_id):
+            return 'whitelist'
+        return 'default'
+
+    def _daily_limit(self, quota: UserQuota) -> Optional[int]:
+        return self.limits.get(quota.role, self.limits['default']).get('daily')
+
+    def _roll_day(self, quota: UserQuota) -> None:
+        today = utc_today()
+        if quota.day != today:
+            quota.day, quota.daily_used, quota.notified = today, 0, False
+
+    def check(self, user_id: int, chat_id: Optional[int] = None) -> str:
+        """只读内存判断是否已超限，未见过的用户总是放行"""
+        quota = self._users.get(user_id)
+        if quota is None:
+            return QUOTA_OK
+        self._roll_day(quota)
+        limit = self._daily_limit(quota)
+        if limit is not None and quota.daily_used >= limit:
+            return QUOTA_DAILY
+        if quota.bucket and not quota.bucket.peek():
+            return QUOTA_BURST
+        chat_bucket = self._chats.get(chat_id)
+        if quota.role != 'admin' and chat_bucket and not chat_bucket.peek():
+            return QUOTA_CHAT
+        return QUOTA_OK
+
+    async def _load(self, db, user_id: int, quota: Optional[UserQuota] = None) -> UserQuota:
+        """首次见到用户时从 users 表恢复当日用量与角色，角色过期时只刷新角色"""
+        user = await db.get_user(user_id)
+        role = self.role_for(user_id, bool(user and user.is_admin))
+        if quota is None:
+            quota = UserQuota(role=role, bucket=_make_bucket(self.limits.get(role, self.limits['default'])))
+            if user:
+                quota.daily_used = user.usage_today(quota.day)
+            self._users[user_id] = quota
+        elif quota.role != role:
+            logger.info(f"User {user_id} role changed: {quota.role} -> {role}")
+            quota.role, quota.bucket = role, _make_bucket(self.limits.get(role, self.limits['default']))
+        quota.role_checked = time.monotonic()
+        return quota
+
+    async def acquire(self, db, user_id: int, chat_id: Optional[int] = None) -> Tuple[bool, str]:
+        """消耗一次额度，返回 (是否允许, 原因)"""
+        quota = self._users.get(user_id)
+        if quota is None or time.monotonic() - quota.role_checked > self.role_ttl:
+            quota = await self._load(db, user_id, quota)
+        reason = self.check(user_id, chat_id)
+        if reason != QUOTA_OK:
+            return False, reason
+        if chat_id is not None and chat_id != user_id and quota.role != 'admin':
+            if chat_id not in self._chats:
+                self._chats[chat_id] = _make_bucket(self.chat_limits)
+            chat_bucket = self._chats[chat_id]
+            if chat_bucket and not chat_bucket.take():
+                return False, QUOTA_CHAT
+        if quota.bucket:
+            quota.bucket.take()
+        quota.daily_used += 1
+        quota.pending += 1
+        return True, QUOTA_OK
+
+    def refund(self, user_id: int, chat_id: Optional[int] = None) -> None:
+        """已扣额度的请求未实际执行（繁忙、合并）时退还一次"""
+        quota = self._users.get(user_id)
+        if quota is None or not quota.daily_used:
+            return
+        quota.daily_used -= 1
+        if quota.pending:
+            # 已写回 users 表的次数不再回退
+            quota.pending -= 1
+        if quota.bucket:
+            quota.bucket.give()
+        chat_bucket = self._chats.get(chat_id)
+        if chat_bucket and chat_id != user_id and quota.role != 'admin':
+            chat_bucket.give()
+
+    def should_notify(self, user_id: int) -> bool:
+        """当日首次超限时提示一次，之后静默丢弃"""
+        quota = self._users.get(user_id)
+        if quota is None or quota.notified:
+            return False
+        quota.notified = True
+        return True
+
+    async def flush(self, db) -> int:
+        """把累计的使用次数批量写回 users 表"""
+        pending = [(user_id, quota.pending) for user_id, quota in self._users.items() if quota.pending]
+        if not pending:
+            return 0
+        for user_id, _ in pending:
+            self._users[user_id].pending = 0
+        if not await db.add_user_usage(pending):
+            for user_id, count in pending:
+                self._users[user_id].pending += count
+            return 0
+        return len(pending)
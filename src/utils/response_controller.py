@@ -1,13 +1,53 @@
 from typing import Optional, Dict, Any, Tuple
-from telegram import Update, Message
+from telegram import Update
 from telegram.ext import ContextTypes
 import time
 from config.settings import TELEGRAM_USER_ID, GROUP_ID
-from config.response_settings import RESPONSE_SETTINGS
+from config.response_settings import RESPONSE_SETTINGS, RESPONSE_PRIORITY, MESSAGE_PERSISTENCE
+from utils.quota import QUOTA_OK, QUOTA_DAILY
+from utils.envelope import BOT_USERNAME, Envelope, envelope
 import logging
 
 logger = logging.getLogger(__name__)
 
+def persistence_policy(chat_id: int, chat_type: str) -> str:
+    """聊天的消息存储策略：full/compact/none"""
+    return MESSAGE_PERSISTENCE['chats'].get(str(chat_id), MESSAGE_PERSISTENCE.get(chat_type, 'full'))
+
+
+def is_addressed(update: Update, collected: bool = False) -> bool:
+    """不访问数据库、不解析实体，仅凭原始字段判断更新是否可能需要响应
+
+    群组中既不是命令、也没有@或回复机器人的消息直接判定为无关。
+    相册的说明文字只在其中一部分上，没有说明文字也没有回复的部分无法单独判断，
+    先放行去汇总；汇总后以 collected=True 对代表部分再判断一次。
+    """
+    message = update.effective_message
+    chat = update.effective_chat
+    if not message or not chat:
+        return False
+    if chat.type == 'channel':
+        settings = RESPONSE_SETTINGS['channel_chat']
+        return settings['enabled'] and str(chat.id) in settings['allowed_channels']
+    if chat.type not in ('group', 'supergroup'):
+        return True
+
+    settings = RESPONSE_SETTINGS['group_chat']
+    if not settings['enabled'] or str(chat.id) not in settings['allowed_groups']:
+        return False
+    if message.is_automatic_forward and not settings['respond_to_auto_forward']:
+        return False
+    if not settings['mention_required']:
+        return True
+    if message.media_group_id and not collected and not (message.caption or message.reply_to_message):
+        return True
+    text = message.text or message.caption or ""
+    if text.startswith('/') or f'@{BOT_USERNAME}' in text:
+        return True
+    reply = message.reply_to_message
+    return bool(reply and reply.from_user and reply.from_user.username == BOT_USERNAME)
+
+
 class ResponseController:
     def __init__(self):
         self._last_response_time = {}  # 记录最后响应时间
@@ -24,8 +64,14 @@ class ResponseController:
         Returns:
             bool: 是否允许访问
         """
-        # 确保用户存在
+        # 已超限的用户直接拒绝，不访问数据库
         user = update.effective_user
+        reason = context.bot_data['quota'].check(user.id, update.effective_chat.id if update.effective_chat else None)
+        if reason != QUOTA_OK:
+            await self._reject_over_quota(update, context, reason)
+            return False
+
+        # 确保用户存在
         await context.bot_data['db'].ensure_user_exists(
             user.id,
             username=user.username,
@@ -40,8 +86,24 @@ class ResponseController:
         # 检查用户是否被拉黑
         if await self.is_user_blacklisted(user.id, context):
             return False
-            
-        return True
+
+        allowed, reason = await context.bot_data['quota'].acquire(
+            context.bot_data['db'], user.id, update.effective_chat.id if update.effective_chat else None
+        )
+        if not allowed:
+            await self._reject_over_quota(update, context, reason)
+        return allowed
+
+    async def _reject_over_quota(self, update: Update, context: ContextTypes.DEFAULT_TYPE, reason: str) -> None:
+        """超出配额时静默丢弃，每日额度用尽时当天提示一次"""
+        user_id = update.effective_user.id
+        logger.info(f"User {user_id} over quota: {reason}")
+        if reason != QUOTA_DAILY or not context.bot_data['quota'].should_notify(user_id):
+            return
+        try:
+            await update.effective_message.reply_text("今日使用次数已达上限，请明天再来")
+        except Exception as e:
+            logger.error(f"Failed to send quota notice: {e}")
 
 
     async def is_user_admin(self, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
@@ -55,12 +117,20 @@ class ResponseController:
         return user and user.is_blocked  # 使用属性访问方式
 
     async def analyze_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> Tuple[bool, str, bool]:
-        message = update.effective_message
+        env = envelope(update)
         chat = update.effective_chat
         
-        if not message or not chat:
+        if not env or not chat:
             return False, "unknown", False
 
+        is_update = update.edited_message is not None or update.edited_channel_post is not None
+
+        # 已超限的用户在任何数据库或模型调用之前拒绝
+        if chat.type != 'channel' and update.effective_user:
+            reason = context.bot_data['quota'].check(update.effective_user.id, chat.id)
+            if reason != QUOTA_OK:
+                return False, chat.type, is_update
+
         # 如果不是频道消息，才检查用户
         if chat.type != 'channel':
             user = update.effective_user
@@ -72,24 +142,26 @@ class ResponseController:
                     last_name=user.last_name
                 )
 
-        is_update = update.edited_message is not None or update.edited_channel_post is not None
-
         if chat.type == 'channel':
-            should_respond = await self._check_channel_chat(message)
+            should_respond = await self._check_channel_chat(env)
         elif chat.type == 'private':
-            should_respond = await self._check_private_chat(message, update.effective_user, context)
+            should_respond = await self._check_private_chat(env, update.effective_user, context)
         elif chat.type in ['group', 'supergroup']:
-            should_respond = await self._check_group_chat(message, update.effective_user, context)
+            should_respond = await self._check_group_chat(env, update.effective_user, context)
         else:
             should_respond = False
 
-        # 只有非频道消息且should_respond为True时才增加使用次数
+        # 只有非频道消息且should_respond为True时才消耗配额，使用次数由定时任务写回
         if should_respond and chat.type != 'channel' and update.effective_user:
-            await context.bot_data['db'].increment_user_usage(update.effective_user.id)
+            should_respond, reason = await context.bot_data['quota'].acquire(
+                context.bot_data['db'], update.effective_user.id, chat.id
+            )
+            if not should_respond:
+                await self._reject_over_quota(update, context, reason)
 
         return should_respond, chat.type, is_update
         
-    async def _check_private_chat(self, message: Message, user, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    async def _check_private_chat(self, env: Envelope, user, context: ContextTypes.DEFAULT_TYPE) -> bool:
         settings = RESPONSE_SETTINGS['private_chat']
 
         # logger.info(f"用户ID: {user.id}, 用户名: {user.username}, 用户名: {user.first_name}")
@@ -106,19 +178,18 @@ class ResponseController:
             return False
 
         # 检查命令权限
-        if message.text and message.text.startswith('/'):
-            command = message.text.split()[0][1:]
-            return command in settings['allowed_commands']
+        if env.is_command:
+            return env.command in settings['allowed_commands']
         return False
    
-    async def _check_group_chat(self, message: Message, user, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    async def _check_group_chat(self, env: Envelope, user, context: ContextTypes.DEFAULT_TYPE) -> bool:
         settings = RESPONSE_SETTINGS['group_chat']
         
         if not settings['enabled']:
             return False
         
         # 检查群组权限
-        if str(message.chat.id) not in settings['allowed_groups']:
+        if str(env.chat_id) not in settings['allowed_groups']:
             return False
         
         # 检查用户黑名单
@@ -126,49 +197,39 @@ class ResponseController:
             return False
         
         # 检查自动转发
-        if message.is_automatic_forward and not settings['respond_to_auto_forward']:
+        if env.message.is_automatic_forward and not settings['respond_to_auto_forward']:
             return False
         
         # 检查命令权限
-        if message.text and message.text.startswith('/'):
-            command = message.text.split()[0][1:]
-            return command in settings['allowed_commands']
+        if env.is_command:
+            return env.command in settings['allowed_commands']
         
         # 检查@和回复
-        is_mention = self._check_mention(message)
-        is_reply = self._check_reply(message)
-        
-        if settings['mention_required'] and not (is_mention or is_reply):
+        if settings['mention_required'] and not (env.mentions_bot or env.replies_to_bot):
             return False
         
         return True
 
-    def _check_mention(self, message: Message) -> bool:
-        """检查是否@机器人"""
-        if not message.entities:
-            return False
-        
-        for entity in message.entities:
-            if entity.type == 'mention':
-                mention = message.text[entity.offset:entity.offset + entity.length]
-                if mention == '@rk_pin_bot':  # 替换为你的机器人用户名
-                    return True
-        return False
-    
-    def _check_reply(self, message: Message) -> bool:
-        """检查是否回复机器人消息"""
-        if not message.reply_to_message or not message.reply_to_message.from_user:
-            return False
-        return message.reply_to_message.from_user.username == 'rk_pin_bot'  # 替换为你的机器人用户名
-
-    async def _check_channel_chat(self, message: Message) -> bool:
+    def response_priority(self, env: Envelope, chat_type: str) -> int:
+        """按 RESPONSE_PRIORITY 给出处理优先级，数值越小越优先，私聊视同@机器人"""
+        if chat_type == 'channel':
+            return RESPONSE_PRIORITY['channel']
+        if env.is_command:
+            return RESPONSE_PRIORITY['commands']
+        if chat_type == 'private' or env.mentions_bot:
+            return RESPONSE_PRIORITY['mention']
+        if env.replies_to_bot:
+            return RESPONSE_PRIORITY['reply']
+        return RESPONSE_PRIORITY['text']
+
+    async def _check_channel_chat(self, env: Envelope) -> bool:
         settings = RESPONSE_SETTINGS['channel_chat']
         
         if not settings['enabled']:
             return False
         
         # 检查频道权限
-        if str(message.chat.id) not in settings['allowed_channels']:
+        if str(env.chat_id) not in settings['allowed_channels']:
             return False
         
         return True
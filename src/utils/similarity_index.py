@@ -0,0 +1,117 @@
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import logging
+import re
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+SIMHASH_BITS = 64
+_URL_PATTERN = re.compile(r'https?://\S+')
+_NOISE_PATTERN = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """归一化文本：全半角统一、小写、去除链接/标点/空白"""
+    if not text:
+        return ""
+    text = unicodedata.normalize('NFKC', text).lower()
+    text = _URL_PATTERN.sub('', text)
+    return _NOISE_PATTERN.sub('', text)
+
+
+def _shingle_hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(text: str, shingle_size: int = 3) -> Optional[int]:
+    """计算文本的64位 SimHash，文本过短时返回 None"""
+    normalized = normalize_text(text)
+    if len(normalized) < shingle_size * 2:
+        return None
+
+    # 统计字符 n-gram 词频，中文无需分词
+    counts: Dict[str, int] = {}
+    for i in range(len(normalized) - shingle_size + 1):
+        shingle = normalized[i:i + shingle_size]
+        counts[shingle] = counts.get(shingle, 0) + 1
+
+    weights = [0] * SIMHASH_BITS
+    for shingle, count in counts.items():
+        h = _shingle_hash(shingle)
+        for bit in range(SIMHASH_BITS):
+            if h >> bit & 1:
+                weights[bit] += count
+            else:
+                weights[bit] -= count
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def to_signed(value: int) -> int:
+    """无符号64位转有符号，便于存入 SQLite INTEGER"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class SimilarityIndex:
+    """基于 SimHash 分段的近似重复索引
+
+    指纹拆分为 bands 段，按鸽巢原理，汉明距离不超过 bands - 1 的两个指纹
+    至少有一段完全相同，因此每次查询只需 bands 次字典查找。
+    """
+
+    def __init__(self, max_distance: int = 3, bands: int = 4):
+        if max_distance >= bands:
+            raise ValueError("max_distance must be smaller than bands")
+        self.max_distance = max_distance
+        self.bands = bands
+        self._band_bits = SIMHASH_BITS // bands
+        self._band_mask = (1 << self._band_bits) - 1
+        self._buckets: List[Dict[int, List[Tuple[int, int]]]] = [{} for _ in range(bands)]
+        self._ids = set()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, vote_id: int) -> bool:
+        return vote_id in self._ids
+
+    def _band_values(self, fingerprint: int):
+        for band in range(self.bands):
+            yield band, (fingerprint >> (band * self._band_bits)) & self._band_mask
+
+    def add(self, vote_id: int, fingerprint: int) -> None:
+        """加入一条投稿指纹"""
+        if vote_id in self._ids:
+            return
+        self._ids.add(vote_id)
+        for band, value in self._band_values(fingerprint):
+            self._buckets[band].setdefault(value, []).append((vote_id, fingerprint))
+
+    def query(self, fingerprint: int, exclude: Optional[int] = None) -> Optional[Tuple[int, int]]:
+        """查找最相似的投稿，返回 (vote_id, 汉明距离)"""
+        best = None
+        seen = {exclude}
+        for band, value in self._band_values(fingerprint):
+            for vote_id, candidate in self._buckets[band].get(value, ()):
+                if vote_id in seen:
+                    continue
+                seen.add(vote_id)
+                distance = (fingerprint ^ candidate).bit_count()
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (vote_id, distance)
+        return best
+
+    def load(self, rows: List[Dict[str, int]]) -> None:
+        """从数据库记录批量加载"""
+        for row in rows:
+            self.add(row['vote_id'], to_unsigned(row['simhash']))
+        logger.info(f"Similarity index loaded {len(self._ids)} fingerprints")
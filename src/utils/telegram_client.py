@@ -0,0 +1,90 @@
+from typing import Any, Awaitable, Dict, List, Optional
+from telegram.request import HTTPXRequest
+import asyncio
+import importlib.util
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def preferred_http_version() -> str:
+    """安装了 h2 时使用 HTTP/2，多个并发请求复用同一连接"""
+    return "2" if importlib.util.find_spec("h2") else "1.1"
+
+
+class ApiLatencyStats:
+    """按 Bot API 方法统计调用次数与耗时"""
+
+    def __init__(self, log_every: int = 200):
+        self.log_every = log_every
+        self._total = 0
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, method: str, elapsed: float, ok: bool) -> None:
+        stats = self._stats.setdefault(method, {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0})
+        stats['count'] += 1
+        stats['total'] += elapsed
+        stats['max'] = max(stats['max'], elapsed)
+        if not ok:
+            stats['errors'] += 1
+        self._total += 1
+        if self._total % self.log_every == 0:
+            logger.info(f"Bot API latency: {self.summary()}")
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            method: {**stats, 'avg': stats['total'] / stats['count']}
+            for method, stats in self._stats.items()
+        }
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{method} n={int(stats['count'])} avg={stats['avg'] * 1000:.0f}ms max={stats['max'] * 1000:.0f}ms"
+            for method, stats in sorted(self.snapshot().items(), key=lambda item: -item[1]['total'])
+        )
+
+
+api_stats = ApiLatencyStats()
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """记录每个 Bot API 方法延迟的 HTTPX 请求层"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = await super().do_request(url, method, *args, **kwargs)
+            ok = True
+            return result
+        finally:
+            api_stats.record(api_method, time.perf_counter() - start, ok)
+
+
+def build_request(
+    pool_size: int,
+    proxy: Optional[str] = None,
+    timeout: float = 30.0,
+    http_version: Optional[str] = None
+) -> InstrumentedRequest:
+    """构建连接池与 keep-alive 按并发度配置的请求对象"""
+    return InstrumentedRequest(
+        connection_pool_size=pool_size,
+        proxy=proxy,
+        connect_timeout=timeout,
+        read_timeout=timeout,
+        write_timeout=timeout,
+        pool_timeout=timeout,
+        http_version=http_version or preferred_http_version()
+    )
+
+
+async def run_concurrently(*calls: Awaitable[Any]) -> List[Any]:
+    """并发执行相互独立的 API 调用，单个失败只记录日志，不影响其他调用"""
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Concurrent API call failed: {result}")
+    return [None if isinstance(result, Exception) else result for result in results]
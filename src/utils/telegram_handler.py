@@ -3,9 +3,13 @@ from telegram.ext import ContextTypes
 from telegram.error import NetworkError, TimedOut
 import logging
 import asyncio
-from typing import Optional, Tuple, AsyncGenerator, Any
+from typing import Optional, Tuple, AsyncGenerator, Any, List, Dict
 from handlers.log_handler import LogHandler
 from database.models import Message
+from utils.html_pager import paginate_html, paginate_text
+from utils.lifecycle import RESTARTING_TEXT, STOPPED_NOTE, finalized_text
+from utils.buttons import get_stop_button
+from utils.envelope import envelope
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +18,7 @@ class TelegramMessageHandler:
         self.update = update
         self.context = context
         self.bot = context.bot
+        self.envelope = envelope(update)
         self.message = update.effective_message
         self.chat_id = self.message.chat.id if self.message else None
         # 只在非频道消息时获取用户ID
@@ -24,6 +29,10 @@ class TelegramMessageHandler:
         self.command_notification_delay = 5  # seconds for command response notifications
         self.log_handler = LogHandler()
 
+    def update_data(self) -> Dict[str, Any]:
+        """当前 update 的序列化结果，同一更新只序列化一次"""
+        return self.envelope.serialized() if self.envelope else self.update.to_dict()
+
     async def send_message(
         self, 
         text: str, 
@@ -52,7 +61,7 @@ class TelegramMessageHandler:
                 )
                 
                 if sent_message and log_action:
-                    self.log_handler.log_bot_action("send", sent_message, self.update)
+                    self.log_handler.log_bot_action("send", sent_message, self.update_data())
                     # 保存到数据库
                     message_obj = Message(
                         message_id=sent_message.message_id,
@@ -62,7 +71,7 @@ class TelegramMessageHandler:
                         type='bot_message',
                         reply_to_message_id=reply_to_message_id,
                         metadata={
-                            'update': self.update.to_dict()
+                            'update': self.update_data()
                         }
                     )
                     await self.context.bot_data['db'].save_message(message_obj)
@@ -109,13 +118,13 @@ class TelegramMessageHandler:
                     text=text,
                     type='bot_message',
                     metadata={
-                        'update': self.update.to_dict()
+                        'update': self.update_data()
                     }
                 )
                 await self.context.bot_data['db'].update_message(message_obj)
                 
                 if edited_message:
-                    self.log_handler.log_bot_action("edit", edited_message, self.update)
+                    self.log_handler.log_bot_action("edit", edited_message, self.update_data())
                 return True
             except (NetworkError, TimedOut) as e:
                 retry_count += 1
@@ -174,27 +183,125 @@ class TelegramMessageHandler:
         processor: AsyncGenerator[Tuple[str, bool], Any],
         status_message: Message,
         final_markup: Optional[InlineKeyboardMarkup] = None,
-        parse_mode: Optional[str] = None
+        parse_mode: Optional[str] = None,
+        resume: Optional[Dict[str, str]] = None
     ) -> Optional[str]:
-        """处理流式响应并更新消息，使用兜底策略"""
+        """处理流式响应并更新消息，使用兜底策略
+
+        超过单条消息上限时续发新消息分页，已写满的页不再编辑，
+        每次只更新最后一页，按钮挂在最后一页上。
+        进行中的流登记到 StreamRegistry，关闭时未完成的可凭 resume
+        （{'message': 输入, 'prompt': 提示词}）在下次启动时重新生成。
+        生成期间最后一页带停止按钮；停止、编辑失败或出错时都会关闭 processor，
+        上游流随之关闭。
+        """
+        registry = self.context.bot_data.get('streams')
+        if registry and not registry.accepting:
+            await self.edit_message(status_message, RESTARTING_TEXT)
+            return None
+        stream = registry.register(status_message, parse_mode, resume) if registry else None
+        cancellations = self.context.bot_data.get('cancellations')
+        stop_markup = get_stop_button() if cancellations else None
+
         last_text = ""
-        try:
+        pages = [status_message]
+        page_texts = [status_message.text or ""]
+
+        async def consume() -> bool:
+            nonlocal last_text
             async for response_text, should_update in processor:
                 if response_text != last_text:
                     last_text = response_text
-                    success = await self.edit_message(status_message, response_text, parse_mode=parse_mode)
+                    success = await self._render_pages(
+                        pages, page_texts, response_text, parse_mode, should_update, stop_markup
+                    )
+                    if stream:
+                        stream.message, stream.text = pages[-1], page_texts[-1]
                     if not success:
-                        return None
+                        return False
+            return True
+
+        if stop_markup:
+            await self.edit_message(status_message, page_texts[0], reply_markup=stop_markup)
+        # 在子任务中消费流，停止按钮只取消该任务，本方法照常收尾
+        task = asyncio.create_task(consume())
+        stop_key = cancellations.register(status_message, task, self.user_id) if cancellations else None
+        try:
+            try:
+                await asyncio.wait([task])
+            except asyncio.CancelledError:
+                task.cancel()
+                await asyncio.wait([task])
+                raise
+            if task.cancelled():
+                logger.info(f"Generation stopped by user: {stop_key}")
+                await self.edit_message(
+                    pages[-1], finalized_text(page_texts[-1] if last_text else "", STOPPED_NOTE), parse_mode=parse_mode
+                )
+                return None
+            if not task.result():
+                return None
 
             if last_text and final_markup:
-                await self.edit_message(status_message, last_text, reply_markup=final_markup, parse_mode=parse_mode)
+                await self.edit_message(pages[-1], page_texts[-1], reply_markup=final_markup, parse_mode=parse_mode)
             return last_text
         except Exception as e:
             logger.error(f"Error in stream processing: {e}")
-            # 使用兜底策略，发送错误提示和最后的有效信息
-            fallback_text = f"{last_text}\n\n处理失败，请重试" if last_text else "处理失败，请重试"
-            await self.edit_message(status_message, fallback_text)
-            return None 
+            # 使用兜底策略，在最后一页追加错误提示
+            fallback_text = f"{page_texts[-1]}\n\n处理失败，请重试" if last_text else "处理失败，请重试"
+            await self.edit_message(pages[-1], fallback_text)
+            return None
+        finally:
+            if stop_key:
+                cancellations.unregister(stop_key)
+            # 提前退出时关闭流，释放上游连接
+            await processor.aclose()
+            if stream:
+                registry.unregister(stream)
+
+    async def _render_pages(
+        self,
+        pages: List[Message],
+        page_texts: List[str],
+        text: str,
+        parse_mode: Optional[str],
+        final: bool,
+        stop_markup: Optional[InlineKeyboardMarkup] = None
+    ) -> bool:
+        """将文本分页渲染到 pages，冻结的页仅在最终更新时校正一次
+
+        生成中最后一页带 stop_markup，续发新页时旧页随编辑去掉按钮，最终更新时一并去掉。
+        """
+        chunks = paginate_html(text) if parse_mode == 'HTML' else paginate_text(text)
+        for i, chunk in enumerate(chunks):
+            markup = stop_markup if i == len(chunks) - 1 and not final else None
+            if i < len(pages):
+                # 带按钮的最后一页在最终更新时即使文字不变也要去掉按钮
+                unchanged = chunk == page_texts[i] and not (final and stop_markup and i == len(pages) - 1)
+                if unchanged or (i < len(pages) - 1 and not final):
+                    continue
+                if not await self.edit_message(pages[i], chunk, reply_markup=markup, parse_mode=parse_mode):
+                    return False
+                page_texts[i] = chunk
+            else:
+                page = await self.send_message(
+                    chunk,
+                    reply_to_message_id=pages[-1].message_id,
+                    reply_markup=markup,
+                    parse_mode=parse_mode,
+                    chat_id=pages[-1].chat_id
+                )
+                if not page:
+                    return False
+                pages.append(page)
+                page_texts.append(chunk)
+
+        # 最终文本变短时删除多余的页
+        if final:
+            while len(pages) > len(chunks):
+                await self.delete_message(pages.pop())
+                page_texts.pop()
+        return True
 
     async def send_notification(
         self,
@@ -0,0 +1,101 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+import logging
+import time
+from telegram import Poll
+from config.settings import VOTE_DURATION, VOTE_QUORUM, VOTE_APPROVE_RATIO
+from database.models import VOTE_APPROVED, VOTE_REJECTED
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PollTally:
+    vote_id: int
+    poll_id: str
+    message_id: int
+    chat_id: int
+    opened_at: int
+    yes: int = 0
+    no: int = 0
+    dirty: bool = False
+    closed: bool = False
+
+    @property
+    def total(self) -> int:
+        return self.yes + self.no
+
+    def decision(self) -> str:
+        """按法定人数与同意比例给出结论"""
+        if self.total < VOTE_QUORUM:
+            return VOTE_REJECTED
+        return VOTE_APPROVED if self.yes / self.total >= VOTE_APPROVE_RATIO else VOTE_REJECTED
+
+
+class VoteTally:
+    """群内投稿投票的内存计票
+
+    poll 更新只改内存中的计数并标记为脏，由定时任务批量落库，
+    单次投票不产生数据库写入；投票关闭或到期时交由 VoteHandler 结算。
+    """
+
+    def __init__(self, duration: int = VOTE_DURATION):
+        self.duration = duration
+        self._polls: Dict[str, PollTally] = {}
+
+    def __len__(self) -> int:
+        return len(self._polls)
+
+    def load(self, rows: Iterable[dict]) -> None:
+        """启动时从 vote_tallies 恢复仍在投票中的记录"""
+        for row in rows:
+            self._polls[row['poll_id']] = PollTally(
+                vote_id=row['vote_id'],
+                poll_id=row['poll_id'],
+                message_id=row['message_id'],
+                chat_id=row['chat_id'],
+                opened_at=row['opened_at'],
+                yes=row['yes_count'] or 0,
+                no=row['no_count'] or 0
+            )
+
+    def register(self, vote_id: int, poll_id: str, message_id: int, chat_id: int) -> PollTally:
+        tally = PollTally(vote_id, poll_id, message_id, chat_id, int(time.time()))
+        self._polls[poll_id] = tally
+        return tally
+
+    def record(self, poll: Poll) -> Optional[PollTally]:
+        """应用 poll 更新，非本机器人发起的投票返回 None"""
+        tally = self._polls.get(poll.id)
+        if tally is None:
+            return None
+        yes, no = (poll.options[0].voter_count, poll.options[1].voter_count) if len(poll.options) >= 2 else (0, 0)
+        if (yes, no) != (tally.yes, tally.no):
+            tally.yes, tally.no, tally.dirty = yes, no, True
+        tally.closed = tally.closed or poll.is_closed
+        return tally
+
+    def due(self, now: Optional[float] = None) -> List[PollTally]:
+        """已关闭或已到期、等待结算的投票"""
+        deadline = (now or time.time()) - self.duration
+        return [tally for tally in self._polls.values() if tally.closed or tally.opened_at <= deadline]
+
+    def find(self, vote_id: int) -> Optional[PollTally]:
+        """按投稿查找进行中的计票"""
+        return next((tally for tally in self._polls.values() if tally.vote_id == vote_id), None)
+
+    def discard(self, poll_id: str) -> None:
+        self._polls.pop(poll_id, None)
+
+    async def flush(self, db) -> int:
+        """批量写入有变化的计票"""
+        dirty = [tally for tally in self._polls.values() if tally.dirty]
+        if not dirty:
+            return 0
+        for tally in dirty:
+            tally.dirty = False
+        if not await db.update_vote_tallies([(tally.yes, tally.no, tally.vote_id) for tally in dirty]):
+            for tally in dirty:
+                tally.dirty = True
+            return 0
+        return len(dirty)
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# 与 src/bot.py 的运行方式一致，模块以 src 为根导入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token")
+os.environ.setdefault("TELEGRAM_USER_ID", "1")
+# provider 客户端在导入时创建，测试中不会真正请求
+for key in ("GOOGLE_API_KEY", "SILICONFLOW_API_KEY", "ZHIPU_API_KEY", "OPENAI_API_KEY"):
+    os.environ.setdefault(key, "test-key")
@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from config.settings import GROUP_ID
+from database.models import VOTE_APPROVED, VOTE_POLLING, VOTE_REJECTED, VOTE_TRANSITIONS
+from handlers import callback
+from handlers.vote_handler import handle_poll
+from utils.vote_tally import VoteTally
+
+VOTE_ID, POLL_MESSAGE_ID = 1, 50
+
+
+class FakeVoteDB:
+    def __init__(self):
+        self.vote = SimpleNamespace(
+            vote_id=VOTE_ID, status=VOTE_POLLING, user_id=None, contribute="投稿", analyse="分析"
+        )
+
+    async def get_user(self, user_id):
+        return SimpleNamespace(is_admin=True, is_blocked=False)
+
+    async def get_vote(self, vote_id):
+        return self.vote
+
+    async def transition_vote(self, vote_id, status):
+        if self.vote.status not in VOTE_TRANSITIONS[status]:
+            return False
+        self.vote.status = status
+        return True
+
+    async def update_vote_tallies(self, rows):
+        return True
+
+
+class FakeHandler:
+    def __init__(self, update, context):
+        self.user_id = update.effective_user.id
+        self.log_handler = SimpleNamespace(log_vote=lambda data: None)
+        self.sent = []
+        FakeHandler.instance = self
+
+    async def send_message(self, text, **kwargs):
+        self.sent.append(text)
+
+    async def send_notification(self, text, **kwargs):
+        self.sent.append(text)
+
+
+@pytest.fixture
+def admin_context(monkeypatch):
+    monkeypatch.setattr(callback, 'TelegramMessageHandler', FakeHandler)
+    db = FakeVoteDB()
+    tally = VoteTally()
+    tally.register(VOTE_ID, 'poll-1', POLL_MESSAGE_ID, GROUP_ID)
+    queued = []
+
+    class Bot:
+        async def stop_poll(self, chat_id, message_id):
+            # 关闭投票会产生 is_closed 的 poll 更新，这里立即投递，模拟最先到达的情况
+            poll = SimpleNamespace(
+                id='poll-1', is_closed=True,
+                options=[SimpleNamespace(voter_count=0), SimpleNamespace(voter_count=0)]
+            )
+            await handle_poll(SimpleNamespace(poll=poll), context)
+            return poll
+
+        async def send_message(self, **kwargs):
+            return None
+
+    async def enqueue(vote_id, content):
+        queued.append(vote_id)
+        return True
+
+    context = SimpleNamespace(
+        bot=Bot(),
+        user_data={},
+        bot_data={'db': db, 'vote_tally': tally, 'publish_queue': SimpleNamespace(enqueue=enqueue)}
+    )
+    return context, db, queued
+
+
+def click(context, data):
+    async def answer(*args, **kwargs):
+        return None
+
+    query = SimpleNamespace(
+        data=data, answer=answer,
+        from_user=SimpleNamespace(id=1), message=SimpleNamespace(message_id=POLL_MESSAGE_ID)
+    )
+    update = SimpleNamespace(callback_query=query, effective_user=query.from_user)
+    asyncio.run(callback.handle_callback(update, context))
+    return FakeHandler.instance.sent
+
+
+def test_admin_approve_is_not_overridden_by_poll_settlement(admin_context):
+    context, db, queued = admin_context
+    assert click(context, f'admin_approve:{VOTE_ID}') == ["✅ 管理员已通过"]
+    # 零票关闭的投票会被自动拒绝，但管理员的决定先生效且计票已丢弃
+    assert db.vote.status == VOTE_APPROVED
+    assert queued == [VOTE_ID]
+    assert len(context.bot_data['vote_tally']) == 0
+
+
+def test_admin_reject_then_repeat_click_sends_no_second_notice(admin_context):
+    context, db, _ = admin_context
+    assert click(context, f'admin_reject:{VOTE_ID}') == ["❌ 管理员已拒绝"]
+    assert db.vote.status == VOTE_REJECTED
+    assert click(context, f'admin_reject:{VOTE_ID}') == ["该投稿已处理"]
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from contextlib import aclosing
+from types import SimpleNamespace
+
+from services.base_service import stream_response
+from utils.admission import ADMITTED, AdmissionController
+
+
+class BlockingStream:
+    """模拟同步客户端的流：每块之间阻塞读取"""
+
+    def __iter__(self):
+        for _ in range(6):
+            time.sleep(0.2)
+            yield SimpleNamespace(model="m", usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content="x" * 30))])
+
+
+class PeakLagAdmission(AdmissionController):
+    """记录监测到的最大事件循环延迟"""
+
+    peak = 0.0
+
+    @property
+    def lag(self) -> float:
+        return self._lag
+
+    @lag.setter
+    def lag(self, value: float) -> None:
+        self._lag = value
+        self.peak = max(self.peak, value)
+
+
+def test_streaming_does_not_block_admission():
+    admission = PeakLagAdmission(max_inflight=4, max_lag=0.2, wait_timeout=0.5)
+
+    async def generate():
+        async with admission.admit(1) as decision:
+            assert decision == ADMITTED
+            async with aclosing(stream_response(BlockingStream())) as chunks:
+                async for _ in chunks:
+                    pass
+
+    async def main():
+        admission.start(interval=0.05)
+        generation = asyncio.create_task(generate())
+        await asyncio.sleep(0.5)
+        # 生成进行中也能立即获准新请求
+        started = time.monotonic()
+        async with admission.admit(1) as decision:
+            waited = time.monotonic() - started
+        await generation
+        await asyncio.sleep(0.1)
+        await admission.stop()
+        return decision, waited
+
+    decision, waited = asyncio.run(main())
+    assert decision == ADMITTED
+    assert waited < 0.1
+    # 同步流的阻塞读取不在事件循环上，延迟不会触发卸载
+    assert admission.peak < 0.2
@@ -0,0 +1,76 @@
+import asyncio
+
+from utils import conversation_memory
+from utils.conversation_memory import ConversationMemory
+
+
+class FakeMessageDB:
+    def __init__(self, rows):
+        self.rows = {row['message_id']: row for row in rows}
+        self.chain_calls = []
+
+    async def get_recent_turns(self, chat_id, limit):
+        return [self.rows[key] for key in sorted(self.rows)][-limit:]
+
+    async def get_reply_chain(self, chat_id, message_id, limit):
+        self.chain_calls.append(message_id)
+        chain = []
+        while message_id in self.rows and len(chain) < limit:
+            chain.append(self.rows[message_id])
+            message_id = self.rows[message_id].get('reply_to')
+        return chain[::-1]
+
+
+def row(message_id, text, type='user_message', reply_to=None):
+    return {'message_id': message_id, 'text': text, 'type': type, 'reply_to': reply_to}
+
+
+def make_memory(monkeypatch, budget=1000):
+    monkeypatch.setattr(ConversationMemory, 'token_budget', staticmethod(lambda model=None: budget))
+    monkeypatch.setattr(conversation_memory, 'MEMORY_MAX_TURNS', 2)
+    return ConversationMemory()
+
+
+def test_reply_chain_added_when_reply_target_left_the_buffer(monkeypatch):
+    db = FakeMessageDB([
+        row(1, "old question"),
+        row(2, "old answer", 'bot_message', reply_to=1),
+        row(10, "recent question"),
+        row(11, "recent answer", 'bot_message', reply_to=10),
+    ])
+    memory = make_memory(monkeypatch)
+
+    async def main():
+        context = await memory.build_context(db, 1, "follow up", reply_to_message_id=2)
+        assert db.chain_calls == [2]
+        assert "[回复的上文]\n用户: old question" in context
+        assert "old answer" not in context  # 已作为 [引用] 出现在当前消息中
+        assert "[历史对话]\n用户: recent question\nPickPin: recent answer" in context
+
+        await memory.build_context(db, 1, "again", reply_to_message_id=11)
+        assert db.chain_calls == [2]  # 回复缓冲区内的消息不查库
+
+    asyncio.run(main())
+
+
+def test_compaction_task_is_kept_until_done(monkeypatch):
+    memory = make_memory(monkeypatch, budget=5)
+    db = FakeMessageDB([row(1, "a" * 40), row(2, "b" * 40)])
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def fake_summary(text, prompt):
+            await gate.wait()
+            return "summary"
+
+        monkeypatch.setattr(conversation_memory, 'get_ai_text', fake_summary)
+        await memory.build_context(db, 1, "hi")
+        assert len(memory._compactions) == 1
+        gate.set()
+        await asyncio.gather(*memory._compactions)
+        await asyncio.sleep(0)
+        assert not memory._compactions
+        assert memory._chats[1].summary == "summary"
+
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+from services import document_service
+from services.document_service import DocumentError, DocumentReader
+
+
+class FakeDocumentDB:
+    def __init__(self):
+        self.media = {}
+
+    async def get_media_text(self, file_unique_id):
+        return self.media.get(file_unique_id)
+
+    async def save_media_text(self, file_unique_id, kind, content):
+        self.media[file_unique_id] = content
+        return True
+
+    async def get_document_chunks(self, file_unique_id):
+        return {}
+
+
+def make_message(file_unique_id="doc-1"):
+    document = SimpleNamespace(
+        file_id="file-1", file_unique_id=file_unique_id, file_name="notes.txt",
+        mime_type="text/plain", file_size=100
+    )
+    return SimpleNamespace(document=document)
+
+
+def make_reader(tmp_path, text, monkeypatch):
+    monkeypatch.setattr(document_service, "PROGRESS_POLL_INTERVAL", 0.01)
+    reader = DocumentReader(cache_dir=str(tmp_path))
+    calls = []
+
+    async def extract(bot, kind, document, text_path):
+        calls.append(document.file_unique_id)
+        await asyncio.sleep(0.05)
+        with open(text_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return 1
+
+    reader._extract = extract
+    return reader, calls
+
+
+def test_concurrent_reads_share_one_extraction(tmp_path, monkeypatch):
+    reader, calls = make_reader(tmp_path, "hello world\n", monkeypatch)
+    db = FakeDocumentDB()
+
+    async def main():
+        return await asyncio.gather(*(reader.get_text(None, db, make_message()) for _ in range(3)))
+
+    assert asyncio.run(main()) == ["hello world\n"] * 3
+    assert calls == ["doc-1"]
+    assert db.media["doc-1"] == "hello world\n"
+    assert not os.listdir(tmp_path)
+    assert not reader._pending and not reader._progress
+
+
+def test_read_reports_progress_and_errors_to_every_waiter(tmp_path, monkeypatch):
+    reader, calls = make_reader(tmp_path, "", monkeypatch)
+    db = FakeDocumentDB()
+
+    async def consume():
+        progress = []
+        try:
+            async for text, content in reader.read(None, db, make_message()):
+                if content is None:
+                    progress.append(text)
+        except DocumentError as e:
+            return progress, str(e)
+
+    async def main():
+        return await asyncio.gather(consume(), consume())
+
+    for progress, error in asyncio.run(main()):
+        assert progress == ["正在下载并提取文档文字..."]
+        assert error == "文档中没有可识别的文字"
+    assert calls == ["doc-1"]
@@ -0,0 +1,40 @@
+from telegram import Bot, Update
+
+from utils.envelope import BOT_USERNAME, envelope
+
+BOT = Bot('123:test')
+CHAT = {'id': -1001, 'type': 'supergroup', 'title': 'group'}
+USER = {'id': 42, 'is_bot': False, 'first_name': 'user'}
+
+
+def make_update(update_id, **message):
+    data = {'message_id': 20, 'date': 1700000000, 'chat': CHAT, 'from': USER, **message}
+    return Update.de_json({'update_id': update_id, 'message': data}, BOT)
+
+
+def test_envelope_parses_mentions_and_reply():
+    text = f"@{BOT_USERNAME} 你好"
+    update = make_update(
+        1, text=text,
+        entities=[{'type': 'mention', 'offset': 0, 'length': len(BOT_USERNAME) + 1}],
+        reply_to_message={'message_id': 19, 'date': 1699999990, 'chat': CHAT, 'from': USER, 'text': "上一条"}
+    )
+    env = envelope(update)
+    assert env is envelope(update)
+    assert env.mentions_bot and not env.replies_to_bot
+    assert env.text == "[引用]\n上一条\n\n[当前消息]\n你好"
+    assert env.origin == (-1001, 20)
+    assert env.serialized() is env.serialized()
+
+
+def test_forward_origin_from_channel():
+    update = make_update(2, text="转发", forward_origin={
+        'type': 'channel', 'date': 1699999000, 'message_id': 77,
+        'chat': {'id': -1002, 'type': 'channel', 'title': 'channel'}
+    })
+    assert envelope(update).origin == (-1002, 77)
+
+    update = make_update(3, text="转发", forward_origin={
+        'type': 'user', 'date': 1699999000, 'sender_user': USER
+    })
+    assert envelope(update).origin == (-1001, 20)
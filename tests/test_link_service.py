@@ -0,0 +1,172 @@
+import asyncio
+import time
+
+import httpx
+
+from services import link_service
+from services.link_service import LinkFetcher
+
+
+class FakeLinkDB:
+    """link_cache 表的内存替身"""
+
+    def __init__(self):
+        self.links = {}
+        self.touched = []
+
+    async def get_link(self, url):
+        link = self.links.get(url)
+        return dict(link) if link else None
+
+    async def save_link(self, link):
+        self.links[link['url']] = dict(link)
+
+    async def touch_link(self, url, fetched_at):
+        self.touched.append(url)
+        self.links[url]['fetched_at'] = fetched_at
+
+
+def make_fetcher(handler, db=None, **kwargs):
+    kwargs.setdefault('allow_private', True)
+    fetcher = LinkFetcher(db or FakeLinkDB(), **kwargs)
+    fetcher.client = httpx.AsyncClient(transport=httpx.MockTransport(handler), follow_redirects=False)
+    return fetcher
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+ARTICLE = (
+    "<html><head><title>标题</title></head><body><nav>导航</nav>"
+    "<article><p>" + "正文内容。" * 60 + "</p></article></body></html>"
+)
+
+
+def test_extracts_article_from_html():
+    def handler(request):
+        return httpx.Response(200, html=ARTICLE)
+
+    link = run(make_fetcher(handler).fetch("http://example.test/a"))
+    assert link['title'] == "标题"
+    assert link['text'].startswith("正文内容。")
+    assert "导航" not in link['text']
+
+
+def test_timeout_returns_none_without_cache():
+    def handler(request):
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    assert run(make_fetcher(handler).fetch("http://example.test/slow")) is None
+
+
+def test_timeout_falls_back_to_stale_cache():
+    db = FakeLinkDB()
+    db.links["http://example.test/a"] = {
+        'url': "http://example.test/a", 'final_url': "http://example.test/a", 'title': "旧", 'text': "旧内容",
+        'etag': None, 'last_modified': None, 'fetched_at': 0
+    }
+
+    def handler(request):
+        raise httpx.ConnectTimeout("timed out", request=request)
+
+    link = run(make_fetcher(handler, db).fetch("http://example.test/a"))
+    assert link['text'] == "旧内容"
+
+
+def test_oversized_body_is_truncated():
+    def handler(request):
+        return httpx.Response(200, headers={'content-type': 'text/plain'}, content=b"x" * 10000)
+
+    link = run(make_fetcher(handler, max_bytes=1000).fetch("http://example.test/big"))
+    assert len(link['text']) == 1000
+
+
+def test_non_html_response_is_skipped():
+    def handler(request):
+        return httpx.Response(200, headers={'content-type': 'image/png'}, content=b"\x89PNG")
+
+    assert run(make_fetcher(handler).fetch("http://example.test/image.png")) is None
+
+
+def test_plain_text_is_kept_as_is():
+    def handler(request):
+        return httpx.Response(200, headers={'content-type': 'text/plain; charset=utf-8'}, content="纯文本".encode())
+
+    link = run(make_fetcher(handler).fetch("http://example.test/a.txt"))
+    assert link['text'] == "纯文本"
+    assert link['title'] == ""
+
+
+def test_fresh_cache_skips_request():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, html=ARTICLE)
+
+    fetcher = make_fetcher(handler)
+
+    async def scenario():
+        await fetcher.fetch("http://example.test/a")
+        return await fetcher.fetch("http://example.test/a")
+
+    assert run(scenario())['title'] == "标题"
+    assert len(requests) == 1
+
+
+def test_expired_cache_revalidates_with_etag():
+    db = FakeLinkDB()
+    db.links["http://example.test/a"] = {
+        'url': "http://example.test/a", 'final_url': "http://example.test/a", 'title': "旧", 'text': "旧内容",
+        'etag': '"v1"', 'last_modified': None, 'fetched_at': time.time() - 10 ** 6
+    }
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get('if-none-match'))
+        return httpx.Response(304)
+
+    link = run(make_fetcher(handler, db).fetch("http://example.test/a"))
+    assert seen == ['"v1"']
+    assert link['text'] == "旧内容"
+    assert db.touched == ["http://example.test/a"]
+
+
+def test_concurrent_fetches_share_one_request():
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, html=ARTICLE)
+
+    fetcher = make_fetcher(handler)
+
+    async def scenario():
+        return await asyncio.gather(*(fetcher.fetch("http://example.test/a") for _ in range(5)))
+
+    assert all(link['title'] == "标题" for link in run(scenario()))
+    assert len(requests) == 1
+
+
+def test_redirect_to_private_address_is_rejected(monkeypatch):
+    async def fake_resolve(host):
+        return host == "public.test"
+
+    monkeypatch.setattr(link_service, '_resolves_public', fake_resolve)
+    requests = []
+
+    def handler(request):
+        requests.append(str(request.url))
+        return httpx.Response(302, headers={'location': "http://internal.test/secret"})
+
+    assert run(make_fetcher(handler, allow_private=False).fetch("http://public.test/a")) is None
+    assert requests == ["http://public.test/a"]
+
+
+def test_literal_and_local_hosts_are_not_public():
+    async def scenario():
+        return [await link_service._resolves_public(host) for host in ("127.0.0.1", "169.254.169.254", "localhost", "10.0.0.1")]
+
+    assert run(scenario()) == [False, False, False, False]
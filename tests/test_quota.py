@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+from utils import quota as quota_module
+from utils.quota import QuotaManager
+
+
+class FakeUserDB:
+    def __init__(self):
+        self.admins = set()
+
+    async def get_user(self, user_id):
+        return SimpleNamespace(is_admin=user_id in self.admins, usage_today=lambda day: 0)
+
+
+def test_whitelist_all_sentinel(monkeypatch):
+    monkeypatch.setitem(quota_module.USER_LISTS, 'whitelist', ['all'])
+    monkeypatch.setitem(quota_module.USER_LISTS, 'admin_list', ['1'])
+    assert QuotaManager.role_for(42) == 'whitelist'
+    assert QuotaManager.role_for(1) == 'admin'
+
+    monkeypatch.setitem(quota_module.USER_LISTS, 'whitelist', ['7'])
+    assert QuotaManager.role_for(7) == 'whitelist'
+    assert QuotaManager.role_for(42) == 'default'
+
+
+def test_role_refreshed_after_ttl(monkeypatch):
+    monkeypatch.setitem(quota_module.USER_LISTS, 'whitelist', [])
+    db = FakeUserDB()
+    manager = QuotaManager(role_ttl=60)
+
+    async def main():
+        await manager.acquire(db, 5)
+        assert manager._users[5].role == 'default'
+
+        db.admins.add(5)
+        await manager.acquire(db, 5)
+        assert manager._users[5].role == 'default'  # 仍在有效期内
+
+        manager._users[5].role_checked -= 61
+        await manager.acquire(db, 5)
+        quota = manager._users[5]
+        assert quota.role == 'admin' and quota.bucket is None
+        assert quota.daily_used == 3 and quota.pending == 3
+
+    asyncio.run(main())
+
+
+def test_refund_restores_usage_and_tokens(monkeypatch):
+    monkeypatch.setitem(quota_module.USER_LISTS, 'whitelist', [])
+    db = FakeUserDB()
+    manager = QuotaManager(chat_limits={'burst': 1, 'burst_window': 3600})
+
+    async def main():
+        assert await manager.acquire(db, 5, chat_id=-100) == (True, 'ok')
+        # 群组共享的突发额度已用完
+        assert (await manager.acquire(db, 6, chat_id=-100))[0] is False
+
+        manager.refund(5, chat_id=-100)
+        quota = manager._users[5]
+        assert quota.daily_used == 0 and quota.pending == 0
+        assert quota.bucket.tokens == quota.bucket.capacity
+        assert await manager.acquire(db, 6, chat_id=-100) == (True, 'ok')
+
+    asyncio.run(main())
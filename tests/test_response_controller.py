@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+
+from config.response_settings import RESPONSE_SETTINGS
+from utils.envelope import BOT_USERNAME
+from utils.response_controller import is_addressed
+
+GROUP = int(RESPONSE_SETTINGS['group_chat']['allowed_groups'][0])
+
+
+def group_update(text=None, caption=None, media_group_id=None, reply_to=None):
+    message = SimpleNamespace(
+        text=text, caption=caption, media_group_id=media_group_id, is_automatic_forward=False,
+        reply_to_message=SimpleNamespace(from_user=SimpleNamespace(username=reply_to)) if reply_to else None
+    )
+    return SimpleNamespace(effective_message=message, effective_chat=SimpleNamespace(id=GROUP, type='supergroup'))
+
+
+def test_group_message_requires_mention_or_reply():
+    assert not is_addressed(group_update(text="hello"))
+    assert is_addressed(group_update(text=f"hi @{BOT_USERNAME}"))
+    assert is_addressed(group_update(text="hi", reply_to=BOT_USERNAME))
+    assert not is_addressed(group_update(text="hi", reply_to="someone"))
+
+
+def test_album_decided_on_captioned_part():
+    # 无说明文字的部分无法单独判断，先放行汇总
+    assert is_addressed(group_update(media_group_id="g"))
+    # 带说明文字的部分直接判断
+    assert not is_addressed(group_update(caption="look", media_group_id="g"))
+    assert is_addressed(group_update(caption=f"@{BOT_USERNAME} look", media_group_id="g"))
+    # 汇总后的代表部分没有@也没有回复时丢弃
+    assert not is_addressed(group_update(media_group_id="g"), collected=True)
+    assert is_addressed(group_update(media_group_id="g", reply_to=BOT_USERNAME), collected=True)
@@ -0,0 +1,162 @@
+import asyncio
+from contextlib import aclosing
+from types import SimpleNamespace
+
+import pytest
+
+from services import ai_service
+from services.base_service import stream_response
+from utils.lifecycle import CancellationRegistry, StreamRegistry
+from utils.telegram_handler import TelegramMessageHandler
+from handlers.callback import stop_generation
+
+
+class Upstream:
+    """模拟 provider 的上游流，记录是否被关闭"""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.closed = False
+
+    async def __call__(self, message, system_prompt):
+        try:
+            for i in range(1000):
+                self.started.set()
+                await asyncio.sleep(0.01)
+                yield "x" * (i + 1), False, ""
+        finally:
+            self.closed = True
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    upstream = Upstream()
+
+    async def passthrough(message, system_prompt):
+        return message
+
+    monkeypatch.setattr(ai_service, 'get_provider_response', upstream)
+    monkeypatch.setattr(ai_service, 'fit_input', passthrough)
+    return upstream
+
+
+def make_handler(edit_result=True):
+    handler = TelegramMessageHandler.__new__(TelegramMessageHandler)
+    handler.user_id = 42
+    handler.context = SimpleNamespace(bot_data={
+        'streams': StreamRegistry(),
+        'cancellations': CancellationRegistry(),
+    })
+    handler.edits = []
+
+    async def edit_message(message, text, reply_markup=None, parse_mode=None):
+        handler.edits.append((text, reply_markup))
+        return edit_result
+
+    async def send_message(*args, **kwargs):
+        return None
+
+    handler.edit_message = edit_message
+    handler.send_message = send_message
+    return handler
+
+
+def test_stop_button_closes_upstream(upstream):
+    async def scenario():
+        handler = make_handler()
+        status = SimpleNamespace(chat_id=1, message_id=2, text="正在处理消息...")
+        run = asyncio.create_task(handler.stream_process_message(
+            ai_service.get_ai_response("问题", "提示词"), status, parse_mode='HTML'
+        ))
+        await upstream.started.wait()
+
+        answers = []
+
+        async def answer(text=None, show_alert=False):
+            answers.append(text)
+
+        query = SimpleNamespace(message=status, from_user=SimpleNamespace(id=42), answer=answer)
+        context = SimpleNamespace(bot_data=handler.context.bot_data)
+        await stop_generation(query, context, None)
+
+        result = await run
+        return handler, result, answers
+
+    handler, result, answers = asyncio.run(scenario())
+    assert result is None
+    assert answers == ["已停止生成"]
+    # 消费方结束时上游流已关闭，没有遗留的 single-flight 请求和登记
+    assert upstream.closed
+    assert not ai_service._flights
+    assert handler.context.bot_data['cancellations'].owner(1, 2) is None
+    assert len(handler.context.bot_data['streams']) == 0
+    text, markup = handler.edits[-1]
+    assert text.endswith("（已停止生成）") and markup is None
+
+
+def test_failed_edit_closes_upstream(upstream):
+    async def scenario():
+        handler = make_handler(edit_result=False)
+        status = SimpleNamespace(chat_id=1, message_id=3, text="正在处理消息...")
+        return await handler.stream_process_message(ai_service.get_ai_response("问题", "提示词"), status)
+
+    assert asyncio.run(scenario()) is None
+    assert upstream.closed
+    assert not ai_service._flights
+
+
+def test_shared_flight_outlives_only_its_last_subscriber(upstream):
+    async def scenario():
+        first = ai_service.get_ai_response("问题", "提示词")
+        second = ai_service.get_ai_response("问题", "提示词")
+        await first.__anext__()
+        await second.__anext__()
+        await first.aclose()
+        still_open = not upstream.closed
+        await second.aclose()
+        return still_open
+
+    assert asyncio.run(scenario())
+    assert upstream.closed
+
+
+def test_fit_input_failure_reaches_every_subscriber(upstream, monkeypatch):
+    async def failing_fit(message, system_prompt):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(ai_service, 'fit_input', failing_fit)
+
+    async def consume():
+        try:
+            async for _ in ai_service.get_ai_response("问题", "提示词"):
+                pass
+        except RuntimeError as e:
+            return str(e)
+
+    async def scenario():
+        return await asyncio.wait_for(asyncio.gather(consume(), consume()), timeout=2)
+
+    assert asyncio.run(scenario()) == ["provider down", "provider down"]
+    assert not ai_service._flights
+    assert not upstream.started.is_set()
+
+
+def test_stream_response_closes_provider_stream():
+    closed = []
+
+    class ProviderStream:
+        def __iter__(self):
+            while True:
+                yield SimpleNamespace(model="m", usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content="x" * 50))])
+
+        def close(self):
+            closed.append(True)
+
+    async def scenario():
+        async with aclosing(stream_response(ProviderStream())) as chunks:
+            async for _ in chunks:
+                break
+
+    asyncio.run(scenario())
+    assert closed == [True]
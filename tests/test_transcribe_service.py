@@ -0,0 +1,121 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import httpx
+from openai import AsyncOpenAI
+from telegram import Document
+
+from services import transcribe_service
+from services.transcribe_service import AudioTranscriber
+
+
+class FakeMediaDB:
+    def __init__(self):
+        self.media = {}
+
+    async def get_media_text(self, file_unique_id):
+        return self.media.get(file_unique_id)
+
+    async def save_media_text(self, file_unique_id, kind, content):
+        self.media[file_unique_id] = content
+        return True
+
+
+class FakeBot:
+    def __init__(self):
+        self.downloads = 0
+
+    async def get_file(self, file_id):
+        async def download_to_drive(path):
+            self.downloads += 1
+            with open(path, 'wb') as f:
+                f.write(b'audio')
+        return SimpleNamespace(file_path='music.mp3', download_to_drive=download_to_drive)
+
+
+class FakeTranscriptionAPI:
+    """本地转写接口：按上传内容中的分段编号返回文字，记录最大并发数"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        assert request.url.path.endswith('/audio/transcriptions')
+        self.requests += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        body = request.content
+        index = body[body.index(b'segment-') + len(b'segment-'):][:1].decode()
+        return httpx.Response(200, json={'text': f' part {index} '})
+
+
+def make_transcriber(api, monkeypatch, chunks=3, concurrency=3):
+    transcriber = AudioTranscriber(api_key='test', concurrency=concurrency)
+    transcriber.client = AsyncOpenAI(
+        api_key='test', base_url='http://transcribe.test/v1', max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(api))
+    )
+    transcriber.can_split = True
+    splits = []
+
+    async def fake_split(path, output_dir, chunk_seconds, timeout):
+        splits.append(path)
+        paths = []
+        for index in range(chunks):
+            chunk = os.path.join(output_dir, f'chunk_{index:03d}.mp3')
+            with open(chunk, 'wb') as f:
+                f.write(f'segment-{index}'.encode())
+            paths.append(chunk)
+        return paths
+
+    monkeypatch.setattr(transcribe_service, 'split_audio', fake_split)
+    return transcriber, splits
+
+
+def audio_document_message():
+    document = Document(file_id='f1', file_unique_id='u1', mime_type='audio/mpeg', file_name='music.mp3', file_size=5)
+    return SimpleNamespace(voice=None, audio=None, document=document)
+
+
+def test_audio_document_is_split_and_chunks_transcribed_concurrently(monkeypatch):
+    api = FakeTranscriptionAPI()
+    transcriber, splits = make_transcriber(api, monkeypatch)
+    db, bot = FakeMediaDB(), FakeBot()
+
+    async def main():
+        # 同一音频的并发请求共用一次下载和转写
+        return await asyncio.gather(*(transcriber.transcribe(bot, db, audio_document_message()) for _ in range(2)))
+
+    assert asyncio.run(main()) == ["part 0\npart 1\npart 2"] * 2
+    # 音频文档没有时长信息，总是切分
+    assert len(splits) == 1
+    assert bot.downloads == 1
+    assert api.requests == 3 and api.max_active == 3
+    assert db.media['u1'] == "part 0\npart 1\npart 2"
+
+
+def test_cached_transcript_skips_download_and_api(monkeypatch):
+    api = FakeTranscriptionAPI()
+    transcriber, _ = make_transcriber(api, monkeypatch)
+    db, bot = FakeMediaDB(), FakeBot()
+    db.media['u1'] = "已缓存"
+
+    assert asyncio.run(transcriber.transcribe(bot, db, audio_document_message())) == "已缓存"
+    assert bot.downloads == 0 and api.requests == 0
+
+
+def test_chunk_concurrency_is_bounded(monkeypatch):
+    api = FakeTranscriptionAPI()
+    transcriber, _ = make_transcriber(api, monkeypatch, chunks=5, concurrency=2)
+
+    result = asyncio.run(transcriber.transcribe(FakeBot(), FakeMediaDB(), audio_document_message()))
+    assert result.splitlines() == [f"part {index}" for index in range(5)]
+    assert api.max_active == 2